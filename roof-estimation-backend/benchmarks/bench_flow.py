@@ -0,0 +1,387 @@
+"""
+Benchmark de bout en bout du parcours d'estimation.
+
+Lance un faux serveur Google (Geocoding et Solar, latence simulée
+réglable) et l'application sur une base SQLite temporaire, puis déroule
+des parcours complets : /api/conversation/start, une réponse par question
+(/api/conversation/answer), puis /api/leads avec l'estimation finale. Les
+parcours sont joués pour chaque niveau de concurrence demandé (nombre de
+clients simultanés) ; le rapport donne p50/p95/p99 par étape et le débit.
+
+Avec ``--url``, le parcours vise un serveur déjà lancé (par exemple avec
+plusieurs workers) au lieu du serveur intégré ; celui-ci doit alors pointer
+GOOGLE_GEOCODING_URL et GOOGLE_SOLAR_URL vers le faux serveur
+(``--stub-port`` pour fixer son port).
+
+Des micro-benchmarks mesurent aussi calculate_roof_estimation,
+calculate_refined_estimation et la sérialisation to_dict.
+
+Les résultats peuvent être enregistrés comme référence
+(``--save NOM`` : benchmarks/baselines/NOM.json, avec le commit courant)
+puis comparés lors d'un passage ultérieur (``--compare NOM``) : le code de
+sortie vaut 1 si une latence ou un débit se dégrade de plus de
+``--tolerance`` (20 % par défaut).
+
+Usage : python benchmarks/bench_flow.py [--flows 200] [--concurrency 1,4,16]
+        [--upstream-latency 50] [--url URL] [--save NOM] [--compare NOM]
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+PERCENTILES = (50, 95, 99)
+FRANCE_BBOX = (42.3, -4.8, 51.1, 8.2)  # sud, ouest, nord, est
+
+
+def _fraction(text, salt):
+    return int(hashlib.sha1(f'{salt}:{text}'.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+class StubGoogleHandler(BaseHTTPRequestHandler):
+    """Réponses déterministes au format Geocoding et buildingInsights"""
+
+    latency = 0.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with self._lock:
+            type(self).calls += 1
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path.startswith('/geocode'):
+            payload = self.geocode(params.get('address', ''))
+        elif url.path.startswith('/solar'):
+            payload = self.solar(params.get('location.latitude', '0'), params.get('location.longitude', '0'))
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def geocode(address):
+        south, west, north, east = FRANCE_BBOX
+        lat = south + (north - south) * _fraction(address, 'lat')
+        lng = west + (east - west) * _fraction(address, 'lng')
+        return {'status': 'OK', 'results': [{'formatted_address': address, 'geometry': {'location': {'lat': lat, 'lng': lng}}}]}
+
+    @staticmethod
+    def solar(lat, lng):
+        key = f'{lat},{lng}'
+        area = round(60 + 190 * _fraction(key, 'area'), 1)
+        segments = [
+            {'pitchDegrees': 30 + 10 * _fraction(key, index), 'azimuthDegrees': 90 * index,
+             'stats': {'areaMeters2': area / 2}}
+            for index in range(2)
+        ]
+        return {
+            'name': f'buildings/{hashlib.sha1(key.encode()).hexdigest()[:12]}',
+            'center': {'latitude': float(lat), 'longitude': float(lng)},
+            'solarPotential': {'wholeRoofStats': {'areaMeters2': area}, 'roofSegmentStats': segments},
+        }
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port, latency):
+    StubGoogleHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubGoogleHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_environment(stub_url):
+    """Variables lues à l'import de l'application : à fixer avant d'importer src.main"""
+    os.environ.setdefault('GOOGLE_API_KEY', 'bench')
+    os.environ['GOOGLE_GEOCODING_URL'] = f'{stub_url}/geocode/json'
+    os.environ['GOOGLE_SOLAR_URL'] = f'{stub_url}/solar/findClosest'
+    if 'DATABASE_URL' not in os.environ:
+        path = os.path.join(tempfile.mkdtemp(prefix='bench-flow-'), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+
+
+def start_app():
+    """Application sur la base de DATABASE_URL, servie par werkzeug (un thread par requête)"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from src.main import app
+    from src.models.database import migrate
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    with app.app_context():
+        migrate()
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def percentile(values, rank):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(rank / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        **{f'p{rank}_ms': round(percentile(values, rank) * 1000, 3) for rank in PERCENTILES},
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+def _answer(question):
+    options = [option['value'] for option in question.get('options', [])]
+    if question.get('type') == 'multiple_choice':
+        return options[:2]
+    return options[0] if options else 'oui'
+
+
+class FlowRunner:
+    """Parcours complets joués par des clients HTTP concurrents"""
+
+    def __init__(self, base_url, addresses):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.addresses = addresses
+        self.local = threading.local()
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        return session
+
+    def _post(self, timings, step, path, payload):
+        started = time.perf_counter()
+        response = self._session().post(self.base_url + path, json=payload)
+        timings.append((step, time.perf_counter() - started))
+        if response.status_code >= 300:
+            raise RuntimeError(f'{path}: HTTP {response.status_code} {response.text[:200]}')
+        return response.json()
+
+    def flow(self, index):
+        """Un parcours ; retourne [(étape, secondes)], l'étape 'flow' couvrant le tout"""
+        timings = []
+        started = time.perf_counter()
+        address = self.addresses[index % len(self.addresses)]
+        data = self._post(timings, 'start', '/api/conversation/start', {'address': address})
+        session_id, question = data['session_id'], data['question']
+        while True:
+            data = self._post(timings, 'answer', '/api/conversation/answer',
+                              {'session_id': session_id, 'answer': _answer(question)})
+            if data.get('completed'):
+                break
+            question = data['question']
+        estimation = data['final_estimation']
+        self._post(timings, 'lead', '/api/leads', {
+            'address': address,
+            'roof_area_sqm': estimation['roof_area_sqm'],
+            'estimated_cost_min': estimation['estimated_cost_min'],
+            'estimated_cost_max': estimation['estimated_cost_max'],
+            'client_email': f'bench{index}@example.com',
+        })
+        timings.append(('flow', time.perf_counter() - started))
+        return timings
+
+    def run(self, flows, concurrency):
+        steps = {}
+        errors = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(self.flow, index) for index in range(flows)]
+            for future in futures:
+                try:
+                    timings = future.result()
+                except Exception as e:
+                    errors += 1
+                    if errors == 1:
+                        print(f'  erreur: {e}', file=sys.stderr)
+                    continue
+                for step, seconds in timings:
+                    steps.setdefault(step, []).append(seconds)
+        duration = time.perf_counter() - started
+        completed = flows - errors
+        requests_count = sum(len(values) for step, values in steps.items() if step != 'flow')
+        return {
+            'flows': flows,
+            'errors': errors,
+            'duration_s': round(duration, 3),
+            'flows_per_s': round(completed / duration, 2),
+            'requests_per_s': round(requests_count / duration, 2),
+            'steps': {step: summarize(values) for step, values in sorted(steps.items())},
+        }
+
+
+def micro_benchmarks():
+    """µs par appel des calculs et sérialisations du parcours"""
+    from src.main import app
+    from src.models.lead import Lead
+    from src.routes.conversation import CONVERSATION_QUESTIONS, calculate_refined_estimation, new_session
+    from src.routes.estimation import calculate_roof_estimation
+    from src.services.session_store import SessionState
+
+    with app.app_context():
+        session = SessionState.from_model(new_session('12 rue de la Paix, 75002 Paris', 48.87, 2.33))
+        session.set_conversation_data({
+            question_id: _answer(question) for question_id, question in CONVERSATION_QUESTIONS.items()
+        })
+        lead = Lead(address='12 rue de la Paix, 75002 Paris', latitude=48.87, longitude=2.33, roof_area_sqm=120.0,
+                    estimated_cost_min=9000.0, estimated_cost_max=14000.0, client_email='bench@example.com',
+                    timestamp=datetime.utcnow())
+        cases = {
+            'calculate_roof_estimation': lambda: calculate_roof_estimation('12 rue de la Paix, 75002 Paris', 120.0),
+            'calculate_refined_estimation': lambda: calculate_refined_estimation(session),
+            'session_state.to_dict': session.to_dict,
+            'lead.to_dict': lead.to_dict,
+        }
+        results = {}
+        for name, func in cases.items():
+            timer = timeit.Timer(func)
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=5, number=number))
+            results[name] = round(best / number * 1e6, 3)
+        return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def compare(baseline, results, tolerance):
+    """Affiche les écarts avec une référence ; retourne le nombre de régressions"""
+    regressions = 0
+
+    def check(label, old, new, higher_is_better=False):
+        nonlocal regressions
+        if old is None or new is None or old == 0:
+            return
+        ratio = new / old
+        worse = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+        regressions += worse
+        print(f'  {label:<48} {old:>10} -> {new:<10} {ratio - 1:+7.1%}{"  RÉGRESSION" if worse else ""}')
+
+    print(f'\nComparaison avec la référence (commit {baseline.get("commit")}, tolérance {tolerance:.0%})')
+    for name, value in results['micro'].items():
+        check(f'micro {name} (µs)', baseline.get('micro', {}).get(name), value)
+    for level, run in results['flow'].items():
+        old_run = baseline.get('flow', {}).get(level)
+        if old_run is None:
+            continue
+        check(f'c={level} flows/s', old_run['flows_per_s'], run['flows_per_s'], higher_is_better=True)
+        for step, stats in run['steps'].items():
+            for rank in PERCENTILES:
+                key = f'p{rank}_ms'
+                check(f'c={level} {step} {key}', old_run['steps'].get(step, {}).get(key), stats[key])
+    return regressions
+
+
+def print_run(level, run):
+    print(f'\nconcurrence {level} : {run["flows"]} parcours en {run["duration_s"]} s, '
+          f'{run["flows_per_s"]} parcours/s, {run["requests_per_s"]} requêtes/s, {run["errors"]} erreurs')
+    print(f'  {"étape":<8} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"moy ms":>9}')
+    for step, stats in run['steps'].items():
+        print(f'  {step:<8} {stats["count"]:>6} {stats["p50_ms"]:>9} {stats["p95_ms"]:>9} '
+              f'{stats["p99_ms"]:>9} {stats["mean_ms"]:>9}')
+
+
+def run(args):
+    stub = start_stub(args.stub_port, args.upstream_latency / 1000)
+    stub_url = f'http://127.0.0.1:{stub.server_port}'
+    configure_environment(stub_url)
+    base_url = args.url
+    if base_url is None:
+        base_url, _ = start_app()
+    print(f'application {base_url}, faux Google {stub_url} (latence {args.upstream_latency} ms), '
+          f'base {os.environ.get("DATABASE_URL")}')
+
+    addresses = [f'{index} rue du Banc d\'Essai, 750{index % 20 + 1:02d} Paris' for index in range(args.addresses)]
+    runner = FlowRunner(base_url, addresses)
+    runner.run(args.warmup, 1)
+
+    results = {
+        'commit': current_commit(),
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': {'flows': args.flows, 'addresses': args.addresses, 'upstream_latency_ms': args.upstream_latency,
+                   'url': args.url},
+        'micro': micro_benchmarks(),
+        'flow': {},
+    }
+    print('\nmicro-benchmarks (µs par appel)')
+    for name, value in results['micro'].items():
+        print(f'  {name:<32} {value:>10}')
+
+    for level in args.concurrency:
+        results['flow'][str(level)] = runner.run(args.flows, level)
+        print_run(level, results['flow'][str(level)])
+    print(f'\nappels au faux Google : {StubGoogleHandler.calls}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save), 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'référence enregistrée : {baseline_path(args.save)}')
+    regressions = 0
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        print(f'{regressions} régression(s)')
+    errors = sum(run['errors'] for run in results['flow'].values())
+    return 1 if regressions or errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--flows', type=int, default=200, help='parcours par niveau de concurrence')
+    parser.add_argument('--concurrency', type=lambda value: [int(item) for item in value.split(',')],
+                        default=[1, 4, 16], help='niveaux de concurrence, séparés par des virgules')
+    parser.add_argument('--addresses', type=int, default=50, help='adresses distinctes (les suivantes touchent les caches)')
+    parser.add_argument('--upstream-latency', type=float, default=50, help='latence simulée de Google, en ms')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--url', help='serveur déjà lancé à viser au lieu du serveur intégré')
+    parser.add_argument('--stub-port', type=int, default=0)
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    parser.add_argument('--save', metavar='NOM', help='enregistre les résultats comme référence NOM')
+    parser.add_argument('--compare', metavar='NOM', help='compare à la référence NOM')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    sys.exit(run(parser.parse_args()))
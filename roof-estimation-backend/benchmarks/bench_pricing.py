@@ -0,0 +1,126 @@
+"""
+Micro-benchmark du moteur de tarification.
+
+Compare le coût par estimation du plan compilé (PricingPlan.evaluate) à
+l'ancienne implémentation en chaînes if/elif, reproduite ci-dessous comme
+référence, et vérifie au passage que les résultats sont identiques.
+
+Usage : python benchmarks/bench_pricing.py [--iterations N]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.pricing import pricing_engine  # noqa: E402
+
+LEGACY_MATERIAL_COSTS = {
+    'tuiles_terre_cuite': {'min': 25, 'max': 90},
+    'tuiles_beton': {'min': 35, 'max': 45},
+    'bac_acier': {'min': 15, 'max': 35},
+    'zinc': {'min': 40, 'max': 90},
+    'ardoise': {'min': 60, 'max': 100},
+    'autre': {'min': 30, 'max': 70}
+}
+LEGACY_CONDITION_FACTORS = {'neuve': 0.8, 'bon_etat': 1.0, 'usee': 1.2, 'endommagee': 1.5}
+LEGACY_ACCESS_FACTORS = {'facile': 1.0, 'moyen': 1.2, 'difficile': 1.5}
+LEGACY_INSULATION_COSTS = {
+    'oui_complete': {'min': 20, 'max': 40},
+    'oui_partielle': {'min': 10, 'max': 25},
+    'non': {'min': 0, 'max': 0},
+    'pas_sur': {'min': 5, 'max': 15}
+}
+
+
+def legacy_refined_estimation(conversation_data, roof_area):
+    """Ancien calculate_refined_estimation (avant le moteur de règles)"""
+    roof_type = conversation_data.get('roof_type', 'tuiles_terre_cuite')
+    material_costs = LEGACY_MATERIAL_COSTS.get(roof_type, LEGACY_MATERIAL_COSTS['tuiles_terre_cuite'])
+    base_cost_min = roof_area * material_costs['min']
+    base_cost_max = roof_area * material_costs['max']
+    condition_factor = LEGACY_CONDITION_FACTORS.get(conversation_data.get('roof_condition', 'bon_etat'), 1.0)
+    access_factor = LEGACY_ACCESS_FACTORS.get(conversation_data.get('roof_access', 'moyen'), 1.2)
+    labor_hours_per_sqm = 0.5 * condition_factor * access_factor
+    labor_cost = roof_area * labor_hours_per_sqm * 50
+    insulation = conversation_data.get('insulation', 'non')
+    insulation_costs = LEGACY_INSULATION_COSTS.get(insulation, LEGACY_INSULATION_COSTS['non'])
+    insulation_cost_min = roof_area * insulation_costs['min']
+    insulation_cost_max = roof_area * insulation_costs['max']
+    elements = conversation_data.get('roof_elements', [])
+    complexity_factor = 1.0
+    if isinstance(elements, list):
+        if 'cheminee' in elements:
+            complexity_factor += 0.1
+        if 'lucarne' in elements:
+            complexity_factor += 0.15
+        if 'fenetre_toit' in elements:
+            complexity_factor += 0.1
+        if 'panneaux_solaires' in elements:
+            complexity_factor += 0.2
+    total_min = (base_cost_min + labor_cost + insulation_cost_min) * complexity_factor
+    total_max = (base_cost_max + labor_cost + insulation_cost_max) * complexity_factor
+    material_pref = conversation_data.get('material_preference', 'identique')
+    if material_pref == 'amelioration':
+        total_min *= 1.2
+        total_max *= 1.4
+    elif material_pref == 'economique':
+        total_min *= 0.8
+        total_max *= 1.0
+    elif material_pref == 'ecologique':
+        total_min *= 1.1
+        total_max *= 1.3
+    return math.ceil(total_min), math.ceil(total_max)
+
+
+def random_answer_sets(count, seed=42):
+    """Jeux de réponses complets tirés au hasard dans l'espace des questions"""
+    rng = random.Random(seed)
+    elements = ['cheminee', 'lucarne', 'fenetre_toit', 'panneaux_solaires', 'antenne']
+    samples = []
+    for _ in range(count):
+        answers = {
+            'roof_type': rng.choice(list(LEGACY_MATERIAL_COSTS)),
+            'roof_condition': rng.choice(list(LEGACY_CONDITION_FACTORS)),
+            'roof_elements': rng.sample(elements, rng.randint(0, 3)),
+            'roof_access': rng.choice(list(LEGACY_ACCESS_FACTORS)),
+            'material_preference': rng.choice(['identique', 'amelioration', 'economique', 'ecologique', 'pas_preference']),
+            'insulation': rng.choice(list(LEGACY_INSULATION_COSTS))
+        }
+        samples.append((answers, rng.uniform(60, 250)))
+    return samples
+
+
+def run(iterations):
+    samples = random_answer_sets(iterations)
+    plan = pricing_engine.current()
+
+    mismatches = sum(plan.evaluate(answers, area) != legacy_refined_estimation(answers, area) for answers, area in samples)
+
+    def legacy():
+        for answers, area in samples:
+            legacy_refined_estimation(answers, area)
+
+    def compiled():
+        for answers, area in samples:
+            plan.evaluate(answers, area)
+
+    def engine():
+        for answers, area in samples:
+            pricing_engine.estimate(answers, area)
+
+    print(f'{iterations} estimations, écarts avec l\'ancien calcul : {mismatches}')
+    for name, func in (('if/elif (ancien)', legacy), ('plan compilé', compiled), ('moteur', engine)):
+        best = min(timeit.repeat(func, number=1, repeat=5))
+        print(f'{name:<28} {best / iterations * 1e6:8.3f} µs/estimation')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=50000)
+    args = parser.parse_args()
+    sys.exit(1 if run(args.iterations) else 0)
@@ -0,0 +1,136 @@
+"""
+Benchmark de la sérialisation des listes.
+
+Remplit une base SQLite temporaire de N leads et N sessions (réponses
+encodées en binaire et, pour une sur cinq, en JSON), puis compare sur les
+mêmes lignes :
+- l'ancien chemin : dictionnaire par ligne (row_to_dict, conversation_data
+  décodé) puis encodeur JSON de Flask ;
+- le plan compilé (src/utils/serializer.py), conversation_data inséré tel
+  quel ;
+- ORM + to_dict() + jsonify, pour référence ;
+et mesure GET /api/leads et GET /api/conversation/sessions complets. Les
+deux sérialisations doivent donner le même JSON une fois décodé.
+
+Usage : python benchmarks/bench_serializer.py [--rows 50000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def populate(rows):
+    from datetime import datetime, timedelta
+    from src.models.conversation import ConversationSession
+    from src.models.lead import Lead
+    from src.models.user import db
+    from src.services.questions import CONVERSATION_QUESTIONS
+    from src.utils.address import normalize_address
+    from src.utils.geo import encode_cell
+
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    leads, sessions = [], []
+    for index in range(rows):
+        address = f'{index} rue de l\'Église, 750{index % 20 + 1:02d} Paris'
+        lat, lng = 48.8 + rng.random() / 10, 2.3 + rng.random() / 10
+        leads.append({
+            'address': address, 'latitude': lat, 'longitude': lng, 'roof_area_sqm': rng.uniform(60, 250),
+            'estimated_cost_min': rng.uniform(5000, 20000), 'estimated_cost_max': rng.uniform(20000, 40000),
+            'client_name': f'Client {index}', 'client_email': f'client{index}@example.com',
+            'client_phone': f'06{index:08d}', 'timestamp': now - timedelta(seconds=index),
+            'address_key': normalize_address(address), 'geo_cell': encode_cell(lat, lng),
+        })
+        answers = {
+            question_id: ([question['options'][0]['value']] if question.get('type') == 'multiple_choice'
+                          else rng.choice(question['options'])['value'])
+            for question_id, question in CONVERSATION_QUESTIONS.items()
+        }
+        if index % 5 == 0:
+            conversation_data, conversation_answers = json.dumps(answers), None  # stockage JSON
+        else:
+            conversation_data, conversation_answers = ConversationSession.encode_conversation_data(answers)
+        sessions.append({
+            'id': f'{index:08d}-0000-0000-0000-000000000000', 'address': address, 'latitude': lat, 'longitude': lng,
+            'roof_area_sqm': rng.uniform(60, 250), 'current_question_id': None,
+            'conversation_data': conversation_data, 'conversation_answers': conversation_answers,
+            'estimated_cost_min': rng.uniform(5000, 20000), 'estimated_cost_max': rng.uniform(20000, 40000),
+            'is_completed': True, 'timestamp': now - timedelta(seconds=index), 'last_updated': now,
+            'address_key': normalize_address(address), 'geo_cell': encode_cell(lat, lng),
+        })
+    with db.engine.begin() as connection:
+        connection.execute(Lead.__table__.insert(), leads)
+        connection.execute(ConversationSession.__table__.insert(), sessions)
+
+
+def best_of(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def run(rows):
+    from flask import current_app
+    from src.main import app
+    from src.models.conversation import ConversationSession
+    from src.models.database import migrate
+    from src.models.lead import Lead
+    from src.models.user import db
+    from src.utils.pagination import KeysetQuery
+
+    with app.app_context():
+        migrate()
+        populate(rows)
+        mismatches = 0
+        print(f'{rows} lignes par modèle')
+        for model in (Lead, ConversationSession):
+            query = KeysetQuery(model)
+            table_rows = db.session.execute(query._statement(None, rows)).all()
+            dumps = current_app.json.dumps
+
+            def legacy():
+                return '[' + ','.join(dumps(query.row_to_dict(row)) for row in table_rows) + ']'
+
+            def compiled():
+                return '[' + ','.join(query.row_to_json(row) for row in table_rows) + ']'
+
+            def orm():
+                db.session.expunge_all()
+                return dumps([instance.to_dict() for instance in db.session.scalars(
+                    db.select(model).order_by(model.timestamp.desc(), model.id.desc()))])
+
+            legacy_time, legacy_text = best_of(legacy)
+            compiled_time, compiled_text = best_of(compiled)
+            orm_time, _ = best_of(orm, repeat=1)
+            mismatches += json.loads(legacy_text) != json.loads(compiled_text)
+            print(f'\n{model.__tablename__}')
+            for name, seconds in (('ORM + to_dict + dumps', orm_time), ('row_to_dict + dumps (ancien)', legacy_time),
+                                  ('plan compilé', compiled_time)):
+                print(f'  {name:<30} {seconds * 1000:9.1f} ms  {seconds / rows * 1e6:7.2f} µs/ligne')
+            print(f'  gain : x{legacy_time / compiled_time:.1f}')
+
+    client = app.test_client()
+    print('\nendpoints complets (tableau JSON en flux)')
+    for path in ('/api/leads', '/api/conversation/sessions'):
+        seconds, response = best_of(lambda: client.get(path).get_data())
+        print(f'  GET {path:<28} {seconds * 1000:9.1f} ms  {len(response) / 1e6:6.1f} Mo')
+    print(f'\nécarts entre les deux sérialisations : {mismatches}')
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-serializer-'), 'bench.db')
+    sys.exit(1 if run(args.rows) else 0)
@@ -0,0 +1,186 @@
+"""
+Comparaison de débit : serveur de développement contre serveur pré-forké.
+
+Lance successivement, sur la même base SQLite temporaire et derrière le
+même faux serveur Google que bench_flow.py :
+
+- le serveur de développement de ``python src/main.py`` (``app.run`` en
+  debug ; sans le reloader, qui ne change pas le service des requêtes) ;
+- le serveur de production ``python -m src.server`` (``--workers`` ×
+  ``--threads``).
+
+Pour chacun : parcours complets (start, réponses, lead) à la concurrence
+donnée, puis lectures GET /api/leads?limit=20 en boucle. Pour le serveur
+pré-forké, la mémoire du maître et des workers est relevée (RSS, PSS et
+pages partagées, /proc/<pid>/smaps_rollup) : les pages préchargées dans le
+maître restent partagées.
+
+Usage : python benchmarks/bench_server.py [--workers 4] [--threads 4]
+        [--flows 200] [--concurrency 16] [--reads 2000]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_flow import FlowRunner, configure_environment, start_stub, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEBUG_SERVER = ('import src.main as main; '
+                'main.app.run(host="127.0.0.1", port={port}, debug=True, use_reloader=False)')
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(url, process, timeout=30):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'serveur arrêté (code {process.returncode})')
+        try:
+            if requests.get(url + '/api/leads?limit=1', timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} ne répond pas')
+
+
+def start_server(command):
+    return subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=40)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def memory(pid):
+    """RSS, PSS et pages partagées (Kio) d'un processus"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Shared_Clean:', 'Shared_Dirty:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return {'rss_kib': values['Rss'], 'pss_kib': values['Pss'],
+            'shared_kib': values['Shared_Clean'] + values['Shared_Dirty']}
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def read_load(url, count, concurrency):
+    """GET /api/leads?limit=20 en boucle ; débit et latences"""
+    import requests
+    sessions = {}
+
+    def fetch(_):
+        session = sessions.setdefault(threading.get_ident(), requests.Session())
+        started = time.perf_counter()
+        response = session.get(url + '/api/leads?limit=20')
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = list(executor.map(fetch, range(count)))
+    duration = time.perf_counter() - started
+    return {'requests_per_s': round(count / duration, 1), **summarize(timings)}
+
+
+def measure(command, url, args, addresses):
+    process = start_server(command)
+    try:
+        wait_ready(url, process)
+        runner = FlowRunner(url, addresses)
+        runner.run(args.warmup, 1)
+        result = {'flow': runner.run(args.flows, args.concurrency),
+                  'reads': read_load(url, args.reads, args.concurrency)}
+        try:
+            result['memory'] = {'master': memory(process.pid),
+                                'workers': [memory(child) for child in children(process.pid)]}
+        except OSError:
+            pass
+        return result
+    finally:
+        stop_server(process)
+
+
+def print_result(name, result):
+    flow, reads = result['flow'], result['reads']
+    steps = flow['steps']
+    print(f'\n{name}')
+    print(f'  parcours : {flow["flows_per_s"]:>8} parcours/s {flow["requests_per_s"]:>8} req/s  '
+          f'p50 {steps["flow"]["p50_ms"]} ms  p99 {steps["flow"]["p99_ms"]} ms  erreurs {flow["errors"]}')
+    print(f'  lectures : {reads["requests_per_s"]:>8} req/s  p50 {reads["p50_ms"]} ms  p99 {reads["p99_ms"]} ms')
+    if 'memory' in result:
+        master, workers = result['memory']['master'], result['memory']['workers']
+        print(f'  mémoire  : maître RSS {master["rss_kib"]} Kio ; workers (RSS / PSS / partagé, Kio) : '
+              + ', '.join(f'{w["rss_kib"]}/{w["pss_kib"]}/{w["shared_kib"]}' for w in workers))
+
+
+def run(args):
+    stub = start_stub(0, args.upstream_latency / 1000)
+    configure_environment(f'http://127.0.0.1:{stub.server_port}')
+    from src.main import app
+    from src.models.database import migrate
+    with app.app_context():
+        migrate()
+    print(f'base {os.environ["DATABASE_URL"]}, {os.cpu_count()} CPU, concurrence {args.concurrency}')
+
+    addresses = [f'{index} rue du Banc d\'Essai, 750{index % 20 + 1:02d} Paris' for index in range(args.addresses)]
+    results = {}
+    port = free_port()
+    results['debug'] = measure([sys.executable, '-c', DEBUG_SERVER.format(port=port)],
+                               f'http://127.0.0.1:{port}', args, addresses)
+    print_result('serveur de développement (app.run, debug)', results['debug'])
+
+    port = free_port()
+    command = [sys.executable, '-m', 'src.server', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--threads', str(args.threads)]
+    results['prefork'] = measure(command, f'http://127.0.0.1:{port}', args, addresses)
+    print_result(f'serveur pré-forké ({args.workers} workers × {args.threads} threads)', results['prefork'])
+
+    print()
+    for label, section, field in (('parcours/s', 'flow', 'flows_per_s'), ('lectures/s', 'reads', 'requests_per_s')):
+        print(f'{label} : x{results["prefork"][section][field] / results["debug"][section][field]:.2f}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    errors = sum(result['flow']['errors'] for result in results.values())
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--flows', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16, help='clients simultanés')
+    parser.add_argument('--reads', type=int, default=2000, help='requêtes GET /api/leads')
+    parser.add_argument('--addresses', type=int, default=50)
+    parser.add_argument('--upstream-latency', type=float, default=50, help='latence simulée de Google, en ms')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    sys.exit(run(parser.parse_args()))
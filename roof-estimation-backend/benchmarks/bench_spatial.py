@@ -0,0 +1,108 @@
+"""
+Benchmark des recherches spatiales sur la table lead.
+
+Remplit une base SQLite temporaire migrée avec N leads répartis
+aléatoirement sur la France métropolitaine, puis compare pour des
+recherches par rayon :
+- la requête servie par l'index geo_cell (src/services/spatial.py) ;
+- un filtre lat/lng BETWEEN sans index, équivalent de ce qu'il fallait
+  faire auparavant (parcours complet de la table).
+Les deux méthodes doivent trouver exactement les mêmes leads.
+
+Usage : python benchmarks/bench_spatial.py [--points 1000000] [--queries 200] [--radius 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FRANCE_BBOX = (42.3, -4.8, 51.1, 8.2)  # sud, ouest, nord, est
+
+
+def populate(connection, table, points, batch_size=50000):
+    from src.utils.geo import encode_cell
+    south, west, north, east = FRANCE_BBOX
+    rng = random.Random(1)
+    for start in range(0, points, batch_size):
+        rows = []
+        for _ in range(min(batch_size, points - start)):
+            lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+            rows.append({
+                'address': 'x', 'latitude': lat, 'longitude': lng, 'geo_cell': encode_cell(lat, lng),
+                'estimated_cost_min': 0.0, 'estimated_cost_max': 0.0, 'address_key': 'x',
+            })
+        connection.execute(table.insert(), rows)
+
+
+def timed(connection, statement):
+    started = time.perf_counter()
+    rows = connection.execute(statement).all()
+    return time.perf_counter() - started, rows
+
+
+def run(points, queries, radius_m):
+    from sqlalchemy import select
+    from src.main import app
+    from src.models.database import migrate
+    from src.models.lead import Lead
+    from src.models.user import db
+    from src.services.spatial import nearby_statement, within_radius
+    from src.utils.geo import bbox_around
+
+    table = Lead.__table__
+    with app.app_context():
+        migrate()
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            populate(connection, table, points)
+        print(f'{points} leads insérés en {time.perf_counter() - started:.1f} s')
+
+        rng = random.Random(2)
+        south, west, north, east = FRANCE_BBOX
+        indexed, scanned, found = [], [], []
+        with db.engine.connect() as connection:
+            for _ in range(queries):
+                lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+                elapsed, rows = timed(connection, nearby_statement(table, lat, lng, radius_m, (table.c.id,)))
+                matches = {row[2] for _, row in within_radius(rows, lat, lng, radius_m)}
+                indexed.append(elapsed)
+
+                s, w, n, e = bbox_around(lat, lng, radius_m)
+                scan = select(table.c.latitude, table.c.longitude, table.c.id).where(
+                    table.c.latitude.between(s, n), table.c.longitude.between(w, e)
+                )
+                elapsed, rows = timed(connection, scan)
+                reference = {row[2] for _, row in within_radius(rows, lat, lng, radius_m)}
+                scanned.append(elapsed)
+                if matches != reference:
+                    raise AssertionError(f'Résultats différents autour de {lat}, {lng}')
+                found.append(len(matches))
+
+            statement = nearby_statement(table, 48.8566, 2.3522, radius_m, (table.c.id,))
+            compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+            plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+
+    print(f'{queries} recherches, rayon {radius_m:.0f} m, {statistics.mean(found):.1f} leads trouvés en moyenne')
+    for label, timings in (('index geo_cell', indexed), ('parcours lat/lng', scanned)):
+        timings.sort()
+        print(f'  {label:<17} médiane {statistics.median(timings) * 1000:8.3f} ms'
+              f'   p95 {timings[int(len(timings) * 0.95) - 1] * 1000:8.3f} ms')
+    print('Plan (index geo_cell) :')
+    for row in plan:
+        print(f'    {row[-1]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=2000, help='rayon en mètres')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "spatial.db")}'
+        run(args.points, args.queries, args.radius)
@@ -0,0 +1,116 @@
+"""
+Temps de démarrage de l'application (démarrage à froid d'un dyno).
+
+Chaque mesure tourne dans un processus Python neuf, sur une base SQLite
+temporaire déjà migrée :
+
+- import : ``import src.main`` ;
+- création : ``create_app()`` ;
+- première requête : GET /api/leads?limit=1 par le client de test (avec
+  LAZY_BLUEPRINTS, elle importe et enregistre les blueprints et vérifie
+  le schéma) ;
+- total : du lancement de l'interpréteur à la fin de la première requête,
+  mesuré par le processus parent.
+
+Les modes comparés : blueprints importés par create_app (``eager``),
+différés à la première requête (``lazy``) et, avec ``--blueprints``, un
+sous-ensemble servi (APP_BLUEPRINTS). ``--importtime`` affiche les modules
+les plus coûteux à l'import (python -X importtime).
+
+Usage : python benchmarks/bench_startup.py [--runs 5] [--blueprints conversation,google_api]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ('import_ms', 'create_ms', 'first_request_ms')
+
+# Script mesuré dans le processus neuf ; écrit les durées en JSON sur la sortie
+CHILD = '''
+import json, time
+started = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+app = src.main.create_app()
+created = time.perf_counter()
+status = app.test_client().get('/api/leads?limit=1').status_code
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_ms': (created - imported) * 1000,
+                  'first_request_ms': (done - created) * 1000, 'status': status}))
+'''
+
+
+def measure(env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=BACKEND_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        total = (time.perf_counter() - started) * 1000
+        sample = json.loads(output.strip().splitlines()[-1])
+        if sample.pop('status') != 200:
+            raise RuntimeError('première requête en erreur')
+        sample['total_ms'] = total
+        samples.append(sample)
+    return {phase: round(statistics.median(sample[phase] for sample in samples), 1)
+            for phase in PHASES + ('total_ms',)}
+
+
+def import_profile(env, top):
+    """Modules les plus coûteux (temps cumulé) à l'import de src.main"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src.main'], cwd=BACKEND_DIR,
+                            env=env, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative), name))
+    # Modules de premier niveau seulement : les sous-modules sont comptés dans leur parent
+    rows = [(cumulative, name) for cumulative, name in rows if '.' not in name or name.startswith('src.')]
+    return sorted(rows, reverse=True)[:top]
+
+
+def run(args):
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-startup-'), 'bench.db')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.main', 'migrate'], cwd=BACKEND_DIR, env=env,
+                   check=True, capture_output=True)
+
+    modes = [('eager', {'LAZY_BLUEPRINTS': 'false'}), ('lazy', {'LAZY_BLUEPRINTS': 'true'})]
+    if args.blueprints:
+        modes.append((f'lazy, {args.blueprints}', {'LAZY_BLUEPRINTS': 'true', 'APP_BLUEPRINTS': args.blueprints}))
+    print(f'médiane de {args.runs} processus neufs (ms)')
+    print(f'{"mode":<36} {"import":>8} {"création":>9} {"1re requête":>12} {"total":>8}')
+    results = {}
+    for name, overrides in modes:
+        results[name] = measure({**env, **overrides}, args.runs)
+        print(f'{name:<36} ' + ' '.join(f'{results[name][phase]:>{width}}' for phase, width in
+                                        zip(PHASES + ('total_ms',), (8, 9, 12, 8))))
+
+    if args.importtime:
+        print('\nimport de src.main, modules les plus coûteux (temps cumulé)')
+        for cumulative, name in import_profile(env, args.importtime):
+            print(f'  {cumulative / 1000:8.1f} ms  {name}')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--blueprints', help='sous-ensemble servi, comme APP_BLUEPRINTS')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='affiche les N modules les plus coûteux')
+    parser.add_argument('--output', help='fichier JSON des résultats')
+    sys.exit(run(parser.parse_args()))
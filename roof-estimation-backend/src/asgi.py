@@ -0,0 +1,290 @@
+"""
+Mode de service ASGI.
+
+Les endpoints liés aux entrées/sorties amont (/api/geocode,
+/api/solar-analysis, /api/conversation/start) sont servis nativement sur la
+boucle d'événements avec un client HTTP asynchrone et une session SQLAlchemy
+asynchrone : une requête en attente de Google n'occupe plus de thread.
+Toutes les autres routes sont déléguées à l'application Flask existante.
+Au démarrage (lifespan ou première requête native), la configuration
+différée de Flask est terminée et les threads de fond démarrés.
+
+Lancement (après flask --app src.main migrate) :
+uvicorn src.asgi:application --host 0.0.0.0 --port 5000
+"""
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src.main import CORS_ORIGINS, app as flask_app, finish_setup
+from src.models.database import is_sqlite, set_sqlite_pragmas
+from src.models.lead import Lead
+from src.models.solar import RoofGeometry
+from src.routes import google_api
+from src.routes.conversation import new_session, start_payload
+from src.services import metrics, solar_store
+from src.services.async_http_client import AsyncUpstreamClient
+from src.services.cache import address_key, location_key
+from src.services.duplicates import known_location
+from src.services.http_client import CircuitOpenError, UpstreamError
+from src.services.jobs import job_queue
+from src.services.maintenance import session_maintenance
+from src.services.pricing import pricing_engine
+import json
+import time
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """Traduit l'URL synchrone de Flask-SQLAlchemy vers son pilote asynchrone"""
+    scheme, rest = url.split('://', 1)
+    backend = scheme.split('+', 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'Pas de pilote asynchrone pour {backend}')
+    return f'{ASYNC_DRIVERS[backend]}://{rest}'
+
+
+async def read_json(receive):
+    """Lit le corps complet de la requête et le décode comme JSON"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return json.loads(body) if body else None
+
+
+class AsyncApplication:
+    """Application ASGI : routes asynchrones natives, repli sur Flask pour le reste"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.fallback = WsgiToAsgi(wsgi_app)
+        self.routes = {
+            ('POST', '/api/geocode'): self.geocode,
+            ('POST', '/api/solar-analysis'): self.solar_analysis,
+            ('POST', '/api/conversation/start'): self.start_conversation,
+        }
+        self.geocoding_client = None
+        self.solar_client = None
+        self.engine = None
+        self.sessionmaker = None
+
+    def startup(self):
+        if self.engine is not None:
+            return
+        # Ce que la première requête Flask ferait sinon (blueprints différés, vérification du
+        # schéma, threads de fond) : les routes natives ne passent pas par l'application Flask
+        finish_setup(self.wsgi_app)
+        job_queue.ensure_started()
+        session_maintenance.ensure_started()
+        pricing_engine.ensure_started()
+        self.geocoding_client = AsyncUpstreamClient(google_api.geocoding_client)
+        self.solar_client = AsyncUpstreamClient(google_api.solar_client)
+        url = self.wsgi_app.config['SQLALCHEMY_DATABASE_URI']
+        self.engine = create_async_engine(async_database_url(url))
+        if is_sqlite(url):
+            event.listen(self.engine.sync_engine, 'connect', set_sqlite_pragmas)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def shutdown(self):
+        if self.engine is None:
+            return
+        await self.geocoding_client.aclose()
+        await self.solar_client.aclose()
+        await self.engine.dispose()
+        self.engine = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        self.startup()
+        # Mêmes métriques que les routes Flask (le chemin sert de nom de route)
+        started = time.perf_counter()
+        state = metrics.start_request(scope['path'])
+        try:
+            data = await read_json(receive)
+        except ValueError as e:
+            status, payload = 500, {'error': str(e)}
+        else:
+            status, payload = await handler(data)
+        response_size = await self.send_json(scope, send, status, payload)
+        request_size = dict(scope.get('headers', [])).get(b'content-length')
+        metrics.finish_request(*state, scope['method'], status, time.perf_counter() - started,
+                               int(request_size) if request_size else None, response_size)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def send_json(self, scope, send, status, payload):
+        body = self.wsgi_app.json.dumps(payload).encode('utf-8') + b'\n'
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ]
+        # Mêmes en-têtes CORS que flask-cors pour les origines autorisées
+        origin = dict(scope.get('headers', [])).get(b'origin', b'').decode('latin-1')
+        if origin in CORS_ORIGINS:
+            headers += [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin'),
+            ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return len(body)
+
+    async def fetch_geocode(self, address):
+        """Pendant asynchrone de google_api.fetch_geocode"""
+        url, params = google_api.geocode_request(address)
+        response = await self.geocoding_client.get(url, params=params)
+        return google_api.parse_geocode(response)
+
+    async def fetch_and_record_solar(self, lat, lng):
+        """Pendant asynchrone de google_api.fetch_and_record_solar"""
+        url, params = google_api.solar_request(lat, lng)
+        response = await self.solar_client.get(url, params=params)
+        solar_data = google_api.parse_response(response, google_api.SOLAR_ERROR)
+        async with self.sessionmaker() as db_session:
+            await db_session.execute(solar_store.insert_statement(lat, lng, solar_data))
+            await db_session.commit()
+        return solar_data
+
+    async def lookup_solar(self, lat, lng):
+        """Pendant asynchrone de google_api.lookup_solar"""
+        if solar_store.SOLAR_DEDUP_RADIUS_M > 0:
+            async with self.sessionmaker() as db_session:
+                rows = (await db_session.execute(solar_store.nearest_statement(lat, lng))).all()
+            solar_data = solar_store.pick_nearest(rows, lat, lng)
+            if solar_data is not None:
+                return solar_data
+        return await self.fetch_and_record_solar(lat, lng)
+
+    async def roof_geometry(self, lat, lng):
+        """Pendant asynchrone de google_api.roof_geometry"""
+        key = location_key(lat, lng, google_api.SOLAR_CACHE_PRECISION)
+        geometry = solar_store.geometry_cache.get(key)
+        if geometry is not None:
+            return geometry
+        if solar_store.SOLAR_DEDUP_RADIUS_M > 0:
+            async with self.sessionmaker() as db_session:
+                rows = (await db_session.execute(solar_store.nearest_geometry_statement(lat, lng))).all()
+            geometry = solar_store.pick_geometry(rows, lat, lng)
+        if geometry is None:
+            if not google_api.GOOGLE_API_KEY:
+                return None
+            solar_data = await google_api.solar_cache.aget_or_fetch(
+                key, lambda: self.fetch_and_record_solar(lat, lng)
+            )
+            geometry = RoofGeometry.from_response(solar_data)
+        return solar_store.remember_geometry(key, geometry)
+
+    def known_location(self, address):
+        """duplicates.known_location (session Flask-SQLAlchemy) dans un contexte de l'application"""
+        with self.wsgi_app.app_context():
+            return known_location(Lead, address)
+
+    async def resolve_roof(self, address, lat=None, lng=None):
+        """Pendant asynchrone de google_api.resolve_roof"""
+        try:
+            if lat is None or lng is None:
+                # Même reprise de la position d'un lead de même adresse que le mode WSGI (requête synchrone)
+                lat, lng = await sync_to_async(self.known_location, thread_sensitive=False)(address)
+                if lat is not None:
+                    return lat, lng, await self.roof_geometry(lat, lng)
+                if not google_api.GOOGLE_API_KEY:
+                    return None, None, None
+                geocoding_data = await google_api.geocode_cache.aget_or_fetch(
+                    address_key(address), lambda: self.fetch_geocode(address)
+                )
+                lat, lng = google_api.geocode_location(geocoding_data)
+                if lat is None:
+                    return None, None, None
+            return lat, lng, await self.roof_geometry(lat, lng)
+        except (CircuitOpenError, google_api.GoogleApiError, UpstreamError) as e:
+            google_api.logger.warning('Géométrie du toit indisponible pour %s: %s', address, e)
+            return lat, lng, None
+
+    async def geocode(self, data):
+        """Pendant asynchrone de google_api.geocode_address"""
+        try:
+            address = data.get('address')
+
+            if not address:
+                return 400, {'error': 'Adresse requise'}
+
+            if not google_api.GOOGLE_API_KEY:
+                return 500, {'error': 'Clé API Google non configurée'}
+
+            return 200, await google_api.geocode_cache.aget_or_fetch(
+                address_key(address), lambda: self.fetch_geocode(address)
+            )
+
+        except CircuitOpenError as e:
+            return 503, {'error': str(e)}
+        except (google_api.GoogleApiError, UpstreamError) as e:
+            return 500, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f'Erreur lors du géocodage: {str(e)}'}
+
+    async def solar_analysis(self, data):
+        """Pendant asynchrone de google_api.solar_analysis"""
+        try:
+            lat = data.get('lat')
+            lng = data.get('lng')
+
+            if not lat or not lng:
+                return 400, {'error': 'Latitude et longitude requises'}
+
+            if not google_api.GOOGLE_API_KEY:
+                return 500, {'error': 'Clé API Google non configurée'}
+
+            key = location_key(lat, lng, google_api.SOLAR_CACHE_PRECISION)
+            return 200, await google_api.solar_cache.aget_or_fetch(key, lambda: self.lookup_solar(lat, lng))
+
+        except CircuitOpenError as e:
+            return 503, {'error': str(e)}
+        except (google_api.GoogleApiError, UpstreamError) as e:
+            return 500, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f'Erreur lors de l\'analyse solaire: {str(e)}'}
+
+    async def start_conversation(self, data):
+        """Pendant asynchrone de conversation.start_conversation"""
+        try:
+            address = data.get('address')
+
+            if not address:
+                return 400, {'error': 'Adresse requise'}
+
+            latitude, longitude, geometry = await self.resolve_roof(address, data.get('lat'), data.get('lng'))
+            session = new_session(address, latitude, longitude, geometry)
+            async with self.sessionmaker() as db_session:
+                db_session.add(session)
+                await db_session.commit()
+
+            return 201, start_payload(session)
+
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+
+application = AsyncApplication(flask_app)
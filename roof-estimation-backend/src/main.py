@@ -3,74 +3,162 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
-from src.models.user import db
-from src.models.lead import Lead
-from src.models.conversation import ConversationSession
-from src.routes.user import user_bp
-from src.routes.estimation import estimation_bp
-from src.routes.conversation import conversation_bp
-from src.routes.google_api import google_api_bp  # ⭐ NOUVEAU
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-
-from fastapi.middleware.cors import CORSMiddleware
-
-# Configuration CORS plus détaillée
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "https://soumission-toirure-05f6ead9f71b.herokuapp.com",
-        "https://jldpkzrj.manus.space",
-        "https://e5h6i7cn08lj.manus.space"
-    ],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=[
-        "Content-Type", 
-        "Authorization", 
-        "Accept", 
-        "Origin", 
-        "X-Requested-With"
-    ],
-)
-
-# Ajouter handler OPTIONS pour preflight
-@app.options("/{full_path:path}")
-async def options_handler(full_path: str):
-    return {"message": "OK"}
-
-# Registration des blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(estimation_bp, url_prefix='/api')
-app.register_blueprint(conversation_bp, url_prefix='/api/conversation')
-app.register_blueprint(google_api_bp, url_prefix='/api')  # ⭐ NOUVEAU
-
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+from werkzeug.utils import import_string
+from src.models.database import configure_database, migrate, missing_schema
+from src.services import metrics
+from src.services.static_assets import configure_static
+import click
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Origines autorisées (partagées avec le mode ASGI, voir src/asgi.py)
+CORS_ORIGINS = [
+    "https://soumission-toirure-05f6ead9f71b.herokuapp.com",
+    "https://jldpkzrj.manus.space",
+    "https://e5h6i7cn08lj.manus.space"
+]
+
+# Blueprints de l'application : nom -> (objet à importer, préfixe d'URL)
+BLUEPRINTS = {
+    'user': ('src.routes.user:user_bp', '/api'),
+    'estimation': ('src.routes.estimation:estimation_bp', '/api'),
+    'conversation': ('src.routes.conversation:conversation_bp', '/api/conversation'),
+    'google_api': ('src.routes.google_api:google_api_bp', '/api'),  # ⭐ NOUVEAU
+    'analytics': ('src.routes.analytics:analytics_bp', '/api'),
+    'metrics': ('src.routes.metrics:metrics_bp', None),
+    'jobs': ('src.routes.jobs:jobs_bp', '/api'),
+}
+
+# Blueprints servis (noms séparés par des virgules ; tous par défaut)
+APP_BLUEPRINTS = [name.strip() for name in os.getenv('APP_BLUEPRINTS', ','.join(BLUEPRINTS)).split(',') if name.strip()]
+# Import des blueprints différé à la première requête : démarrage plus court
+LAZY_BLUEPRINTS = os.getenv('LAZY_BLUEPRINTS', 'true').lower() in ('1', 'true', 'yes')
+# Vérification du schéma à la première requête (avertissement si une migration manque)
+SCHEMA_CHECK = os.getenv('SCHEMA_CHECK', 'true').lower() in ('1', 'true', 'yes')
+
+
+def register_blueprints(app, names):
+    """Importe et enregistre les blueprints nommés"""
+    for name in names:
+        target, url_prefix = BLUEPRINTS[name]
+        app.register_blueprint(import_string(target), url_prefix=url_prefix)
+
+
+class FirstRequestSetup:
+    """
+    Middleware WSGI : fin de la configuration à la première requête.
+    Les blueprints différés sont importés et enregistrés, puis le schéma
+    est vérifié. Flask accepte encore de nouvelles routes à ce stade : la
+    requête n'est pas encore entrée dans l'application.
+    """
+
+    def __init__(self, app, pending, schema_check):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.pending = list(pending)
+        self.schema_check = schema_check
+        self.done = False
+        self._lock = threading.Lock()
+
+    def setup(self):
+        if self.done:
+            return
+        with self._lock:
+            if self.done:
+                return
+            register_blueprints(self.app, self.pending)
+            self.pending = []
+            if self.schema_check:
+                with self.app.app_context():
+                    missing = missing_schema()
+                if missing:
+                    logger.warning('Schéma incomplet (%s) : lancer flask --app src.main migrate', ', '.join(missing))
+            self.done = True
+
+    def __call__(self, environ, start_response):
+        if not self.done:
+            self.setup()
+        return self.wsgi_app(environ, start_response)
+
+
+def finish_setup(app):
+    """Termine tout de suite la configuration différée (préchargement, voir src/server.py)"""
+    app.extensions['first_request_setup'].setup()
+
+
+def create_app(config=None):
+    """
+    Construit l'application. ``config`` complète ou remplace la configuration
+    issue de l'environnement : ``BLUEPRINTS`` (noms servis), ``LAZY_BLUEPRINTS``,
+    ``SCHEMA_CHECK``, ``DATABASE_URL``, et toute clé de configuration Flask.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+    app.config.update(BLUEPRINTS=APP_BLUEPRINTS, LAZY_BLUEPRINTS=LAZY_BLUEPRINTS, SCHEMA_CHECK=SCHEMA_CHECK)
+    app.config.update(config or {})
+    unknown = [name for name in app.config['BLUEPRINTS'] if name not in BLUEPRINTS]
+    if unknown:
+        raise ValueError(f'Blueprints inconnus: {", ".join(unknown)} (disponibles: {", ".join(BLUEPRINTS)})')
+
+    # Configuration CORS plus détaillée (flask-cors répond aussi aux preflight OPTIONS)
+    CORS(
+        app,
+        origins=CORS_ORIGINS,
+        supports_credentials=True,
+        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        allow_headers=[
+            "Content-Type",
+            "Authorization",
+            "Accept",
+            "Origin",
+            "X-Requested-With"
+        ],
+    )
+
+    # Registration des blueprints : tout de suite, ou à la première requête.
+    # Sous la CLI flask, les commandes des blueprints doivent exister dès le chargement.
+    lazy = app.config['LAZY_BLUEPRINTS'] and click.get_current_context(silent=True) is None
+    if not lazy:
+        register_blueprints(app, app.config['BLUEPRINTS'])
+    setup = FirstRequestSetup(app, app.config['BLUEPRINTS'] if lazy else (), app.config['SCHEMA_CHECK'])
+    app.extensions['first_request_setup'] = setup
+    app.wsgi_app = setup
+
+    # Latences, requêtes SQL, appels amont et tailles par route (exposés sur /metrics)
+    metrics.init_app(app)
+
+    # Base de données : URL et pool depuis l'environnement (voir src/models/database.py).
+    # Le schéma est créé par l'étape explicite : flask --app src.main migrate
+    configure_database(app, app.config.get('DATABASE_URL'))
+
+    # Fichiers de l'interface : manifeste en mémoire, variantes gzip/brotli (voir src/services/static_assets.py)
+    static_assets = configure_static(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        return static_assets.response(path)
+
+    return app
+
+
+def __getattr__(name):
+    # Application par défaut, construite au premier accès (from src.main import app, flask --app src.main)
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 if __name__ == '__main__':
+    # Serveur de développement ; en production : python -m src.server (voir src/server.py).
+    # En développement, le schéma est mis à jour au lancement
+    app = create_app()
+    with app.app_context():
+        migrate()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,28 @@
+from src.models.user import db
+
+
+class AnalyticsRollup(db.Model):
+    """
+    Agrégat des estimations par jour, source (lead ou session terminée),
+    type de toiture, état, région et tranche de coût (voir src/services/analytics.py)
+    """
+    __tablename__ = 'analytics_rollup'
+    __table_args__ = (
+        # Clé d'agrégation : sert aussi les requêtes par source et plage de jours
+        db.UniqueConstraint('source', 'day', 'roof_type', 'roof_condition', 'region', 'bucket',
+                            name='uq_analytics_rollup_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    roof_type = db.Column(db.String(50), nullable=False, default='')
+    roof_condition = db.Column(db.String(50), nullable=False, default='')
+    region = db.Column(db.String(3), nullable=False, default='')
+    bucket = db.Column(db.Integer, nullable=False)  # tranche géométrique du coût moyen (min+max)/2
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum_min = db.Column(db.Float, nullable=False, default=0.0)
+    sum_max = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.source} {self.day} {self.bucket}>'
@@ -0,0 +1,15 @@
+from src.models.user import db
+
+
+def computed_column(column_type, compute, *sources):
+    """
+    Colonne interne dérivée d'autres colonnes : calculée à l'insertion quand
+    elle n'est pas fournie, et recalculée pour les lignes existantes par la
+    migration (src/models/database.py). Non exposée dans les réponses.
+    """
+    def default(context):
+        parameters = context.get_current_parameters()
+        return compute(*(parameters.get(source) for source in sources))
+
+    return db.Column(column_type, nullable=True, default=default,
+                     info={'internal': True, 'computed_from': (sources, compute)})
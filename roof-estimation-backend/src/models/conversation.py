@@ -1,33 +1,116 @@
 from src.models.user import db
+from src.models.columns import computed_column
+from src.utils.address import address_block_key, canonical_address, normalize_address
+from src.services.questions import answer_codec
+from src.utils.geo import encode_cell
+from src.utils.parsing import parse_bool
+from sqlalchemy.orm import validates
 from datetime import datetime
 import json
 
 class ConversationSession(db.Model):
+    # Encodeur des réponses, construit sur le catalogue de questions (voir src/services/questions.py)
+    answer_codec = answer_codec
+
+    __table_args__ = (
+        # Index de la pagination par curseur sur (timestamp, id)
+        db.Index('ix_conversation_session_timestamp_id', 'timestamp', 'id'),
+        # Filtres et tris des listes, chacun suivi de l'ordre de pagination (voir src/utils/pagination.py)
+        db.Index('ix_conversation_session_last_updated_id', 'last_updated', 'id'),
+        db.Index('ix_conversation_session_is_completed_timestamp_id', 'is_completed', 'timestamp', 'id'),
+        db.Index('ix_conversation_session_address_key_timestamp_id', 'address_key', 'timestamp', 'id'),
+        # Doublons d'adresse : clé canonique exacte, bloc (code postal, numéro) des comparaisons approchées
+        # (voir src/services/duplicates.py)
+        db.Index('ix_conversation_session_address_canonical_timestamp_id', 'address_canonical', 'timestamp', 'id'),
+        db.Index('ix_conversation_session_address_block_timestamp_id', 'address_block', 'timestamp', 'id'),
+        # Recherches par zone (voir src/services/spatial.py)
+        db.Index('ix_conversation_session_geo_cell', 'geo_cell'),
+    )
+    # Colonnes écrites par l'analyse du toit en tâche de fond, jamais par les mises à jour des réponses
+    # (voir src/services/session_store.py et src/services/jobs.py)
+    __analysis_columns__ = ('latitude', 'longitude', 'roof_area_sqm', 'analysis_status', 'geo_cell')
+    # Colonne de filigrane des exports incrémentaux (voir src/services/export.py)
+    __export_watermark__ = 'last_updated'
+    # Paramètres de filtre des listes : paramètre -> (colonne, conversion de la valeur)
+    __list_filters__ = {
+        'is_completed': ('is_completed', parse_bool),
+        'address': ('address_key', normalize_address),
+    }
+    # Champs de liste calculés à partir de plusieurs colonnes : (colonnes, décodage, JSON direct)
+    # (voir src/utils/pagination.py et src/utils/serializer.py)
+    __list_columns__ = {
+        'conversation_data': (('conversation_data', 'conversation_answers'), 'decode_conversation_data',
+                              'conversation_data_json'),
+    }
+
     id = db.Column(db.String(36), primary_key=True)  # UUID
     address = db.Column(db.Text, nullable=False)
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     roof_area_sqm = db.Column(db.Float, nullable=True)
+    analysis_status = db.Column(db.String(20), nullable=True)  # pending, done, failed (analyse du toit)
     current_question_id = db.Column(db.String(50), nullable=True)
-    conversation_data = db.Column(db.Text, nullable=True)  # JSON string
+    conversation_data = db.Column(db.Text, nullable=True)  # JSON string (réponses non encodables)
+    conversation_answers = db.Column(db.LargeBinary, nullable=True)  # Réponses encodées (AnswerCodec)
     estimated_cost_min = db.Column(db.Float, nullable=True)
     estimated_cost_max = db.Column(db.Float, nullable=True)
     is_completed = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Colonnes internes : adresse normalisée, canonique et son bloc, cellule géographique (voir src/utils/geo.py)
+    address_key = computed_column(db.Text, normalize_address, 'address')
+    address_canonical = computed_column(db.Text, canonical_address, 'address')
+    address_block = computed_column(db.String(20), address_block_key, 'address')
+    geo_cell = computed_column(db.BigInteger, encode_cell, 'latitude', 'longitude')
+
+    @validates('address')
+    def _set_address_key(self, key, address):
+        self.address_key = normalize_address(address)
+        self.address_canonical = canonical_address(address)
+        self.address_block = address_block_key(address)
+        return address
+
+    @validates('latitude', 'longitude')
+    def _set_geo_cell(self, key, value):
+        latitude = value if key == 'latitude' else self.latitude
+        longitude = value if key == 'longitude' else self.longitude
+        self.geo_cell = encode_cell(latitude, longitude)
+        return value
 
     def __repr__(self):
         return f'<ConversationSession {self.id}>'
 
+    @classmethod
+    def decode_conversation_data(cls, conversation_data, conversation_answers):
+        """Réponses à partir des colonnes brutes (encodage binaire, sinon JSON)"""
+        if conversation_answers is not None:
+            return cls.answer_codec.decode(conversation_answers)
+        if conversation_data:
+            return json.loads(conversation_data)
+        return {}
+
+    @classmethod
+    def conversation_data_json(cls, conversation_data, conversation_answers):
+        """Texte JSON des réponses : colonne JSON insérée telle quelle, encodage binaire mémorisé"""
+        if conversation_answers is not None:
+            return cls.answer_codec.to_json(conversation_answers)
+        return conversation_data or '{}'
+
+    @classmethod
+    def encode_conversation_data(cls, data):
+        """Colonnes (conversation_data, conversation_answers) : encodées si possible, sinon JSON"""
+        packed = cls.answer_codec.encode(data)
+        if packed is None:
+            return json.dumps(data), None
+        return None, packed
+
     def get_conversation_data(self):
         """Récupère les données de conversation sous forme de dictionnaire"""
-        if self.conversation_data:
-            return json.loads(self.conversation_data)
-        return {}
+        return self.decode_conversation_data(self.conversation_data, self.conversation_answers)
 
     def set_conversation_data(self, data):
-        """Stocke les données de conversation sous forme de JSON"""
-        self.conversation_data = json.dumps(data)
+        """Stocke les données de conversation, encodées si possible, sinon en JSON"""
+        self.conversation_data, self.conversation_answers = self.encode_conversation_data(data)
 
     def to_dict(self):
         return {
@@ -36,6 +119,7 @@ class ConversationSession(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'roof_area_sqm': self.roof_area_sqm,
+            'analysis_status': self.analysis_status,
             'current_question_id': self.current_question_id,
             'conversation_data': self.get_conversation_data(),
             'estimated_cost_min': self.estimated_cost_min,
@@ -0,0 +1,212 @@
+"""
+Configuration de la base de données et migration du schéma.
+
+L'URL du moteur et le dimensionnement du pool viennent de l'environnement
+(DATABASE_URL, DB_POOL_*). Pour SQLite, chaque connexion passe en WAL avec
+synchronous=NORMAL, un busy_timeout et un mmap : les lectures ne bloquent
+plus les écritures et un écrivain attend le verrou au lieu d'échouer avec
+« database is locked ». Les autres moteurs (PostgreSQL) utilisent un pool
+dimensionné avec vérification des connexions.
+
+Le schéma n'est plus créé à l'import de l'application : il l'est par
+l'étape explicite ``flask --app src.main migrate`` (lancée aussi par
+``python src/main.py`` en développement). À la première requête,
+l'application vérifie seulement qu'il est à jour (``missing_schema``).
+"""
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, select
+from src.models.user import db
+import click
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_URL = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'app.db')}"
+DATABASE_URL = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # secondes d'attente d'une connexion libre
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # secondes avant de renouveler une connexion
+
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # millisecondes
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # octets
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64 * 1024))  # négatif : en Kio
+
+
+def database_url(url=DATABASE_URL):
+    """URL SQLAlchemy ; accepte le schéma postgres:// fourni par certains hébergeurs"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return url.split(':', 1)[0].split('+', 1)[0] == 'sqlite'
+
+
+def engine_options(url):
+    """Options du moteur (SQLALCHEMY_ENGINE_OPTIONS) selon le backend"""
+    if url in ('sqlite://', 'sqlite:///:memory:'):
+        # Base en mémoire : une seule connexion par thread, pas de pool à dimensionner
+        return {}
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+    }
+    if is_sqlite(url):
+        # Les connexions du pool passent d'un thread à l'autre ; SQLite gère ses verrous
+        options['connect_args'] = {'check_same_thread': False}
+    else:
+        options['pool_recycle'] = DB_POOL_RECYCLE
+        options['pool_pre_ping'] = True
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Pragmas appliqués à chaque nouvelle connexion SQLite"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT:d}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE:d}')
+        cursor.execute(f'PRAGMA cache_size={SQLITE_CACHE_SIZE:d}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+# Modules des modèles : leurs tables doivent être connues de db.metadata avant migrate()
+MODEL_MODULES = (
+    'src.models.user',
+    'src.models.lead',
+    'src.models.conversation',
+    'src.models.solar',
+    'src.models.analytics',
+    'src.models.job',
+)
+
+# Index retirés des modèles, supprimés des bases existantes par migrate
+OBSOLETE_INDEXES = (
+    'ix_solar_analysis_building_id',  # jamais lu : la recherche se fait par position (src/services/solar_store.py)
+)
+
+
+def load_models():
+    """Importe les modèles (les routes, chargées à la demande, ne l'ont pas forcément fait)"""
+    for module in MODEL_MODULES:
+        importlib.import_module(module)
+
+
+def configure_database(app, url=None):
+    """Configure Flask-SQLAlchemy sur l'application et enregistre la commande migrate"""
+    url = database_url(url or DATABASE_URL)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    if is_sqlite(url):
+        with app.app_context():
+            event.listen(db.engine, 'connect', set_sqlite_pragmas)
+    app.cli.add_command(migrate_command)
+
+
+def migrate():
+    """
+    Crée les tables manquantes, puis les colonnes (nullables) et les index
+    ajoutés depuis, que create_all ne crée pas sur des tables existantes ;
+    supprime les index retirés (OBSOLETE_INDEXES). À exécuter dans un
+    contexte d'application.
+    """
+    load_models()
+    if db.engine.dialect.name == 'sqlite':
+        enable_incremental_vacuum()
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as connection:
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                logger.info('Colonne ajoutée: %s.%s', table.name, column.name)
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+        for column in table.columns:
+            if 'computed_from' in column.info:
+                backfill_column(table, column)
+    with db.engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+
+
+def missing_schema():
+    """
+    Tables et colonnes des modèles absentes de la base (liste vide si le
+    schéma est à jour). À exécuter dans un contexte d'application.
+    """
+    load_models()
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append(table.name)
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing)
+    return missing
+
+
+def enable_incremental_vacuum():
+    """
+    Passe la base SQLite en auto_vacuum=INCREMENTAL (pages libres rendues par
+    PRAGMA incremental_vacuum, voir src/services/maintenance.py). Sur une base
+    existante, le mode ne prend effet qu'après un VACUUM complet, fait une fois.
+    """
+    with db.engine.connect() as connection:
+        if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            return
+        connection.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+        connection.exec_driver_sql('VACUUM')
+    logger.info('Base SQLite passée en auto_vacuum=INCREMENTAL')
+
+
+def backfill_column(table, column, batch_size=1000):
+    """Calcule une colonne dérivée (computed_column) pour les lignes existantes, par lots"""
+    sources, compute = column.info['computed_from']
+    source_columns = [table.c[source] for source in sources]
+    # Les colonnes mises à jour automatiquement (last_updated) gardent leur valeur
+    unchanged = {other.name: other for other in table.columns if other.onupdate is not None}
+    statement = table.update().where(table.c.id == bindparam('b_id')).values(
+        {column.name: bindparam('b_value'), **unchanged}
+    )
+    last_id = None
+    while True:
+        with db.engine.begin() as connection:
+            query = (
+                select(table.c.id, *source_columns)
+                .where(column.is_(None), *(source.isnot(None) for source in source_columns))
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            rows = connection.execute(query).all()
+            if not rows:
+                return
+            connection.execute(statement, [{'b_id': row[0], 'b_value': compute(*row[1:])} for row in rows])
+            last_id = rows[-1][0]
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Crée ou met à jour le schéma de la base de données"""
+    migrate()
+    click.echo(f'Schéma à jour ({db.engine.url.render_as_string(hide_password=True)})')
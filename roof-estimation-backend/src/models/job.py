@@ -0,0 +1,49 @@
+from src.models.user import db
+from datetime import datetime
+import json
+
+
+class Job(db.Model):
+    """
+    Tâche de fond persistée (voir src/services/jobs.py) : survit aux
+    redémarrages et peut être prise par n'importe quel processus
+    """
+    __tablename__ = 'job'
+    __table_args__ = (
+        # Prise de la prochaine tâche disponible, reprise des baux expirés
+        db.Index('ix_job_status_available_at_id', 'status', 'available_at', 'id'),
+        # Dernière tâche d'un sujet (session de conversation)
+        db.Index('ix_job_kind_subject_created_at', 'kind', 'subject', 'created_at'),
+    )
+
+    id = db.Column(db.String(36), primary_key=True)  # UUID
+    kind = db.Column(db.String(50), nullable=False)
+    subject = db.Column(db.String(64), nullable=True)  # objet concerné (id de session)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)  # pas avant (nouvel essai différé)
+    locked_by = db.Column(db.String(64), nullable=True)  # processus et thread qui l'exécutent
+    locked_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.kind} {self.id}>'
+
+    @classmethod
+    def row_to_dict(cls, row):
+        """Représentation JSON d'une ligne (mapping) de la table"""
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'subject': row['subject'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+            'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None,
+        }
@@ -1,7 +1,32 @@
 from src.models.user import db
+from src.models.columns import computed_column
+from src.utils.address import address_block_key, canonical_address, normalize_address
+from src.utils.geo import encode_cell
+from sqlalchemy.orm import validates
 from datetime import datetime
 
 class Lead(db.Model):
+    __table_args__ = (
+        # Index de la pagination par curseur sur (timestamp, id)
+        db.Index('ix_lead_timestamp_id', 'timestamp', 'id'),
+        # Filtres des listes, chacun suivi de l'ordre de pagination (voir src/utils/pagination.py)
+        db.Index('ix_lead_client_email_timestamp_id', 'client_email', 'timestamp', 'id'),
+        db.Index('ix_lead_client_phone_timestamp_id', 'client_phone', 'timestamp', 'id'),
+        db.Index('ix_lead_address_key_timestamp_id', 'address_key', 'timestamp', 'id'),
+        # Doublons d'adresse : clé canonique exacte, bloc (code postal, numéro) des comparaisons approchées
+        # (voir src/services/duplicates.py)
+        db.Index('ix_lead_address_canonical_timestamp_id', 'address_canonical', 'timestamp', 'id'),
+        db.Index('ix_lead_address_block_timestamp_id', 'address_block', 'timestamp', 'id'),
+        # Recherches par zone (voir src/services/spatial.py)
+        db.Index('ix_lead_geo_cell', 'geo_cell'),
+    )
+    # Paramètres de filtre des listes : paramètre -> (colonne, conversion de la valeur)
+    __list_filters__ = {
+        'email': ('client_email', str),
+        'phone': ('client_phone', str),
+        'address': ('address_key', normalize_address),
+    }
+
     id = db.Column(db.Integer, primary_key=True)
     address = db.Column(db.Text, nullable=False)
     latitude = db.Column(db.Float, nullable=True)
@@ -13,6 +38,25 @@ class Lead(db.Model):
     client_email = db.Column(db.String(120), nullable=True)
     client_phone = db.Column(db.String(20), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Colonnes internes : adresse normalisée, canonique et son bloc, cellule géographique (voir src/utils/geo.py)
+    address_key = computed_column(db.Text, normalize_address, 'address')
+    address_canonical = computed_column(db.Text, canonical_address, 'address')
+    address_block = computed_column(db.String(20), address_block_key, 'address')
+    geo_cell = computed_column(db.BigInteger, encode_cell, 'latitude', 'longitude')
+
+    @validates('address')
+    def _set_address_key(self, key, address):
+        self.address_key = normalize_address(address)
+        self.address_canonical = canonical_address(address)
+        self.address_block = address_block_key(address)
+        return address
+
+    @validates('latitude', 'longitude')
+    def _set_geo_cell(self, key, value):
+        latitude = value if key == 'latitude' else self.latitude
+        longitude = value if key == 'longitude' else self.longitude
+        self.geo_cell = encode_cell(latitude, longitude)
+        return value
 
     def __repr__(self):
         return f'<Lead {self.address}>'
@@ -0,0 +1,78 @@
+from src.models.user import db
+from src.models.columns import computed_column
+from src.utils.geo import encode_cell
+from datetime import datetime
+import json
+
+
+class RoofGeometry:
+    """
+    Géométrie du toit extraite une fois d'une réponse buildingInsights :
+    surface totale, nombre de pans, pente moyenne (pondérée par la surface)
+    et orientation du pan principal (degrés depuis le nord).
+    """
+    __slots__ = ('building_id', 'roof_area_sqm', 'segment_count', 'pitch_degrees', 'azimuth_degrees')
+    FIELDS = __slots__
+
+    def __init__(self, building_id=None, roof_area_sqm=None, segment_count=None, pitch_degrees=None,
+                 azimuth_degrees=None):
+        self.building_id = building_id
+        self.roof_area_sqm = roof_area_sqm
+        self.segment_count = segment_count
+        self.pitch_degrees = pitch_degrees
+        self.azimuth_degrees = azimuth_degrees
+
+    @classmethod
+    def from_response(cls, data):
+        potential = data.get('solarPotential') or {}
+        segments = potential.get('roofSegmentStats') or []
+        areas = [(segment.get('stats') or {}).get('areaMeters2') or 0.0 for segment in segments]
+        whole_roof_area = (potential.get('wholeRoofStats') or {}).get('areaMeters2')
+        roof_area = whole_roof_area if whole_roof_area is not None else (sum(areas) or None)
+
+        pitch = azimuth = None
+        if segments and sum(areas) > 0:
+            pitch = sum(area * (segment.get('pitchDegrees') or 0.0) for area, segment in zip(areas, segments)) / sum(areas)
+            azimuth = segments[areas.index(max(areas))].get('azimuthDegrees')
+        return cls(
+            building_id=data.get('name'),
+            roof_area_sqm=round(float(roof_area), 1) if roof_area is not None else None,
+            segment_count=len(segments),
+            pitch_degrees=round(float(pitch), 1) if pitch is not None else None,
+            azimuth_degrees=round(float(azimuth), 1) if azimuth is not None else None,
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_response(json.loads(text))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+def _geometry_field(name):
+    return lambda response: getattr(RoofGeometry.from_json(response), name) if response else None
+
+
+class SolarAnalysis(db.Model):
+    """Réponse Google Solar conservée pour être réutilisée aux alentours (voir src/services/solar_store.py)"""
+    __tablename__ = 'solar_analysis'
+    __table_args__ = (
+        db.Index('ix_solar_analysis_geo_cell', 'geo_cell'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    response = db.Column(db.Text, nullable=False)  # JSON brut de buildingInsights:findClosest
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    geo_cell = computed_column(db.BigInteger, encode_cell, 'latitude', 'longitude')
+    # Géométrie extraite de la réponse (RoofGeometry), lue sans décoder le JSON
+    building_id = computed_column(db.String(100), _geometry_field('building_id'), 'response')
+    roof_area_sqm = computed_column(db.Float, _geometry_field('roof_area_sqm'), 'response')
+    segment_count = computed_column(db.Integer, _geometry_field('segment_count'), 'response')
+    pitch_degrees = computed_column(db.Float, _geometry_field('pitch_degrees'), 'response')
+    azimuth_degrees = computed_column(db.Float, _geometry_field('azimuth_degrees'), 'response')
+
+    def __repr__(self):
+        return f'<SolarAnalysis {self.latitude},{self.longitude}>'
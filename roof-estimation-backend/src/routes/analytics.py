@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, request
+from src.services.analytics import AnalyticsError, rebuild, summary
+import click
+import time
+
+analytics_bp = Blueprint('analytics', __name__)
+
+@analytics_bp.route('/analytics', methods=['GET'])
+def get_analytics():
+    """
+    Statistiques des estimations (leads et sessions terminées) lues dans les
+    agrégats : nombre, coûts moyens et percentiles par jour, type de
+    toiture, état ou région
+    """
+    try:
+        return jsonify(summary(request.args)), 200
+
+    except AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@analytics_bp.cli.command('rebuild')
+def rebuild_command():
+    """Reconstruit les agrégats statistiques à partir des leads et des sessions"""
+    started = time.monotonic()
+    rows = rebuild()
+    click.echo(f'{rows} lignes d\'agrégat reconstruites en {time.monotonic() - started:.1f} s')
@@ -1,182 +1,139 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
+from sqlalchemy import bindparam, select
 from src.models.conversation import ConversationSession
 from src.models.user import db
+from src.routes.google_api import cached_roof, resolve_roof
+from src.services.batch_estimation import iter_items
+from src.services.export import export_response, export_to_file
+from src.services import metrics
+from src.services.duplicates import DuplicateQueryError, duplicates_response
+from src.services.jobs import FINISHED, JOB_WAIT_MAX, SSE_KEEPALIVE, JobError, job_queue, sse_event, wait_timeout
+from src.services.maintenance import session_maintenance
+from src.services.pricing import pricing_engine
+from src.services.questions import CONVERSATION_QUESTIONS
+from src.services.session_store import session_store
+from src.services.spatial import SpatialQueryError, nearby_response, within_response
+from src.utils.geo import encode_cell
+from src.utils.pagination import PaginationError, list_response
+from src.utils.records import INPUT_FORMATS
+import click
+import csv
+import json
+import os
+import time
 import uuid
 import random
-import math
 
 conversation_bp = Blueprint('conversation', __name__)
+# Les threads d'écriture différée et de maintenance ont besoin du contexte de l'application
+conversation_bp.record_once(lambda state: session_store.init_app(state.app))
+conversation_bp.record_once(lambda state: session_maintenance.init_app(state.app))
+# Worker de maintenance démarré à la première requête de chaque processus
+conversation_bp.before_app_request(session_maintenance.ensure_started)
+# Surveillance des règles de tarification (rechargement à chaud), hors du chemin des estimations
+conversation_bp.before_app_request(pricing_engine.ensure_started)
+# Analyse du toit des nouvelles sessions exécutée par la file de tâches
+conversation_bp.record_once(lambda state: job_queue.init_app(state.app))
+
+# /start rend la première question sans attendre le géocodage ni Google Solar (tâche roof_analysis)
+ROOF_ANALYSIS_ASYNC = os.getenv('ROOF_ANALYSIS_ASYNC', 'true').lower() in ('1', 'true', 'yes')
 
-# Questions du moteur de conversation
-CONVERSATION_QUESTIONS = {
-    'roof_type': {
-        'id': 'roof_type',
-        'question': 'Quel est le type de votre toiture actuelle ?',
-        'type': 'choice',
-        'options': [
-            {'value': 'tuiles_terre_cuite', 'label': 'Tuiles en terre cuite'},
-            {'value': 'tuiles_beton', 'label': 'Tuiles en béton'},
-            {'value': 'ardoise', 'label': 'Ardoise'},
-            {'value': 'zinc', 'label': 'Zinc'},
-            {'value': 'bac_acier', 'label': 'Bac acier'},
-            {'value': 'autre', 'label': 'Autre / Je ne sais pas'}
-        ],
-        'next_question': 'roof_condition'
-    },
-    'roof_condition': {
-        'id': 'roof_condition',
-        'question': 'Quel est l\'état général de votre toiture ?',
-        'type': 'choice',
-        'options': [
-            {'value': 'neuve', 'label': 'Neuve (moins de 5 ans)'},
-            {'value': 'bon_etat', 'label': 'Bon état (5-15 ans)'},
-            {'value': 'usee', 'label': 'Usée (15-30 ans)'},
-            {'value': 'endommagee', 'label': 'Endommagée (fuites, tuiles cassées)'}
-        ],
-        'next_question': 'roof_elements'
-    },
-    'roof_elements': {
-        'id': 'roof_elements',
-        'question': 'Y a-t-il des éléments spécifiques sur votre toiture ?',
-        'type': 'multiple_choice',
-        'options': [
-            {'value': 'cheminee', 'label': 'Cheminée(s)'},
-            {'value': 'lucarne', 'label': 'Lucarne(s)'},
-            {'value': 'fenetre_toit', 'label': 'Fenêtre(s) de toit'},
-            {'value': 'panneaux_solaires', 'label': 'Panneaux solaires'},
-            {'value': 'antenne', 'label': 'Antenne/Parabole'},
-            {'value': 'aucun', 'label': 'Aucun élément particulier'}
-        ],
-        'next_question': 'roof_access'
-    },
-    'roof_access': {
-        'id': 'roof_access',
-        'question': 'Comment évaluez-vous l\'accès à votre toiture ?',
-        'type': 'choice',
-        'options': [
-            {'value': 'facile', 'label': 'Facile (maison plain-pied, bon accès)'},
-            {'value': 'moyen', 'label': 'Moyen (étage, quelques contraintes)'},
-            {'value': 'difficile', 'label': 'Difficile (hauteur importante, accès restreint)'}
-        ],
-        'next_question': 'material_preference'
-    },
-    'material_preference': {
-        'id': 'material_preference',
-        'question': 'Avez-vous une préférence pour le type de matériau ?',
-        'type': 'choice',
-        'options': [
-            {'value': 'identique', 'label': 'Identique à l\'existant'},
-            {'value': 'amelioration', 'label': 'Amélioration (meilleure qualité)'},
-            {'value': 'economique', 'label': 'Solution économique'},
-            {'value': 'ecologique', 'label': 'Solution écologique'},
-            {'value': 'pas_preference', 'label': 'Pas de préférence particulière'}
-        ],
-        'next_question': 'insulation'
-    },
-    'insulation': {
-        'id': 'insulation',
-        'question': 'Souhaitez-vous améliorer l\'isolation de votre toiture ?',
-        'type': 'choice',
-        'options': [
-            {'value': 'oui_complete', 'label': 'Oui, isolation complète'},
-            {'value': 'oui_partielle', 'label': 'Oui, amélioration partielle'},
-            {'value': 'non', 'label': 'Non, pas d\'isolation'},
-            {'value': 'pas_sur', 'label': 'Je ne sais pas / À voir'}
-        ],
-        'next_question': None  # Dernière question
-    }
-}
-
-# Données de coûts mises à jour
-MATERIAL_COSTS = {
-    'tuiles_terre_cuite': {'min': 25, 'max': 90, 'quality_factor': 1.0},
-    'tuiles_beton': {'min': 35, 'max': 45, 'quality_factor': 0.8},
-    'bac_acier': {'min': 15, 'max': 35, 'quality_factor': 0.6},
-    'zinc': {'min': 40, 'max': 90, 'quality_factor': 1.2},
-    'ardoise': {'min': 60, 'max': 100, 'quality_factor': 1.4},
-    'autre': {'min': 30, 'max': 70, 'quality_factor': 1.0}
-}
-
-CONDITION_FACTORS = {
-    'neuve': 0.8,  # Moins de travaux
-    'bon_etat': 1.0,  # Standard
-    'usee': 1.2,  # Plus de préparation
-    'endommagee': 1.5  # Réparations importantes
-}
-
-ACCESS_FACTORS = {
-    'facile': 1.0,
-    'moyen': 1.2,
-    'difficile': 1.5
-}
-
-INSULATION_COSTS = {
-    'oui_complete': {'min': 20, 'max': 40},  # €/m² supplémentaire
-    'oui_partielle': {'min': 10, 'max': 25},
-    'non': {'min': 0, 'max': 0},
-    'pas_sur': {'min': 5, 'max': 15}  # Estimation moyenne
-}
 
 def calculate_refined_estimation(session):
-    """Calcule une estimation affinée basée sur les réponses de la conversation"""
+    """
+    Calcule une estimation affinée basée sur les réponses de la conversation
+    (tables de coûts : src/services/pricing_rules.json)
+    """
     conversation_data = session.get_conversation_data()
     roof_area = session.roof_area_sqm or random.randint(80, 180)
+    return pricing_engine.estimate(conversation_data, roof_area)
+
+def default_location():
+    """Position simulée d'une adresse non géocodée"""
+    return 48.8566 + random.uniform(-0.1, 0.1), 2.3522 + random.uniform(-0.1, 0.1)  # Paris approximatif
+
+def new_session(address, latitude=None, longitude=None, geometry=None, analysis_status='done'):
+    """
+    Crée une session (non persistée) positionnée sur la première question.
+    La surface vient de la géométrie Google Solar du toit (voir
+    google_api.resolve_roof) ; sans elle, valeurs simulées comme auparavant.
+    En attente d'analyse (``analysis_status='pending'``), la surface est
+    provisoire et la position reste inconnue jusqu'au résultat de la tâche.
+    """
+    session = ConversationSession(
+        id=str(uuid.uuid4()),
+        address=address,
+        current_question_id='roof_type',
+        analysis_status=analysis_status
+    )
+    session.set_conversation_data({})
     
-    # Coût de base selon le matériau
-    roof_type = conversation_data.get('roof_type', 'tuiles_terre_cuite')
-    material_costs = MATERIAL_COSTS.get(roof_type, MATERIAL_COSTS['tuiles_terre_cuite'])
-    
-    base_cost_min = roof_area * material_costs['min']
-    base_cost_max = roof_area * material_costs['max']
-    
-    # Facteur d'état de la toiture
-    condition = conversation_data.get('roof_condition', 'bon_etat')
-    condition_factor = CONDITION_FACTORS.get(condition, 1.0)
-    
-    # Facteur d'accès
-    access = conversation_data.get('roof_access', 'moyen')
-    access_factor = ACCESS_FACTORS.get(access, 1.2)
-    
-    # Coût de la main d'œuvre
-    labor_hours_per_sqm = 0.5 * condition_factor * access_factor
-    labor_cost = roof_area * labor_hours_per_sqm * 50  # 50€/heure
-    
-    # Coût d'isolation
-    insulation = conversation_data.get('insulation', 'non')
-    insulation_costs = INSULATION_COSTS.get(insulation, INSULATION_COSTS['non'])
-    insulation_cost_min = roof_area * insulation_costs['min']
-    insulation_cost_max = roof_area * insulation_costs['max']
-    
-    # Facteur de complexité selon les éléments de toiture
-    elements = conversation_data.get('roof_elements', [])
-    complexity_factor = 1.0
-    if isinstance(elements, list):
-        if 'cheminee' in elements:
-            complexity_factor += 0.1
-        if 'lucarne' in elements:
-            complexity_factor += 0.15
-        if 'fenetre_toit' in elements:
-            complexity_factor += 0.1
-        if 'panneaux_solaires' in elements:
-            complexity_factor += 0.2
-    
-    # Calcul final
-    total_min = (base_cost_min + labor_cost + insulation_cost_min) * complexity_factor
-    total_max = (base_cost_max + labor_cost + insulation_cost_max) * complexity_factor
-    
-    # Ajustement selon la préférence matériau
-    material_pref = conversation_data.get('material_preference', 'identique')
-    if material_pref == 'amelioration':
-        total_min *= 1.2
-        total_max *= 1.4
-    elif material_pref == 'economique':
-        total_min *= 0.8
-        total_max *= 1.0
-    elif material_pref == 'ecologique':
-        total_min *= 1.1
-        total_max *= 1.3
-    
-    return math.ceil(total_min), math.ceil(total_max)
+    if geometry is not None and geometry.roof_area_sqm:
+        session.roof_area_sqm = geometry.roof_area_sqm
+    else:
+        session.roof_area_sqm = random.randint(80, 180)
+    if latitude is not None and longitude is not None:
+        session.latitude = latitude
+        session.longitude = longitude
+    elif analysis_status != 'pending':
+        session.latitude, session.longitude = default_location()
+    return session
+
+def analyze_roof(payload):
+    """
+    Tâche roof_analysis : position et géométrie du toit d'une session créée
+    par /start, écrites sur la session. La surface provisoire est remplacée
+    si Google Solar la connaît ; sans position, valeurs simulées comme en synchrone.
+    """
+    latitude, longitude, geometry = resolve_roof(payload['address'], payload.get('lat'), payload.get('lng'))
+    if latitude is None or longitude is None:
+        latitude, longitude = default_location()
+    values = {'latitude': latitude, 'longitude': longitude, 'analysis_status': 'done'}
+    if geometry is not None and geometry.roof_area_sqm:
+        values['roof_area_sqm'] = geometry.roof_area_sqm
+    session_store.apply(payload['session_id'], dict(values, geo_cell=encode_cell(latitude, longitude)))
+    return dict(values, geometry=geometry.to_dict() if geometry is not None else None)
+
+def roof_analysis_failed(payload, error):
+    """Analyse abandonnée : la session garde sa surface provisoire et reçoit une position simulée"""
+    latitude, longitude = default_location()
+    session_store.apply(payload['session_id'], {
+        'latitude': latitude, 'longitude': longitude, 'geo_cell': encode_cell(latitude, longitude),
+        'analysis_status': 'failed',
+    })
+
+job_queue.register('roof_analysis', analyze_roof, roof_analysis_failed)
+
+def analysis_payload(session, job=None):
+    """État de l'analyse du toit d'une session (long-poll, SSE)"""
+    return {
+        'session_id': session.id,
+        'status': session.analysis_status or 'done',
+        'latitude': session.latitude,
+        'longitude': session.longitude,
+        'roof_area_sqm': session.roof_area_sqm,
+        'error': job['error'] if job is not None and job['status'] == 'failed' else None,
+    }
+
+def start_payload(session, job_id=None):
+    """Réponse de /start : la session créée et la première question"""
+    payload = {
+        'session_id': session.id,
+        'address': session.address,
+        'roof_area_sqm': session.roof_area_sqm,
+        'analysis_status': session.analysis_status,
+        'question': CONVERSATION_QUESTIONS['roof_type'],
+        'progress': 1,
+        'total_questions': len(CONVERSATION_QUESTIONS)
+    }
+    if job_id is not None:
+        # Surface provisoire : résultat de l'analyse en long-poll ou en flux SSE
+        payload['analysis'] = {
+            'job_id': job_id,
+            'poll_url': url_for('conversation.get_session_analysis', session_id=session.id),
+            'events_url': url_for('conversation.session_analysis_events', session_id=session.id),
+        }
+    return payload
 
 @conversation_bp.route('/start', methods=['POST'])
 def start_conversation():
@@ -188,34 +145,28 @@ def start_conversation():
         if not address:
             return jsonify({'error': 'Adresse requise'}), 400
         
-        # Créer une nouvelle session
-        session_id = str(uuid.uuid4())
-        session = ConversationSession(
-            id=session_id,
-            address=address,
-            current_question_id='roof_type',
-            conversation_data='{}'
-        )
-        
-        # Simuler les données de toiture (dans la vraie version, utiliser Google Solar API)
-        session.roof_area_sqm = random.randint(80, 180)
-        session.latitude = 48.8566 + random.uniform(-0.1, 0.1)  # Paris approximatif
-        session.longitude = 2.3522 + random.uniform(-0.1, 0.1)
+        # Position et géométrie déjà en cache : pas de tâche à attendre
+        cached = cached_roof(address, data.get('lat'), data.get('lng')) if ROOF_ANALYSIS_ASYNC else None
+        if ROOF_ANALYSIS_ASYNC and cached is None and not job_queue.saturated():
+            # Première question tout de suite ; position et géométrie du toit calculées en tâche de fond
+            session = session_store.add(new_session(address, data.get('lat'), data.get('lng'),
+                                                    analysis_status='pending'))
+            # La ligne doit exister avant que la tâche y écrive
+            session_store.flush([session])
+            job_id = job_queue.enqueue('roof_analysis', {
+                'session_id': session.id, 'address': address, 'lat': data.get('lat'), 'lng': data.get('lng'),
+            }, subject=session.id)
+            return jsonify(start_payload(session, job_id)), 201
+
+        # File saturée (ou désactivée) : position (fournie ou géocodée) et géométrie du toit
+        # calculées dans la requête, servies par les caches
+        latitude, longitude, geometry = cached or resolve_roof(address, data.get('lat'), data.get('lng'))
         
-        db.session.add(session)
-        db.session.commit()
+        # Créer une nouvelle session (écrite en base par le magasin d'états)
+        session = session_store.add(new_session(address, latitude, longitude, geometry))
         
         # Retourner la première question
-        first_question = CONVERSATION_QUESTIONS['roof_type']
-        
-        return jsonify({
-            'session_id': session_id,
-            'address': address,
-            'roof_area_sqm': session.roof_area_sqm,
-            'question': first_question,
-            'progress': 1,
-            'total_questions': len(CONVERSATION_QUESTIONS)
-        }), 201
+        return jsonify(start_payload(session)), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -231,35 +182,47 @@ def answer_question():
         if not session_id or not answer:
             return jsonify({'error': 'session_id et answer requis'}), 400
         
-        # Récupérer la session
-        session = ConversationSession.query.get(session_id)
+        # Récupérer la session (magasin d'états, lue en base au premier accès)
+        with metrics.phase('db_get'):
+            session = session_store.get(session_id)
         if not session:
             return jsonify({'error': 'Session non trouvée'}), 404
         
-        # Mettre à jour les données de conversation
-        conversation_data = session.get_conversation_data()
-        current_question_id = session.current_question_id
-        
-        if current_question_id:
-            conversation_data[current_question_id] = answer
-            session.set_conversation_data(conversation_data)
+        with session.lock:
+            was_completed = session.is_completed
+            # Mettre à jour les données de conversation
+            with metrics.phase('decode'):
+                conversation_data = session.get_conversation_data()
+            current_question_id = session.current_question_id
+            
+            if current_question_id:
+                conversation_data[current_question_id] = answer
+                session.set_conversation_data(conversation_data)
+            
+            # Déterminer la question suivante
+            current_question = CONVERSATION_QUESTIONS.get(current_question_id)
+            next_question_id = current_question.get('next_question') if current_question else None
+            
+            # Calculer l'estimation (intermédiaire ou finale)
+            with metrics.phase('estimate'):
+                cost_min, cost_max = calculate_refined_estimation(session)
+            session.estimated_cost_min = cost_min
+            session.estimated_cost_max = cost_max
+            if next_question_id:
+                session.current_question_id = next_question_id
+            else:
+                session.is_completed = True
+                session.current_question_id = None
         
-        # Déterminer la question suivante
-        current_question = CONVERSATION_QUESTIONS.get(current_question_id)
-        next_question_id = current_question.get('next_question') if current_question else None
+        # Écriture différée, ou immédiate en fin de conversation ; agrégats statistiques
+        # mis à jour une fois, à la fin, dans la transaction qui écrit la session
+        with metrics.phase('commit'):
+            session_store.save(session, completed=session.is_completed and not was_completed)
         
         if next_question_id:
             # Il y a une question suivante
-            session.current_question_id = next_question_id
             next_question = CONVERSATION_QUESTIONS[next_question_id]
             
-            # Calculer l'estimation intermédiaire
-            cost_min, cost_max = calculate_refined_estimation(session)
-            session.estimated_cost_min = cost_min
-            session.estimated_cost_max = cost_max
-            
-            db.session.commit()
-            
             # Calculer le progrès
             questions_answered = len([q for q in CONVERSATION_QUESTIONS.keys() if q in conversation_data])
             progress = questions_answered + 1
@@ -275,15 +238,7 @@ def answer_question():
                 }
             }), 200
         else:
-            # Conversation terminée, calculer l'estimation finale
-            cost_min, cost_max = calculate_refined_estimation(session)
-            session.estimated_cost_min = cost_min
-            session.estimated_cost_max = cost_max
-            session.is_completed = True
-            session.current_question_id = None
-            
-            db.session.commit()
-            
+            # Conversation terminée
             return jsonify({
                 'session_id': session_id,
                 'completed': True,
@@ -303,7 +258,7 @@ def answer_question():
 def get_session(session_id):
     """Récupère l'état d'une session de conversation"""
     try:
-        session = ConversationSession.query.get(session_id)
+        session = session_store.get(session_id)
         if not session:
             return jsonify({'error': 'Session non trouvée'}), 404
         
@@ -312,13 +267,226 @@ def get_session(session_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def wait_for_analysis(session_id, timeout):
+    """(session, tâche) dès que l'analyse du toit est terminée, ou telle quelle après ``timeout`` secondes"""
+    session = session_store.get(session_id)
+    job = None
+    if session is not None and session.analysis_status == 'pending':
+        job = job_queue.latest('roof_analysis', session_id)
+        if job is not None and job['status'] not in FINISHED:
+            job = job_queue.wait(job['id'], timeout)
+            session = session_store.get(session_id)
+    return session, job
+
+@conversation_bp.route('/session/<session_id>/analysis', methods=['GET'])
+def get_session_analysis(session_id):
+    """État de l'analyse du toit ; ``wait`` (secondes) attend son résultat (long-poll)"""
+    try:
+        session, job = wait_for_analysis(session_id, wait_timeout(request.args))
+        if not session:
+            return jsonify({'error': 'Session non trouvée'}), 404
+
+        return jsonify(analysis_payload(session, job)), 200
+
+    except JobError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@conversation_bp.route('/session/<session_id>/events', methods=['GET'])
+def session_analysis_events(session_id):
+    """
+    Flux Server-Sent Events de l'analyse du toit : un événement ``analysis``
+    au résultat, ou avec le statut pending après JOB_WAIT_MAX secondes
+    (EventSource se reconnecte de lui-même)
+    """
+    session = session_store.get(session_id)
+    if not session:
+        return jsonify({'error': 'Session non trouvée'}), 404
+
+    def generate():
+        deadline = time.monotonic() + JOB_WAIT_MAX
+        yield 'retry: 1000\n\n'
+        while True:
+            current, job = wait_for_analysis(session_id, max(0.0, min(SSE_KEEPALIVE, deadline - time.monotonic())))
+            if current is None:
+                return
+            if (current.analysis_status != 'pending' or job is None or job['status'] in FINISHED
+                    or time.monotonic() >= deadline):
+                break
+            yield ': keep-alive\n\n'
+        yield sse_event('analysis', analysis_payload(current, job))
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @conversation_bp.route('/sessions', methods=['GET'])
 def get_sessions():
-    """Récupère toutes les sessions de conversation"""
+    """Récupère les sessions de conversation (paginées, projetées ou en NDJSON)"""
     try:
-        sessions = ConversationSession.query.order_by(ConversationSession.timestamp.desc()).all()
-        return jsonify([session.to_dict() for session in sessions]), 200
+        return list_response(ConversationSession, request.args), 200
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@conversation_bp.route('/sessions/export', methods=['GET'])
+def export_sessions():
+    """
+    Export en flux des sessions (``format=csv|ndjson|parquet``, ``compress=gzip``),
+    incrémental depuis ``since`` sur last_updated ; filigrane suivant dans X-Export-Watermark
+    """
+    try:
+        # Les états en attente d'écriture de ce processus sont inclus
+        session_store.flush()
+        return export_response(ConversationSession, request.args), 200
+
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@conversation_bp.route('/sessions/nearby', methods=['GET'])
+def get_nearby_sessions():
+    """Sessions dans un rayon autour de ``lat``/``lng``, de la plus proche à la plus lointaine"""
+    try:
+        return nearby_response(ConversationSession, request.args), 200
+
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@conversation_bp.route('/sessions/within', methods=['GET'])
+def get_sessions_within():
+    """Sessions dans une boîte englobante ``bbox=sud,ouest,nord,est``"""
+    try:
+        return within_response(ConversationSession, request.args), 200
+
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@conversation_bp.route('/sessions/duplicates', methods=['GET'])
+def get_duplicate_sessions():
+    """Sessions en double : grappes de doublons, ou doublons de ``address``"""
+    try:
+        return duplicates_response(ConversationSession, request.args), 200
+
+    except DuplicateQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@conversation_bp.route('/store/stats', methods=['GET'])
+def get_store_stats():
+    """Statistiques du magasin d'états des sessions (écriture différée)"""
+    return jsonify(session_store.to_dict()), 200
+
+@conversation_bp.route('/maintenance/stats', methods=['GET'])
+def get_maintenance_stats():
+    """Configuration et dernier rapport de la purge des sessions abandonnées"""
+    return jsonify(session_maintenance.to_dict()), 200
+
+def batch_lines(estimator, items):
+    """Lignes NDJSON des résultats ; une erreur de lecture du flux termine par une ligne d'erreur"""
+    try:
+        for result in estimator.estimate(items):
+            yield json.dumps(result) + '\n'
+    except (ValueError, csv.Error) as e:
+        yield json.dumps({'error': str(e)}) + '\n'
+
+@conversation_bp.route('/estimate-batch', methods=['POST'])
+def estimate_batch():
+    """
+    Estime un lot de jeux de réponses sans créer de session. Le corps est du
+    JSON, du NDJSON ou du CSV (selon Content-Type ou ``format``) ; les
+    résultats sont renvoyés en NDJSON au fil du calcul.
+    """
+    try:
+        input_format = request.args.get('format') or INPUT_FORMATS.get(request.mimetype, 'json')
+        if input_format not in INPUT_FORMATS.values():
+            return jsonify({'error': f'Format non supporté: {input_format}'}), 400
+
+        # Corps JSON lu ici : une erreur de syntaxe est renvoyée en 400, pas dans un flux tronqué
+        items = iter_items(request.stream, input_format, CONVERSATION_QUESTIONS.keys())
+        estimator = pricing_engine.current().batch_estimator
+        return Response(stream_with_context(batch_lines(estimator, items)), mimetype='application/x-ndjson'), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@conversation_bp.cli.command('estimate-batch')
+@click.argument('input_file', type=click.File('rb'))
+@click.option('--format', 'input_format', type=click.Choice(['json', 'ndjson', 'csv']), default='csv')
+@click.option('--output', type=click.File('w'), default='-')
+def estimate_batch_command(input_file, input_format, output):
+    """Estime un fichier de jeux de réponses et écrit les résultats en NDJSON"""
+    items = iter_items(input_file, input_format, CONVERSATION_QUESTIONS.keys())
+    for result in pricing_engine.current().batch_estimator.estimate(items):
+        output.write(json.dumps(result) + '\n')
+
+@conversation_bp.cli.command('migrate-answers')
+@click.option('--batch-size', type=int, default=500)
+def migrate_answers_command(batch_size):
+    """Encode les réponses des sessions encore stockées en JSON"""
+    # Core plutôt que l'ORM : last_updated garde sa valeur (expiration, filigrane des exports)
+    table = ConversationSession.__table__
+    statement = table.update().where(table.c.id == bindparam('b_id')).values(
+        conversation_data=None, conversation_answers=bindparam('b_answers'), last_updated=table.c.last_updated
+    )
+    migrated = kept = 0
+    last_id = ''
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.conversation_data)
+                .where(table.c.conversation_answers.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for session_id, conversation_data in rows:
+                data = ConversationSession.decode_conversation_data(conversation_data, None)
+                _, packed = ConversationSession.encode_conversation_data(data)
+                if packed is None:
+                    kept += 1
+                else:
+                    updates.append({'b_id': session_id, 'b_answers': packed})
+            if updates:
+                connection.execute(statement, updates)
+            migrated += len(updates)
+            last_id = rows[-1][0]
+    click.echo(f'{migrated} sessions encodées, {kept} conservées en JSON')
+
+@conversation_bp.cli.command('export-sessions')
+@click.argument('output', type=click.File('wb'))
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'ndjson', 'parquet']), default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help='Compresse la sortie en gzip')
+@click.option('--since', default=None, help='Filigrane ISO 8601 (prioritaire sur --state-file)')
+@click.option('--state-file', default=None, help='Fichier JSON du filigrane, relu puis mis à jour')
+def export_sessions_command(output, output_format, compress, since, state_file):
+    """Exporte les sessions (incrémental avec --since ou --state-file)"""
+    args = {'format': output_format, 'compress': 'gzip' if compress else None, 'since': since}
+    rows, watermark = export_to_file(ConversationSession, args, output, state_file)
+    click.echo(f'{rows} sessions exportées, filigrane {watermark.isoformat()}', err=True)
+
+@conversation_bp.cli.command('expire-sessions')
+@click.option('--ttl', type=float, default=None, help='Inactivité en secondes (SESSION_EXPIRY_TTL par défaut)')
+@click.option('--archive-dir', default=None, help='Archive NDJSON gzip des sessions supprimées')
+def expire_sessions_command(ttl, archive_dir):
+    """Supprime les sessions abandonnées et compacte la base"""
+    if ttl is not None:
+        session_maintenance.ttl = ttl
+    if archive_dir is not None:
+        session_maintenance.archive_dir = archive_dir
+    click.echo(json.dumps(session_maintenance.run()))
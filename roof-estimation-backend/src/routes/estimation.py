@@ -1,58 +1,44 @@
 from flask import Blueprint, jsonify, request
 from src.models.lead import Lead
 from src.models.user import db
+from src.routes.google_api import resolve_roof
+from src.services.analytics import record_leads
+from src.services.duplicates import DuplicateQueryError, duplicates_response
+from src.services.export import export_response, export_to_file
+from src.services.lead_import import LEAD_IMPORT_BATCH_SIZE, LEAD_REQUIRED_FIELDS, convert_field, import_leads
+from src.services.pricing import pricing_engine
+from src.services.spatial import SpatialQueryError, nearby_response, within_response
+from src.utils.pagination import PaginationError, list_response
+from src.utils.records import INPUT_FORMATS
+from src.utils.serializer import instance_response
+import click
+import json
 import random
-import math
 
 estimation_bp = Blueprint('estimation', __name__)
-
-# Données de coûts basées sur la recherche
-MATERIAL_COSTS = {
-    'tuiles_terre_cuite': {'min': 25, 'max': 90},  # €/m²
-    'tuiles_beton': {'min': 35, 'max': 45},
-    'bac_acier': {'min': 15, 'max': 35},
-    'zinc': {'min': 40, 'max': 90},
-    'ardoise': {'min': 60, 'max': 100}
-}
-
-LABOR_COST_PER_HOUR = 50  # €/heure
-LABOR_HOURS_PER_SQM = 0.5  # heures par m²
-
-COMPLEXITY_FACTORS = {
-    'simple': 1.0,
-    'moyenne': 1.2,
-    'complexe': 1.5
-}
+# Surveillance des règles de tarification (rechargement à chaud), hors du chemin des estimations
+estimation_bp.before_app_request(pricing_engine.ensure_started)
 
 def calculate_roof_estimation(address, roof_area=None):
     """
     Calcule une estimation de coût de rénovation de toiture
+    (tables de coûts : src/services/pricing_rules.json)
     """
     # Si pas de surface fournie, on estime entre 80 et 180 m²
     if roof_area is None:
         roof_area = random.randint(80, 180)
     
+    plan = pricing_engine.current()
+    
     # Sélection aléatoire du type de matériau (pour la démo)
-    material_type = random.choice(list(MATERIAL_COSTS.keys()))
-    material_costs = MATERIAL_COSTS[material_type]
+    material_type = random.choice(plan.quick_materials)
     
     # Facteur de complexité aléatoire
-    complexity = random.choice(list(COMPLEXITY_FACTORS.keys()))
-    complexity_factor = COMPLEXITY_FACTORS[complexity]
-    
-    # Calcul des coûts
-    material_cost_min = roof_area * material_costs['min']
-    material_cost_max = roof_area * material_costs['max']
+    complexity = random.choice(plan.quick_complexity_levels)
     
-    labor_cost = roof_area * LABOR_HOURS_PER_SQM * LABOR_COST_PER_HOUR
-    
-    # Application du facteur de complexité
-    total_min = (material_cost_min + labor_cost) * complexity_factor
-    total_max = (material_cost_max + labor_cost) * complexity_factor
-    
-    # Arrondir à l'euro près
-    total_min = math.ceil(total_min)
-    total_max = math.ceil(total_max)
+    # Calcul des coûts (état standard, bon accès), arrondis à l'euro près
+    answers = dict(plan.quick_fixed_answers, roof_type=material_type, complexity=complexity)
+    total_min, total_max = plan.evaluate(answers, roof_area)
     
     return {
         'address': address,
@@ -81,9 +67,12 @@ def estimate_roof_cost():
         if not address:
             return jsonify({'error': 'Adresse requise'}), 400
         
-        # Pour la démo, on simule l'appel à l'API Google Solar
-        # Dans la vraie implémentation, on appellerait l'API Google Solar ici
-        estimation = calculate_roof_estimation(address)
+        # Surface issue de la géométrie Google Solar du toit (caches), sinon simulée
+        latitude, longitude, geometry = resolve_roof(address, data.get('lat'), data.get('lng'))
+        roof_area = geometry.roof_area_sqm if geometry is not None and geometry.roof_area_sqm else None
+        estimation = calculate_roof_estimation(address, roof_area)
+        if geometry is not None:
+            estimation['roof_geometry'] = geometry.to_dict()
         
         return jsonify(estimation), 200
         
@@ -99,10 +88,14 @@ def create_lead():
         data = request.json
         
         # Validation des données requises
-        required_fields = ['address', 'estimated_cost_min', 'estimated_cost_max']
-        for field in required_fields:
+        for field in LEAD_REQUIRED_FIELDS:
             if field not in data:
                 return jsonify({'error': f'Champ requis manquant: {field}'}), 400
+        try:
+            cost_min = convert_field('estimated_cost_min', data['estimated_cost_min'])
+            cost_max = convert_field('estimated_cost_max', data['estimated_cost_max'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Création du lead
         lead = Lead(
@@ -110,30 +103,128 @@ def create_lead():
             latitude=data.get('latitude'),
             longitude=data.get('longitude'),
             roof_area_sqm=data.get('roof_area_sqm'),
-            estimated_cost_min=data['estimated_cost_min'],
-            estimated_cost_max=data['estimated_cost_max'],
+            estimated_cost_min=cost_min,
+            estimated_cost_max=cost_max,
             client_name=data.get('client_name'),
             client_email=data.get('client_email'),
             client_phone=data.get('client_phone')
         )
         
         db.session.add(lead)
+        db.session.flush()
+        # Agrégats statistiques mis à jour dans la même transaction
+        record_leads(db.session.connection(), [{
+            'address': lead.address,
+            'estimated_cost_min': lead.estimated_cost_min,
+            'estimated_cost_max': lead.estimated_cost_max,
+            'timestamp': lead.timestamp
+        }])
         db.session.commit()
         
-        return jsonify(lead.to_dict()), 201
+        return instance_response(lead), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@estimation_bp.route('/leads/bulk', methods=['POST'])
+def create_leads_bulk():
+    """
+    Import en masse de leads : corps CSV, NDJSON ou JSON (selon Content-Type
+    ou ``format``), lu au fil de l'eau et inséré par lots de ``batch_size``
+    lignes. Les lignes invalides sont rejetées individuellement.
+    """
+    try:
+        input_format = request.args.get('format') or INPUT_FORMATS.get(request.mimetype, 'json')
+        if input_format not in INPUT_FORMATS.values():
+            return jsonify({'error': f'Format non supporté: {input_format}'}), 400
+        batch_size = request.args.get('batch_size', LEAD_IMPORT_BATCH_SIZE, type=int)
+
+        return jsonify(import_leads(request.stream, input_format, batch_size)), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@estimation_bp.cli.command('import-leads')
+@click.argument('input_file', type=click.File('rb'))
+@click.option('--format', 'input_format', type=click.Choice(['json', 'ndjson', 'csv']), default='csv')
+@click.option('--batch-size', type=int, default=LEAD_IMPORT_BATCH_SIZE, help='Lignes par transaction')
+def import_leads_command(input_file, input_format, batch_size):
+    """Importe un fichier de leads et affiche le rapport (débit en lignes/s)"""
+    report = import_leads(input_file, input_format, batch_size)
+    click.echo(json.dumps(report))
+
 @estimation_bp.route('/leads', methods=['GET'])
 def get_leads():
     """
-    Endpoint pour récupérer tous les leads
+    Endpoint pour récupérer les leads (pagination par curseur, projection
+    via ``fields`` et streaming NDJSON via ``format=ndjson``)
     """
     try:
-        leads = Lead.query.order_by(Lead.timestamp.desc()).all()
-        return jsonify([lead.to_dict() for lead in leads]), 200
+        return list_response(Lead, request.args), 200
         
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@estimation_bp.route('/leads/export', methods=['GET'])
+def export_leads():
+    """
+    Export en flux des leads (``format=csv|ndjson|parquet``, ``compress=gzip``),
+    incrémental depuis ``since`` ; filigrane suivant dans X-Export-Watermark
+    """
+    try:
+        return export_response(Lead, request.args), 200
+
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@estimation_bp.cli.command('export-leads')
+@click.argument('output', type=click.File('wb'))
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'ndjson', 'parquet']), default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help='Compresse la sortie en gzip')
+@click.option('--since', default=None, help='Filigrane ISO 8601 (prioritaire sur --state-file)')
+@click.option('--state-file', default=None, help='Fichier JSON du filigrane, relu puis mis à jour')
+def export_leads_command(output, output_format, compress, since, state_file):
+    """Exporte les leads (incrémental avec --since ou --state-file)"""
+    args = {'format': output_format, 'compress': 'gzip' if compress else None, 'since': since}
+    rows, watermark = export_to_file(Lead, args, output, state_file)
+    click.echo(f'{rows} leads exportés, filigrane {watermark.isoformat()}', err=True)
+
+@estimation_bp.route('/leads/nearby', methods=['GET'])
+def get_nearby_leads():
+    """Leads dans un rayon autour de ``lat``/``lng``, du plus proche au plus lointain"""
+    try:
+        return nearby_response(Lead, request.args), 200
+
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@estimation_bp.route('/leads/within', methods=['GET'])
+def get_leads_within():
+    """Leads dans une boîte englobante ``bbox=sud,ouest,nord,est``"""
+    try:
+        return within_response(Lead, request.args), 200
+
+    except SpatialQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@estimation_bp.route('/leads/duplicates', methods=['GET'])
+def get_duplicate_leads():
+    """Leads en double : grappes de doublons, ou doublons de ``address``"""
+    try:
+        return duplicates_response(Lead, request.args), 200
+
+    except DuplicateQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,80 +1,320 @@
 from flask import Blueprint, jsonify, request
-import requests
+from src.services.cache import ResponseCache, address_key, location_key
+from src.models.lead import Lead
+from src.models.solar import RoofGeometry
+from src.models.user import db
+from src.services import metrics, solar_store
+from src.services.duplicates import known_location
+from src.services.http_client import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError
+from src.services.jobs import job_queue
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 google_api_bp = Blueprint('google_api', __name__)
+# Réponses différées (Prefer: respond-async) exécutées par la file de tâches
+google_api_bp.record_once(lambda state: job_queue.init_app(state.app))
 
 # Récupération de la clé API depuis les variables d'environnement
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 
+# Configuration du cache des réponses Google
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', 7 * 24 * 3600))  # secondes
+SOLAR_CACHE_TTL = int(os.getenv('SOLAR_CACHE_TTL', 30 * 24 * 3600))
+GOOGLE_CACHE_SIZE = int(os.getenv('GOOGLE_CACHE_SIZE', 2048))  # entrées par cache
+GOOGLE_CACHE_DB = os.getenv('GOOGLE_CACHE_DB')  # chemin SQLite, niveau persistant désactivé si absent
+SOLAR_CACHE_PRECISION = int(os.getenv('SOLAR_CACHE_PRECISION', 5))  # décimales de lat/lng
+
+# URL des API amont (surchargeables pour pointer vers un serveur de test local)
+GEOCODING_URL = os.getenv('GOOGLE_GEOCODING_URL', 'https://maps.googleapis.com/maps/api/geocode/json')
+SOLAR_URL = os.getenv('GOOGLE_SOLAR_URL', 'https://solar.googleapis.com/v1/buildingInsights:findClosest')
+
+# Configuration des clients HTTP amont
+GOOGLE_POOL_SIZE = int(os.getenv('GOOGLE_POOL_SIZE', 10))  # connexions keep-alive par hôte
+GOOGLE_CONNECT_TIMEOUT = float(os.getenv('GOOGLE_CONNECT_TIMEOUT', 3.05))  # secondes
+GOOGLE_READ_TIMEOUT = float(os.getenv('GOOGLE_READ_TIMEOUT', 10))
+GOOGLE_MAX_RETRIES = int(os.getenv('GOOGLE_MAX_RETRIES', 2))
+GOOGLE_BREAKER_THRESHOLD = int(os.getenv('GOOGLE_BREAKER_THRESHOLD', 5))  # échecs consécutifs
+GOOGLE_BREAKER_RESET = float(os.getenv('GOOGLE_BREAKER_RESET', 30))  # secondes avant essai
+
+
+def _make_client(name):
+    return UpstreamClient(
+        name,
+        pool_size=GOOGLE_POOL_SIZE,
+        connect_timeout=GOOGLE_CONNECT_TIMEOUT,
+        read_timeout=GOOGLE_READ_TIMEOUT,
+        max_retries=GOOGLE_MAX_RETRIES,
+        breaker=CircuitBreaker(GOOGLE_BREAKER_THRESHOLD, GOOGLE_BREAKER_RESET)
+    )
+
+
+geocoding_client = _make_client('geocoding')
+solar_client = _make_client('solar')
+
+geocode_cache = ResponseCache(GEOCODE_CACHE_TTL, GOOGLE_CACHE_SIZE, GOOGLE_CACHE_DB)
+solar_cache = ResponseCache(SOLAR_CACHE_TTL, GOOGLE_CACHE_SIZE, GOOGLE_CACHE_DB)
+
+
+GEOCODE_ERROR = 'Erreur lors de l\'appel à l\'API Google'
+SOLAR_ERROR = 'Erreur lors de l\'appel à l\'API Solar'
+# Statuts Geocoding d'une réponse valide (mise en cache), les autres sont des erreurs
+GEOCODE_OK_STATUSES = ('OK', 'ZERO_RESULTS')
+
+
+class GoogleApiError(Exception):
+    """Réponse en erreur de l'API Google (jamais mise en cache)"""
+
+
+def geocode_request(address):
+    """URL et paramètres d'un appel à l'API Google Geocoding"""
+    return GEOCODING_URL, {
+        'address': address,
+        'key': GOOGLE_API_KEY
+    }
+
+
+def solar_request(lat, lng):
+    """URL et paramètres d'un appel à l'API Google Solar"""
+    return SOLAR_URL, {
+        'location.latitude': lat,
+        'location.longitude': lng,
+        'key': GOOGLE_API_KEY
+    }
+
+
+def parse_response(response, error_message):
+    """Décode une réponse amont (requests ou httpx), en erreur si statut != 200"""
+    if response.status_code != 200:
+        raise GoogleApiError(error_message)
+
+    return response.json()
+
+
+def parse_geocode(response):
+    """
+    Décode une réponse Geocoding : l'API signale aussi ses erreurs
+    (OVER_QUERY_LIMIT, REQUEST_DENIED...) en HTTP 200, par ``status``
+    """
+    geocoding_data = parse_response(response, GEOCODE_ERROR)
+    if geocoding_data.get('status') not in GEOCODE_OK_STATUSES:
+        raise GoogleApiError(f"{GEOCODE_ERROR} ({geocoding_data.get('status')})")
+    return geocoding_data
+
+
+def fetch_geocode(address):
+    """Appel à l'API Google Geocoding"""
+    url, params = geocode_request(address)
+    response = geocoding_client.get(url, params=params)
+    return parse_geocode(response)
+
+
+def fetch_solar(lat, lng):
+    """Appel à l'API Google Solar"""
+    url, params = solar_request(lat, lng)
+    response = solar_client.get(url, params=params)
+    return parse_response(response, SOLAR_ERROR)
+
+
+def lookup_solar(lat, lng):
+    """Analyse déjà obtenue à proximité (voir src/services/solar_store.py), sinon appel amont enregistré"""
+    # Aucune transaction ouverte pendant l'appel amont
+    with db.engine.connect() as connection:
+        solar_data = solar_store.find_nearest(connection, lat, lng)
+    return solar_data if solar_data is not None else fetch_and_record_solar(lat, lng)
+
+
+def fetch_and_record_solar(lat, lng):
+    """Appel à l'API Google Solar, réponse enregistrée pour être réutilisée"""
+    solar_data = fetch_solar(lat, lng)
+    with db.engine.begin() as connection:
+        solar_store.record(connection, lat, lng, solar_data)
+    return solar_data
+
+
+def geocode_location(geocoding_data):
+    """(lat, lng) du premier résultat de géocodage, (None, None) sans résultat"""
+    results = geocoding_data.get('results') or []
+    if not results:
+        return None, None
+    location = results[0]['geometry']['location']
+    return location['lat'], location['lng']
+
+
+def roof_geometry(lat, lng):
+    """
+    Géométrie du toit à cette position (RoofGeometry) : mémoire, puis
+    colonnes extraites en base, puis appel Solar enregistré. None si elle
+    n'est pas connue et que la clé API manque.
+    """
+    key = location_key(lat, lng, SOLAR_CACHE_PRECISION)
+    geometry = solar_store.geometry_cache.get(key)
+    if geometry is not None:
+        return geometry
+    with db.engine.connect() as connection:
+        geometry = solar_store.find_geometry(connection, lat, lng)
+    if geometry is None:
+        if not GOOGLE_API_KEY:
+            return None
+        solar_data = solar_cache.get_or_fetch(key, lambda: fetch_and_record_solar(lat, lng))
+        geometry = RoofGeometry.from_response(solar_data)
+    return solar_store.remember_geometry(key, geometry)
+
+
+def resolve_roof(address, lat=None, lng=None):
+    """
+    Position (reprise d'un lead de même adresse ou géocodée si absente) et
+    géométrie du toit d'une adresse :
+    (lat, lng, RoofGeometry). Les éléments indisponibles valent None ; une
+    panne amont n'empêche pas l'estimation, qui retombe sur ses valeurs par défaut.
+    """
+    try:
+        if lat is None or lng is None:
+            # Adresse déjà saisie pour un lead (même clé canonique) : sa position est reprise
+            lat, lng = known_location(Lead, address)
+            if lat is not None:
+                return lat, lng, roof_geometry(lat, lng)
+            if not GOOGLE_API_KEY:
+                return None, None, None
+            geocoding_data = geocode_cache.get_or_fetch(address_key(address), lambda: fetch_geocode(address))
+            lat, lng = geocode_location(geocoding_data)
+            if lat is None:
+                return None, None, None
+        return lat, lng, roof_geometry(lat, lng)
+    except (CircuitOpenError, GoogleApiError, UpstreamError) as e:
+        logger.warning('Géométrie du toit indisponible pour %s: %s', address, e)
+        return lat, lng, None
+
+
+def cached_roof(address, lat=None, lng=None):
+    """
+    (lat, lng, RoofGeometry) quand la position et la géométrie du toit sont
+    déjà dans les caches (aucun appel amont), None sinon
+    """
+    if lat is None or lng is None:
+        geocoding_data = geocode_cache.get(address_key(address))
+        if geocoding_data is None:
+            return None
+        lat, lng = geocode_location(geocoding_data)
+        if lat is None:
+            return None
+    geometry = solar_store.geometry_cache.get(location_key(lat, lng, SOLAR_CACHE_PRECISION))
+    return (lat, lng, geometry) if geometry is not None else None
+
+
+def geocode_job(payload):
+    """Tâche geocode : réponse de géocodage, servie par le cache"""
+    address = payload['address']
+    return geocode_cache.get_or_fetch(address_key(address), lambda: fetch_geocode(address))
+
+
+def solar_job(payload):
+    """Tâche solar_analysis : réponse Solar, servie par le cache et les analyses enregistrées"""
+    lat, lng = payload['lat'], payload['lng']
+    return solar_cache.get_or_fetch(location_key(lat, lng, SOLAR_CACHE_PRECISION), lambda: lookup_solar(lat, lng))
+
+
+job_queue.register('geocode', geocode_job)
+job_queue.register('solar_analysis', solar_job)
+
+
+def respond_async():
+    """Le client accepte une réponse différée (en-tête Prefer: respond-async, RFC 7240)"""
+    return 'respond-async' in request.headers.get('Prefer', '') and not job_queue.saturated()
+
+
+def accepted(job_id):
+    """Réponse 202 d'une tâche enregistrée : son état est suivi sur /api/jobs/<id>"""
+    status_url = f'/api/jobs/{job_id}'
+    response = jsonify({'job_id': job_id, 'status': 'pending', 'status_url': status_url})
+    response.headers['Location'] = status_url
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response, 202
+
+
 @google_api_bp.route('/geocode', methods=['POST'])
 def geocode_address():
     """
-    Proxy pour l'API Google Geocoding
+    Proxy pour l'API Google Geocoding. Avec Prefer: respond-async, une
+    adresse absente du cache est géocodée en tâche de fond (202).
     """
     try:
         data = request.json
         address = data.get('address')
-        
+
         if not address:
             return jsonify({'error': 'Adresse requise'}), 400
-        
+
         if not GOOGLE_API_KEY:
             return jsonify({'error': 'Clé API Google non configurée'}), 500
-        
-        # Appel à l'API Google Geocoding
-        geocoding_url = 'https://maps.googleapis.com/maps/api/geocode/json'
-        params = {
-            'address': address,
-            'key': GOOGLE_API_KEY
-        }
-        
-        response = requests.get(geocoding_url, params=params)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Erreur lors de l\'appel à l\'API Google'}), 500
-        
-        geocoding_data = response.json()
-        
+
+        if respond_async() and geocode_cache.get(address_key(address)) is None:
+            return accepted(job_queue.enqueue('geocode', {'address': address}))
+
+        with metrics.phase('lookup'):
+            geocoding_data = geocode_cache.get_or_fetch(address_key(address), lambda: fetch_geocode(address))
+
         # Retourner les données de géocodage
-        return jsonify(geocoding_data), 200
-        
+        with metrics.phase('serialize'):
+            return jsonify(geocoding_data), 200
+
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503
+    except (GoogleApiError, UpstreamError) as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': f'Erreur lors du géocodage: {str(e)}'}), 500
 
 @google_api_bp.route('/solar-analysis', methods=['POST'])
 def solar_analysis():
     """
-    Proxy pour l'API Google Solar
+    Proxy pour l'API Google Solar. Avec Prefer: respond-async, une position
+    absente du cache est analysée en tâche de fond (202).
     """
     try:
         data = request.json
         lat = data.get('lat')
         lng = data.get('lng')
-        
+
         if not lat or not lng:
             return jsonify({'error': 'Latitude et longitude requises'}), 400
-        
+
         if not GOOGLE_API_KEY:
             return jsonify({'error': 'Clé API Google non configurée'}), 500
-        
-        # Appel à l'API Google Solar
-        solar_url = 'https://solar.googleapis.com/v1/buildingInsights:findClosest'
-        params = {
-            'location.latitude': lat,
-            'location.longitude': lng,
-            'key': GOOGLE_API_KEY
-        }
-        
-        response = requests.get(solar_url, params=params)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Erreur lors de l\'appel à l\'API Solar'}), 500
-        
-        solar_data = response.json()
-        
+
+        key = location_key(lat, lng, SOLAR_CACHE_PRECISION)
+        if respond_async() and solar_cache.get(key) is None:
+            return accepted(job_queue.enqueue('solar_analysis', {'lat': lat, 'lng': lng}))
+
+        solar_data = solar_cache.get_or_fetch(key, lambda: lookup_solar(lat, lng))
+
         # Retourner les données Solar
         return jsonify(solar_data), 200
-        
+
+    except CircuitOpenError as e:
+        return jsonify({'error': str(e)}), 503
+    except (GoogleApiError, UpstreamError) as e:
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': f'Erreur lors de l\'analyse solaire: {str(e)}'}), 500
+
+@google_api_bp.route('/google-cache/stats', methods=['GET'])
+def google_cache_stats():
+    """
+    Compteurs des caches de géocodage et Solar
+    """
+    return jsonify({
+        'geocode': geocode_cache.to_dict(),
+        'solar': solar_cache.to_dict()
+    }), 200
+
+@google_api_bp.route('/google-client/stats', methods=['GET'])
+def google_client_stats():
+    """
+    Latences, retries et état des disjoncteurs des clients amont
+    """
+    return jsonify({
+        'geocoding': geocoding_client.to_dict(),
+        'solar': solar_client.to_dict()
+    }), 200
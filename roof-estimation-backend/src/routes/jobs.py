@@ -0,0 +1,42 @@
+from flask import Blueprint, jsonify, request
+from src.models.job import Job
+from src.services.jobs import JobError, job_queue, wait_timeout
+import click
+import json
+
+jobs_bp = Blueprint('jobs', __name__)
+jobs_bp.record_once(lambda state: job_queue.init_app(state.app))
+# Pool de threads démarré à la première requête de chaque processus (tâches restées en attente)
+jobs_bp.before_app_request(job_queue.ensure_started)
+
+@jobs_bp.route('/jobs/stats', methods=['GET'])
+def get_job_stats():
+    """Configuration du pool, tâches par statut et compteurs du processus"""
+    return jsonify(job_queue.to_dict()), 200
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """État et résultat d'une tâche ; ``wait`` (secondes) attend qu'elle se termine (long-poll)"""
+    try:
+        job = job_queue.wait(job_id, wait_timeout(request.args))
+        if job is None:
+            return jsonify({'error': 'Tâche non trouvée'}), 404
+
+        return jsonify(Job.row_to_dict(job)), 200
+
+    except JobError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@jobs_bp.cli.command('work')
+@click.option('--workers', type=int, default=None, help='Threads (JOB_WORKERS par défaut)')
+def work_command(workers):
+    """Exécute les tâches de fond au premier plan (processus dédié)"""
+    job_queue.work(workers)
+
+@jobs_bp.cli.command('recover')
+def recover_command():
+    """Remet en attente les tâches au bail expiré et purge les tâches terminées anciennes"""
+    recovered, purged = job_queue.recover()
+    click.echo(json.dumps({'recovered': recovered, 'purged': purged}))
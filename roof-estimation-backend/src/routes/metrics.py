@@ -0,0 +1,37 @@
+from flask import Blueprint, Response, jsonify, request
+from src.routes.google_api import geocoding_client, solar_client
+from src.services import metrics
+import os
+
+# Jeton exigé pour modifier le profilage ; non défini : modification refusée
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+metrics_bp = Blueprint('metrics', __name__)
+
+metrics.registry.collectors.append(metrics.upstream_collector([geocoding_client, solar_client]))
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métriques du processus au format texte Prometheus"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@metrics_bp.route('/metrics/profiling', methods=['GET', 'POST'])
+def profiling():
+    """
+    État du profilage échantillonné ; en POST (en-tête Authorization:
+    Bearer <METRICS_TOKEN>), modifie sample_rate (0 à 1) à chaud
+    """
+    if request.method == 'GET':
+        return jsonify(metrics.profiler.to_dict()), 200
+
+    if not METRICS_TOKEN or request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Non autorisé'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        sample_rate = float(data.get('sample_rate'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_rate doit être un nombre'}), 400
+    if not 0 <= sample_rate <= 1:
+        return jsonify({'error': 'sample_rate doit être entre 0 et 1'}), 400
+    metrics.profiler.sample_rate = sample_rate
+    return jsonify(metrics.profiler.to_dict()), 200
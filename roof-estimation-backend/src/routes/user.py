@@ -1,12 +1,24 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, request, stream_with_context
+from sqlalchemy import select
 from src.models.user import User, db
+from src.utils.serializer import instance_response, public_fields, row_serializer
 
 user_bp = Blueprint('user', __name__)
 
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    # Lignes lues par projection et encodées directement en JSON, en flux
+    serializer = row_serializer(User, public_fields(User))
+    statement = select(*(User.__table__.c[name] for name in serializer.sources)).order_by(User.id)
+
+    def generate():
+        separator = '['
+        for rows in db.session.execute(statement).partitions(500):
+            yield separator + ','.join(serializer.encode(row) for row in rows)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -15,12 +27,12 @@ def create_user():
     user = User(username=data['username'], email=data['email'])
     db.session.add(user)
     db.session.commit()
-    return jsonify(user.to_dict()), 201
+    return instance_response(user), 201
 
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
-    return jsonify(user.to_dict())
+    return instance_response(user)
 
 @user_bp.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
@@ -29,7 +41,7 @@ def update_user(user_id):
     user.username = data.get('username', user.username)
     user.email = data.get('email', user.email)
     db.session.commit()
-    return jsonify(user.to_dict())
+    return instance_response(user)
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
@@ -0,0 +1,471 @@
+"""
+Serveur de production pré-forké.
+
+    python -m src.server [--workers 4] [--threads 4] [--port 5000]
+
+Le processus maître importe l'application et prépare une fois ce que
+chaque worker utiliserait (``preload``) : blueprints chargés à la demande
+(voir src/main.py), plan de tarification compilé et codec du graphe de
+questions, plans de sérialisation des listes, manifeste des fichiers
+statiques, table de routage. Il ouvre le socket d'écoute puis forke les workers : ces objets
+sont partagés en copie sur écriture. Le ramasse-miettes est désactivé
+dans le maître et les objets préchargés gelés (``gc.freeze``) avant le
+fork, pour que les collectes des workers ne réécrivent pas leurs pages.
+
+Chaque worker recrée ses ressources propres au processus (``post_fork``) :
+pool de connexions de la base, connexion du cache SQLite des réponses
+Google, pools HTTP amont. Il sert les requêtes avec SERVER_THREADS threads
+et, après SERVER_MAX_REQUESTS requêtes (plus un décalage aléatoire
+jusqu'à SERVER_MAX_REQUESTS_JITTER, pour ne pas tous les recycler
+ensemble), termine ses requêtes en cours et sort ; le maître le remplace.
+
+Signaux du maître :
+
+- TERM, INT : arrêt gracieux (requêtes en cours terminées, au plus
+  SERVER_GRACEFUL_TIMEOUT secondes) ;
+- QUIT : arrêt immédiat ;
+- HUP : rechargement gracieux. Règles de tarification et fichiers
+  statiques sont relus dans le maître, de nouveaux workers sont forkés,
+  puis les anciens arrêtés gracieusement. Le code Python préchargé n'est
+  pas relu : une mise à jour du code demande un redémarrage ;
+- TTIN, TTOU : un worker de plus, de moins.
+
+Avec un seul worker, les états de conversation sont gardés en mémoire et
+écrits en différé (SESSION_WRITE_BEHIND=true par défaut, voir
+src/services/session_store.py) : ce worker est alors le seul à servir les
+sessions. Le maître refuse de démarrer plusieurs workers avec l'écriture
+différée, ignore TTIN et, au rechargement, attend la sortie de l'ancien
+worker (états en attente écrits) avant de forker le nouveau. Avec
+plusieurs workers, deux réponses d'une même session peuvent être servies
+par deux workers : les états sont relus en base.
+
+La maintenance des sessions (MAINTENANCE_INTERVAL, une heure par défaut
+ici) ne tourne que dans le premier worker, et /metrics décrit le worker
+qui répond. Chaque worker exécute les tâches de fond
+(src/services/jobs.py) avec son propre pool de threads, démarré à sa
+première requête.
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('PORT', 5000))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))  # requêtes simultanées par worker
+SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 10000))  # 0 : pas de recyclage
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 1000))
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))  # secondes
+SERVER_KEEPALIVE = float(os.getenv('SERVER_KEEPALIVE', 5))  # secondes d'inactivité d'une connexion
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+SERVER_ACCESS_LOG = os.getenv('SERVER_ACCESS_LOG', 'false').lower() in ('1', 'true', 'yes')
+SERVER_LOG_LEVEL = os.getenv('SERVER_LOG_LEVEL', 'INFO')
+
+# Délai minimal entre deux remplacements d'un worker qui meurt au démarrage
+RESPAWN_BACKOFF = 1.0
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Connexions keep-alive bornées dans le temps et fermées pendant l'arrêt du worker"""
+
+    timeout = SERVER_KEEPALIVE
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.stopping:
+            self.close_connection = True
+
+    def log_request(self, *args, **kwargs):
+        if SERVER_ACCESS_LOG:
+            super().log_request(*args, **kwargs)
+
+    def log_error(self, format, *args):
+        # Une connexion keep-alive inactive qui expire n'est pas une erreur
+        if not format.startswith('Request timed out'):
+            super().log_error(format, *args)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Serveur WSGI d'un worker sur le socket hérité du maître : un pool fixe
+    de threads. Quand tous sont occupés, le worker cesse d'accepter et les
+    connexions en attente vont aux autres workers.
+    """
+
+    multithread = True
+
+    def __init__(self, app, listener, threads, handler=RequestHandler):
+        super().__init__(listener.getsockname()[0], 0, app, handler=handler, fd=listener.fileno())
+        # Tous les workers attendent sur le même socket : accept ne doit pas bloquer celui qui perd la course
+        self.socket.setblocking(False)
+        self.threads = threads
+        self.stopping = False
+        self._slots = threading.BoundedSemaphore(threads)
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process, request, client_address)
+        except BaseException:
+            self._slots.release()
+            self.shutdown_request(request)
+            raise
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self, timeout):
+        """Attend la fin des requêtes en cours ; False si le délai est dépassé"""
+        deadline = time.monotonic() + timeout
+        for _ in range(self.threads):
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+
+def preload(app):
+    """
+    Prépare dans le maître, avant le fork, ce que chaque worker chargerait
+    sinon pour lui-même à ses premières requêtes
+    """
+    from src.main import finish_setup
+    from src.models.conversation import ConversationSession
+    from src.models.lead import Lead
+    from src.models.user import User, db
+    from src.services.pricing import pricing_engine
+    from src.utils.serializer import public_fields, row_serializer
+
+    # Blueprints différés importés et schéma vérifié ici plutôt qu'à la première requête de chaque worker
+    finish_setup(app)
+    with app.app_context():
+        pricing_engine.current()
+        for model in (Lead, ConversationSession, User):
+            row_serializer(model, public_fields(model))
+        app.extensions['static_assets'].manifest
+        app.url_map.update()
+        # Aucune connexion du maître ne doit passer dans les workers
+        db.engine.dispose()
+
+
+def post_fork(app, index):
+    """Ressources propres au processus, recréées dans chaque worker après le fork"""
+    from src.models.user import db
+    from src.routes import google_api
+    from src.services.maintenance import session_maintenance
+
+    with app.app_context():
+        # Connexions héritées abandonnées sans être fermées (elles restent au maître)
+        db.engine.dispose(close=False)
+    for cache in (google_api.geocode_cache, google_api.solar_cache):
+        cache.after_fork()
+    for client in (google_api.geocoding_client, google_api.solar_client):
+        client.after_fork()
+    if index != 0:
+        session_maintenance.interval = 0
+
+
+class Worker:
+    """Processus worker : sert les requêtes jusqu'à l'arrêt ou au recyclage"""
+
+    def __init__(self, app, listener, index, threads, max_requests, graceful_timeout):
+        self.app = app
+        self.listener = listener
+        self.index = index
+        self.threads = threads
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.master_pid = os.getppid()
+        self.served = 0
+        self.server = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            served = self.served
+        if self.max_requests and served == self.max_requests:
+            logger.info('Worker %d recyclé après %d requêtes', os.getpid(), served)
+            self.stop()
+        return self.app(environ, start_response)
+
+    def stop(self, *args):
+        if self.server is not None and not self.server.stopping:
+            self.server.stopping = True
+            # shutdown() attend la fin de serve_forever : appelé hors de la boucle
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _watch_master(self):
+        while self.server is not None and not self.server.stopping:
+            if os.getppid() != self.master_pid:
+                logger.warning('Maître disparu, arrêt du worker %d', os.getpid())
+                self.stop()
+                return
+            time.sleep(1)
+
+    def run(self):
+        signal.set_wakeup_fd(-1)  # le tube de réveil reste au maître
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C : le maître coordonne l'arrêt
+        signal.signal(signal.SIGQUIT, lambda *args: os._exit(1))
+        for name in ('SIGHUP', 'SIGTTIN', 'SIGTTOU', 'SIGCHLD'):
+            signal.signal(getattr(signal, name), signal.SIG_DFL)
+        post_fork(self.app, self.index)
+
+        self.server = PooledWSGIServer(self, self.listener, self.threads)
+        threading.Thread(target=self._watch_master, name='watch-master', daemon=True).start()
+        self.server.serve_forever()
+        if not self.server.drain(self.graceful_timeout):
+            logger.warning('Worker %d : requêtes interrompues après %.0f s', os.getpid(), self.graceful_timeout)
+
+    def exit(self, code):
+        """
+        Sortie du worker sans repasser par la pile du maître : tâches de fond
+        en cours terminées, états en attente écrits, journaux vidés
+        """
+        from src.services.jobs import job_queue
+        from src.services.session_store import session_store
+        job_queue.close()
+        try:
+            session_store.close()
+        except Exception as e:
+            logger.warning('Écriture des sessions à la sortie du worker en échec: %s', e)
+        logging.shutdown()
+        os._exit(code)
+
+
+class Master:
+    """Processus maître : socket d'écoute, workers forkés et signaux"""
+
+    SIGNALS = ('SIGTERM', 'SIGINT', 'SIGQUIT', 'SIGHUP', 'SIGTTIN', 'SIGTTOU', 'SIGCHLD')
+
+    def __init__(self, app, host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS, threads=SERVER_THREADS,
+                 max_requests=SERVER_MAX_REQUESTS, max_requests_jitter=SERVER_MAX_REQUESTS_JITTER,
+                 graceful_timeout=SERVER_GRACEFUL_TIMEOUT, backlog=SERVER_BACKLOG):
+        self.app = app
+        self.address = (host, port)
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.listener = None
+        self.children = {}  # pid -> index du worker
+        self.retiring = {}  # pid -> échéance de l'arrêt gracieux (rechargement)
+        self._signals = []
+        self._respawn_at = 0.0
+        # États de session en mémoire du worker (écriture différée) : jamais deux workers à la fois
+        from src.services.session_store import session_store
+        self.exclusive_sessions = session_store.write_behind
+
+    def listen(self):
+        family = socket.AF_INET6 if ':' in self.address[0] else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen(self.backlog)
+        listener.set_inheritable(True)
+        self.listener = listener
+        return listener.getsockname()[1]
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def spawn(self, index):
+        max_requests = self.max_requests
+        if max_requests:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return pid
+        code = 0
+        worker = Worker(self.app, self.listener, index, self.threads, max_requests, self.graceful_timeout)
+        try:
+            gc.enable()
+            worker.run()
+        except BaseException:
+            logger.exception('Worker %d arrêté sur erreur', os.getpid())
+            code = 1
+        worker.exit(code)
+
+    def _free_index(self):
+        used = set(self.children.values())
+        return next(index for index in range(len(used) + 1) if index not in used)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            index = self.children.pop(pid, None)
+            self.retiring.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0:
+                logger.warning('Worker %d (n° %s) sorti avec le code %d', pid, index, code)
+                self._respawn_at = time.monotonic() + RESPAWN_BACKOFF
+
+    def _maintain(self):
+        """Remplace les workers sortis (recyclés, plantés) et ajuste leur nombre"""
+        active = [pid for pid in self.children if pid not in self.retiring]
+        # Sessions exclusives : le remplaçant attend la sortie du worker qui s'arrête
+        running = list(self.children) if self.exclusive_sessions else active
+        if len(running) < self.workers and time.monotonic() >= self._respawn_at:
+            for _ in range(self.workers - len(running)):
+                self.spawn(self._free_index())
+        elif len(active) > self.workers:
+            for pid in sorted(active, key=self.children.get, reverse=True)[:len(active) - self.workers]:
+                self._retire(pid)
+        # Arrêt gracieux dépassé : le worker est tué
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                self._kill(pid, signal.SIGKILL)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _retire(self, pid):
+        if pid not in self.retiring:
+            self.retiring[pid] = time.monotonic() + self.graceful_timeout + 1
+            self._kill(pid, signal.SIGTERM)
+
+    def reload(self):
+        """Relit règles et fichiers statiques, puis remplace les workers un à un"""
+        from src.services.pricing import pricing_engine
+        logger.info('Rechargement : règles de tarification, fichiers statiques et workers')
+        pricing_engine.reload_if_changed()
+        self.app.extensions['static_assets'].reload()
+        preload(self.app)
+        gc.collect()
+        gc.freeze()
+        old = [pid for pid in self.children if pid not in self.retiring]
+        for pid in old:
+            if self.exclusive_sessions:
+                # Remplaçant forké par _maintain une fois les états de l'ancien écrits et l'ancien sorti
+                self._retire(pid)
+                continue
+            # Le nouveau worker reprend le numéro de l'ancien, qui n'accepte déjà plus rien
+            self.spawn(self.children[pid])
+            self._retire(pid)
+
+    def stop(self, graceful=True):
+        signum = signal.SIGTERM if graceful else signal.SIGQUIT
+        deadline = time.monotonic() + (self.graceful_timeout + 1 if graceful else 2)
+        for pid in list(self.children):
+            self._kill(pid, signum)
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            self._kill(pid, signal.SIGKILL)
+        while self.children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.children.pop(pid, None)
+        self.listener.close()
+
+    def run(self):
+        """Boucle du maître : signaux, remplacement des workers ; retourne à l'arrêt"""
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        for name in self.SIGNALS:
+            signal.signal(getattr(signal, name), self._on_signal)
+
+        preload(self.app)
+        gc.collect()
+        gc.freeze()
+        host, port = self.address[0], self.listener.getsockname()[1]
+        logger.info('Maître %d sur http://%s:%d : %d workers × %d threads',
+                    os.getpid(), host, port, self.workers, self.threads)
+        while True:
+            self._reap()
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT):
+                    logger.info('Arrêt %s', 'immédiat' if signum == signal.SIGQUIT else 'gracieux')
+                    self.stop(graceful=signum != signal.SIGQUIT)
+                    return
+                if signum == signal.SIGHUP:
+                    self.reload()
+                elif signum == signal.SIGTTIN and self.exclusive_sessions:
+                    logger.warning('TTIN ignoré : écriture différée des sessions, un seul worker possible')
+                elif signum == signal.SIGTTIN:
+                    self.workers += 1
+                elif signum == signal.SIGTTOU and self.workers > 1:
+                    self.workers -= 1
+            self._maintain()
+            select.select([wakeup_read], [], [], 1.0)
+            try:
+                while os.read(wakeup_read, 512):
+                    pass
+            except BlockingIOError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='requêtes simultanées par worker')
+    parser.add_argument('--max-requests', type=int, default=SERVER_MAX_REQUESTS, help='0 : pas de recyclage')
+    parser.add_argument('--max-requests-jitter', type=int, default=SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument('--graceful-timeout', type=float, default=SERVER_GRACEFUL_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=SERVER_LOG_LEVEL, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    if args.workers == 1:
+        # Lu à l'import de l'application : le seul worker sert toutes les sessions
+        os.environ.setdefault('SESSION_WRITE_BEHIND', 'true')
+    # Maintenance des sessions : désactivée par défaut hors de ce serveur, ici dans le premier worker (post_fork)
+    os.environ.setdefault('MAINTENANCE_INTERVAL', '3600')
+
+    # Les objets créés à l'import restent en place : pas de trous dans les pages partagées
+    gc.disable()
+    from src.main import app
+    from src.services.session_store import session_store
+
+    if session_store.write_behind and args.workers > 1:
+        parser.error('SESSION_WRITE_BEHIND=true exige un seul worker : les états de session sont locaux au processus')
+
+    master = Master(app, args.host, args.port, args.workers, args.threads, args.max_requests,
+                    args.max_requests_jitter, args.graceful_timeout)
+    master.listen()
+    master.run()
+
+
+if __name__ == '__main__':
+    main()
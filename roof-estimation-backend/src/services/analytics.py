@@ -0,0 +1,319 @@
+"""
+Statistiques des estimations pour les tableaux de bord.
+
+Les leads créés et les sessions terminées alimentent au fil de l'eau la
+table analytics_rollup : une ligne par (source, jour, type de toiture,
+état, région, tranche de coût) avec le nombre d'estimations et les sommes
+des coûts min/max, incrémentée par un upsert atomique dans la transaction
+qui écrit le lead ou la session. Le coût moyen (min+max)/2 est rangé dans
+des tranches géométriques de rapport ANALYTICS_BUCKET_RATIO : les
+percentiles sont lus sur cet histogramme à ±2,5 % près (rapport 1,05).
+
+Une requête sur une plage de dates ne lit que les agrégats (quelques
+centaines de lignes par jour au plus), jamais les leads ni les réponses
+des sessions. ``flask --app src.main analytics rebuild`` reconstruit la
+table à partir des données, par exemple après la première migration ; les
+écritures de leads et de sessions attendent la fin de la reconstruction.
+Un coût négatif ou non fini n'est pas comptabilisé.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from src.models.analytics import AnalyticsRollup
+from src.models.conversation import ConversationSession
+from src.models.lead import Lead
+from src.models.user import db
+from src.utils.address import department_code
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BUCKET_RATIO = float(os.getenv('ANALYTICS_BUCKET_RATIO', 1.05))
+ANALYTICS_DEFAULT_DAYS = int(os.getenv('ANALYTICS_DEFAULT_DAYS', 30))  # plage par défaut
+ANALYTICS_REBUILD_CHUNK_SIZE = 5000
+
+SOURCES = ('lead', 'session')
+GROUP_BY_FIELDS = ('day', 'roof_type', 'roof_condition', 'region')
+DEFAULT_PERCENTILES = (50, 90, 95)
+
+_table = AnalyticsRollup.__table__
+_KEY = ('source', 'day', 'roof_type', 'roof_condition', 'region', 'bucket')
+_LOG_RATIO = math.log(ANALYTICS_BUCKET_RATIO)
+_UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+class AnalyticsError(ValueError):
+    """Paramètre de requête statistique invalide (renvoyé en 400 par les routes)"""
+
+
+def cost_bucket(cost):
+    """Tranche géométrique d'un coût fini et positif ou nul (voir _cost)"""
+    return int(math.floor(math.log(cost) / _LOG_RATIO)) if cost > 1 else 0
+
+
+def bucket_cost(bucket):
+    """Valeur représentative (milieu géométrique) d'une tranche"""
+    return ANALYTICS_BUCKET_RATIO ** (bucket + 0.5)
+
+
+def _label(value):
+    return value[:50] if isinstance(value, str) else ''
+
+
+def _cost(value):
+    """Coût numérique fini et positif ou nul, sinon None (valeur absente ou invalide)"""
+    try:
+        cost = float(value)
+    except (TypeError, ValueError):
+        return None
+    return cost if math.isfinite(cost) and cost >= 0 else None
+
+
+def _fact(source, day, address, answers, cost_min, cost_max):
+    costs = _cost(cost_min), _cost(cost_max)
+    if None in costs:
+        # Les entrées sont validées (voir src/services/lead_import.py) : une ligne ancienne ou écrite à la main
+        if cost_min is not None and cost_max is not None:
+            logger.warning('Estimation %s écartée des statistiques, coûts invalides: %r, %r', source, cost_min, cost_max)
+        return None
+    cost_min, cost_max = costs
+    key = (
+        source,
+        day,
+        _label(answers.get('roof_type')),
+        _label(answers.get('roof_condition')),
+        department_code(address),
+        cost_bucket((cost_min + cost_max) / 2),
+    )
+    return key, cost_min, cost_max
+
+
+def _day(value):
+    return (value or datetime.utcnow()).date()
+
+
+def lead_fact(values):
+    """Fait d'un lead : valeurs address, estimated_cost_min/max et timestamp"""
+    return _fact('lead', _day(values.get('timestamp')), values.get('address'), {},
+                 values.get('estimated_cost_min'), values.get('estimated_cost_max'))
+
+
+def session_fact(session):
+    """Fait d'une session terminée (modèle ou SessionState), daté de sa dernière mise à jour"""
+    return _fact('session', _day(session.last_updated), session.address, session.get_conversation_data(),
+                 session.estimated_cost_min, session.estimated_cost_max)
+
+
+def _aggregate(facts, increments=None):
+    increments = {} if increments is None else increments
+    for fact in facts:
+        if fact is None:
+            continue
+        key, cost_min, cost_max = fact
+        total = increments.get(key)
+        if total is None:
+            increments[key] = [1, cost_min, cost_max]
+        else:
+            total[0] += 1
+            total[1] += cost_min
+            total[2] += cost_max
+    return increments
+
+
+def _rows(increments):
+    return [
+        dict(zip(_KEY, key), count=count, sum_min=sum_min, sum_max=sum_max)
+        for key, (count, sum_min, sum_max) in increments.items()
+    ]
+
+
+def _apply(connection, increments):
+    rows = _rows(increments)
+    if not rows:
+        return
+    insert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if insert is not None:
+        statement = insert(_table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(_KEY),
+            set_={
+                'count': _table.c.count + statement.excluded.count,
+                'sum_min': _table.c.sum_min + statement.excluded.sum_min,
+                'sum_max': _table.c.sum_max + statement.excluded.sum_max,
+            },
+        )
+        connection.execute(statement, rows)
+        return
+    # Autres moteurs : mise à jour, puis insertion si la clé n'existe pas encore
+    for row in rows:
+        condition = and_(*(_table.c[name] == row[name] for name in _KEY))
+        result = connection.execute(_table.update().where(condition).values(
+            count=_table.c.count + row['count'],
+            sum_min=_table.c.sum_min + row['sum_min'],
+            sum_max=_table.c.sum_max + row['sum_max'],
+        ))
+        if result.rowcount == 0:
+            connection.execute(_table.insert().values(**row))
+
+
+def record_leads(connection, leads):
+    """Comptabilise des leads insérés, dans la transaction de leur insertion"""
+    _apply(connection, _aggregate(lead_fact(values) for values in leads))
+
+
+def record_sessions(connection, sessions):
+    """Comptabilise des sessions qui viennent de se terminer, dans la transaction qui les écrit"""
+    _apply(connection, _aggregate(session_fact(session) for session in sessions))
+
+
+def _lock(connection):
+    """
+    Verrou des upserts (_apply) tenu jusqu'à la fin de la transaction : les
+    écritures de leads et de sessions attendent la fin de la reconstruction
+    au lieu de voir leurs incréments effacés par elle
+    """
+    if connection.dialect.name == 'postgresql':
+        # En conflit avec les écritures (ROW EXCLUSIVE), pas avec les lectures de summary
+        connection.exec_driver_sql(f'LOCK TABLE {_table.name} IN SHARE ROW EXCLUSIVE MODE')
+    # SQLite : cette première écriture prend le verrou d'écriture de la base
+    connection.execute(_table.delete())
+
+
+def rebuild(chunk_size=ANALYTICS_REBUILD_CHUNK_SIZE):
+    """
+    Reconstruit tous les agrégats en une transaction, verrou des incréments
+    pris avant de lire les leads et les sessions (voir _lock) ; retourne le
+    nombre de lignes d'agrégat
+    """
+    leads = Lead.__table__
+    sessions = ConversationSession.__table__
+    increments = {}
+    with db.engine.begin() as connection:
+        _lock(connection)
+        streaming = connection.execution_options(stream_results=True, yield_per=chunk_size)
+        result = streaming.execute(select(
+            leads.c.address, leads.c.estimated_cost_min, leads.c.estimated_cost_max, leads.c.timestamp
+        ))
+        for rows in result.partitions(chunk_size):
+            _aggregate((lead_fact(row._mapping) for row in rows), increments)
+
+        result = streaming.execute(select(
+            sessions.c.address, sessions.c.conversation_data, sessions.c.conversation_answers,
+            sessions.c.estimated_cost_min, sessions.c.estimated_cost_max, sessions.c.last_updated,
+        ).where(sessions.c.is_completed.is_(True)))
+        for rows in result.partitions(chunk_size):
+            _aggregate((
+                _fact('session', _day(row.last_updated), row.address,
+                      ConversationSession.decode_conversation_data(row.conversation_data, row.conversation_answers),
+                      row.estimated_cost_min, row.estimated_cost_max)
+                for row in rows
+            ), increments)
+
+        rows = _rows(increments)
+        if rows:
+            connection.execute(_table.insert(), rows)
+    return len(rows)
+
+
+def _parse_date(args, name, default):
+    value = args.get(name)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise AnalyticsError(f'Date AAAA-MM-JJ attendue pour {name}: {value}')
+
+
+def _parse_list(args, name, allowed, default):
+    value = args.get(name)
+    if value is None:
+        return list(default)
+    selected = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in selected if item not in allowed]
+    if unknown:
+        raise AnalyticsError(f'{name} inconnu(s): {", ".join(unknown)} (possibles: {", ".join(allowed)})')
+    return selected
+
+
+def _parse_percentiles(args):
+    value = args.get('percentiles')
+    if value is None:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise AnalyticsError('percentiles attend des nombres séparés par des virgules')
+    if any(not 0 < percentile <= 100 for percentile in percentiles):
+        raise AnalyticsError('percentiles doivent être dans ]0, 100]')
+    return percentiles
+
+
+def _percentile(histogram, count, percentile):
+    rank = percentile / 100 * count
+    seen = 0
+    for bucket, bucket_count in histogram:
+        seen += bucket_count
+        if seen >= rank:
+            return round(bucket_cost(bucket))
+    return round(bucket_cost(histogram[-1][0]))
+
+
+def summary(args):
+    """
+    Statistiques sur ``since`` ≤ jour ≤ ``until`` (AAAA-MM-JJ, 30 derniers
+    jours par défaut) par source et selon ``group_by`` (day, roof_type,
+    roof_condition, region), filtrables par ``source``, ``roof_type``,
+    ``roof_condition`` et ``region`` : nombre, coûts moyens et percentiles.
+    """
+    until = _parse_date(args, 'until', datetime.utcnow().date())
+    since = _parse_date(args, 'since', until - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+    if since > until:
+        raise AnalyticsError('since doit précéder until')
+    sources = _parse_list(args, 'source', SOURCES, SOURCES)
+    group_by = _parse_list(args, 'group_by', GROUP_BY_FIELDS, ())
+    percentiles = _parse_percentiles(args)
+
+    group_columns = [_table.c.source] + [_table.c[name] for name in group_by]
+    conditions = [_table.c.source.in_(sources), _table.c.day >= since, _table.c.day <= until]
+    for name in ('roof_type', 'roof_condition', 'region'):
+        if name in args:
+            conditions.append(_table.c[name] == args[name])
+    statement = (
+        select(*group_columns, _table.c.bucket, func.sum(_table.c.count),
+               func.sum(_table.c.sum_min), func.sum(_table.c.sum_max))
+        .where(*conditions)
+        .group_by(*group_columns, _table.c.bucket)
+        .order_by(*group_columns, _table.c.bucket)
+    )
+
+    groups = {}
+    for row in db.session.execute(statement):
+        key = tuple(row[:len(group_columns)])
+        bucket, count, sum_min, sum_max = row[len(group_columns):]
+        group = groups.setdefault(key, [0, 0.0, 0.0, []])
+        group[0] += count
+        group[1] += sum_min
+        group[2] += sum_max
+        group[3].append((bucket, count))
+
+    items = []
+    for key, (count, sum_min, sum_max, histogram) in groups.items():
+        item = {'source': key[0]}
+        for name, value in zip(group_by, key[1:]):
+            item[name] = value.isoformat() if isinstance(value, date) else value
+        item['count'] = count
+        item['avg_cost_min'] = round(sum_min / count)
+        item['avg_cost_max'] = round(sum_max / count)
+        item['cost_percentiles'] = {
+            f'p{percentile:g}': _percentile(histogram, count, percentile) for percentile in percentiles
+        }
+        items.append(item)
+    return {
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+        'group_by': group_by,
+        'items': items,
+    }
@@ -0,0 +1,129 @@
+"""
+Encodage binaire compact des réponses d'une conversation.
+
+Les réponses sont presque toutes des valeurs d'options du catalogue de
+questions : elles sont stockées en petits codes entiers plutôt qu'en JSON.
+Le format est un octet de version suivi, dans l'ordre du catalogue, de :
+
+- question à choix unique : un octet, 0 si absente, sinon rang de l'option + 1 ;
+- question à choix multiple : un masque de bits (bit 0 : réponse présente,
+  bit k + 1 : option k sélectionnée), sur le nombre d'octets nécessaire.
+
+Les codes dépendent du rang des options : le catalogue ne doit évoluer
+qu'en ajoutant des questions ou des options à la fin (une option qui fait
+grandir un masque d'un octet impose une nouvelle FORMAT_VERSION et une
+migration). L'encodage est sans perte : un jeu de réponses qu'il ne sait
+pas reproduire à l'identique (valeur hors catalogue, liste hors de l'ordre
+des options, clé inconnue) n'est pas encodé et reste stocké en JSON.
+"""
+
+from functools import lru_cache
+import json
+
+FORMAT_VERSION = 1
+ANSWER_JSON_CACHE_SIZE = 16384  # combinaisons de réponses dont le JSON est gardé
+
+_MISSING = object()
+
+
+class _Choice:
+    def __init__(self, question_id, options):
+        self.question_id = question_id
+        self.width = 1
+        self.codes = {option: code for code, option in enumerate(options, start=1)}
+        self.values = (_MISSING,) + tuple(options)
+
+    def encode(self, value, packed):
+        if value is _MISSING:
+            packed.append(0)
+            return True
+        code = self.codes.get(value) if isinstance(value, str) else None
+        if code is None:
+            return False
+        packed.append(code)
+        return True
+
+    def decode(self, packed, offset):
+        return self.values[packed[offset]]
+
+
+class _MultipleChoice:
+    def __init__(self, question_id, options):
+        self.question_id = question_id
+        self.width = (len(options) + 1 + 7) // 8
+        self.bits = {option: 1 << position for position, option in enumerate(options, start=1)}
+
+    def encode(self, value, packed):
+        if value is _MISSING:
+            packed.extend(bytes(self.width))
+            return True
+        if not isinstance(value, list):
+            return False
+        mask = 1
+        previous = 0
+        for element in value:
+            bit = self.bits.get(element) if isinstance(element, str) else None
+            # Doublon ou ordre différent du catalogue : non reproductible au décodage
+            if bit is None or bit <= previous:
+                return False
+            mask |= bit
+            previous = bit
+        packed.extend(mask.to_bytes(self.width, 'little'))
+        return True
+
+    def decode(self, packed, offset):
+        mask = int.from_bytes(packed[offset:offset + self.width], 'little')
+        if not mask & 1:
+            return _MISSING
+        return [option for option, bit in self.bits.items() if mask & bit]
+
+
+class AnswerCodec:
+    """Encodeur/décodeur des réponses pour un catalogue de questions"""
+
+    def __init__(self, questions):
+        self.fields = []
+        for question_id, question in questions.items():
+            options = [option['value'] for option in question.get('options', [])]
+            field_type = _MultipleChoice if question.get('type') == 'multiple_choice' else _Choice
+            if field_type is _Choice and len(options) > 255:
+                raise ValueError(f'Trop d\'options pour un octet: {question_id}')
+            self.fields.append(field_type(question_id, options))
+        self.order = {field.question_id: position for position, field in enumerate(self.fields)}
+        self._json = lru_cache(maxsize=ANSWER_JSON_CACHE_SIZE)(lambda packed: json.dumps(self.decode(packed)))
+
+    def encode(self, answers):
+        """Retourne les réponses encodées, ou None si l'encodage perdrait de l'information"""
+        position = -1
+        for question_id in answers:
+            # Les clés doivent être connues et dans l'ordre du catalogue (ordre du dict restitué)
+            next_position = self.order.get(question_id, -1) if isinstance(question_id, str) else -1
+            if next_position <= position:
+                return None
+            position = next_position
+
+        packed = bytearray((FORMAT_VERSION,))
+        for field in self.fields:
+            if not field.encode(answers.get(field.question_id, _MISSING), packed):
+                return None
+        return bytes(packed)
+
+    def to_json(self, packed):
+        """Texte JSON des réponses encodées (mémorisé : les combinaisons se répètent)"""
+        return self._json(bytes(packed))
+
+    def decode(self, packed):
+        """Reconstruit le dictionnaire de réponses"""
+        if not packed or packed[0] != FORMAT_VERSION:
+            raise ValueError('Réponses encodées dans un format inconnu')
+        answers = {}
+        offset = 1
+        for field in self.fields:
+            # Un blob plus court provient d'un catalogue antérieur : questions ajoutées absentes
+            if offset + field.width > len(packed):
+                break
+            value = field.decode(packed, offset)
+            if value is not _MISSING:
+                answers[field.question_id] = value
+            offset += field.width
+        return answers
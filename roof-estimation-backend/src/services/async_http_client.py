@@ -0,0 +1,66 @@
+"""
+Client HTTP asynchrone (httpx) pour le mode ASGI.
+
+Il réutilise la configuration, le disjoncteur et les métriques d'un
+``UpstreamClient`` synchrone : l'état de santé d'une API amont est le même
+quel que soit le mode de service qui l'appelle.
+"""
+from src.services.http_client import RETRY_STATUSES, CircuitOpenError, UpstreamError
+import asyncio
+import httpx
+import time
+
+
+class AsyncUpstreamClient:
+    """Pendant asynchrone d'UpstreamClient, avec pool httpx keep-alive"""
+
+    def __init__(self, sync_client):
+        self.sync_client = sync_client
+        self.name = sync_client.name
+        self.breaker = sync_client.breaker
+        self.stats = sync_client.stats
+        connect_timeout, read_timeout = sync_client.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=sync_client.pool_size)
+        )
+
+    async def get(self, url, params=None):
+        """GET avec la même politique de retries et de disjoncteur que le client synchrone"""
+        if not self.breaker.allow():
+            self.stats.incr('rejected')
+            raise CircuitOpenError(f'{self.name}: service amont temporairement indisponible')
+
+        try:
+            response = await self._attempts(url, params)
+        except BaseException:
+            # Comme le client synchrone : tout échec (annulation comprise) est compté
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def _attempts(self, url, params):
+        for attempt in range(self.sync_client.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.HTTPError as e:
+                self.stats.observe(time.perf_counter() - started, error=True)
+                failure = UpstreamError(f'{self.name}: {e.__class__.__name__}')
+                response = None
+            else:
+                retryable = response.status_code in RETRY_STATUSES
+                self.stats.observe(time.perf_counter() - started, error=retryable)
+                if not retryable:
+                    return response
+                failure = UpstreamError(f'{self.name}: HTTP {response.status_code}')
+
+            if attempt < self.sync_client.max_retries:
+                self.stats.incr('retries')
+                await asyncio.sleep(self.sync_client.backoff(attempt, response))
+
+        raise failure
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,181 @@
+"""
+Estimation vectorisée d'un lot de jeux de réponses.
+
+Les réponses sont encodées en indices entiers, les tables du plan de
+tarification en tableaux NumPy, puis min/max sont calculés colonne par
+colonne en reprenant exactement l'ordre des opérations de
+``PricingPlan.evaluate`` : les résultats sont identiques bit à bit à ceux du
+calcul scalaire.
+"""
+import math
+import random
+import numpy as np
+from src.utils.records import iter_records
+
+BATCH_CHUNK_SIZE = 1024
+
+# Colonnes attendues en entrée CSV ; roof_elements est une liste séparée par ';'
+CSV_ELEMENT_SEPARATOR = ';'
+
+
+class _Encoding:
+    """Table d'une réponse à choix unique encodée en tableau indexé"""
+
+    def __init__(self, answer, table, default_key, unknown):
+        self.answer = answer
+        self.keys = list(table)
+        self.index = {key: position for position, key in enumerate(self.keys)}
+        self.default_key = default_key
+        # Dernière case : valeur utilisée pour une réponse inconnue ou absente sans défaut
+        self.unknown_index = len(self.keys)
+        self.values = list(table.values()) + [unknown]
+        # Colonne unique (facteur) ou deux colonnes (min, max)
+        self.array = np.asarray(self.values, dtype=np.float64)
+
+    def encode(self, answers):
+        value = answers.get(self.answer, self.default_key)
+        if not isinstance(value, str):
+            return self.unknown_index
+        return self.index.get(value, self.unknown_index)
+
+    def column(self, position=None):
+        return self.array if position is None else self.array[:, position]
+
+
+class BatchEstimator:
+    """Évaluateur vectorisé d'un PricingPlan (voir src/services/pricing.py)"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.material = _Encoding(plan.material_answer, plan.material_costs, plan.material_default,
+                                  plan.material_costs[plan.material_default])
+        self.labor_factors = [
+            _Encoding(answer, values, default, unknown)
+            for answer, default, values, unknown in plan.labor_factors
+        ]
+        self.additional_costs = [
+            _Encoding(answer, costs, default, unknown)
+            for answer, default, costs, unknown in plan.additional_costs
+        ]
+        # Un ajustement absent ou inconnu vaut (1.0, 1.0) : multiplier par 1.0 ne change aucun bit
+        self.adjustments = [
+            _Encoding(answer, values, None, (1.0, 1.0))
+            for answer, values in plan.adjustments
+        ]
+        self.encodings = [self.material] + self.labor_factors + self.additional_costs + self.adjustments
+
+    def encode(self, answers):
+        """Encode un jeu de réponses en indices entiers"""
+        elements = answers.get(self.plan.complexity_answer, [])
+        if not isinstance(elements, list):
+            elements = []
+        codes = tuple(encoding.encode(answers) for encoding in self.encodings)
+        return codes + tuple(element in elements for element, _ in self.plan.complexity_increments)
+
+    def evaluate(self, roof_areas, codes):
+        """Calcule (min, max) pour des surfaces et des réponses encodées"""
+        plan = self.plan
+        area = np.asarray(roof_areas, dtype=np.float64)
+        columns = np.asarray(codes, dtype=np.int64).reshape(len(area), -1)
+        column_iter = iter(columns.T)
+
+        material = next(column_iter)
+        labor_hours_per_sqm = plan.hours_per_sqm
+        for encoding in self.labor_factors:
+            labor_hours_per_sqm = labor_hours_per_sqm * encoding.column()[next(column_iter)]
+        labor_cost = area * labor_hours_per_sqm * plan.cost_per_hour
+
+        total_min = area * self.material.column(0)[material] + labor_cost
+        total_max = area * self.material.column(1)[material] + labor_cost
+        for encoding in self.additional_costs:
+            index = next(column_iter)
+            total_min = total_min + area * encoding.column(0)[index]
+            total_max = total_max + area * encoding.column(1)[index]
+
+        adjustment_columns = [next(column_iter) for _ in self.adjustments]
+
+        # x + 0.0 == x : ajouter 0 pour un élément absent ne change aucun bit
+        complexity_factor = np.full(len(area), 1.0)
+        for _, increment in plan.complexity_increments:
+            complexity_factor = complexity_factor + np.where(next(column_iter), increment, 0.0)
+        total_min = total_min * complexity_factor
+        total_max = total_max * complexity_factor
+
+        for encoding, index in zip(self.adjustments, adjustment_columns):
+            total_min = total_min * encoding.column(0)[index]
+            total_max = total_max * encoding.column(1)[index]
+
+        return np.ceil(total_min).astype(np.int64), np.ceil(total_max).astype(np.int64)
+
+    def estimate(self, items, chunk_size=BATCH_CHUNK_SIZE):
+        """
+        Estime un flux d'éléments ``{'address', 'roof_area_sqm', 'answers'}``
+        par tranches et produit un résultat (ou une erreur) par élément.
+        """
+        chunk = []
+        for row, item in enumerate(items):
+            chunk.append((row, item))
+            if len(chunk) >= chunk_size:
+                yield from self._estimate_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._estimate_chunk(chunk)
+
+    def _estimate_chunk(self, chunk):
+        valid, areas, codes, results = [], [], [], {}
+        for row, item in chunk:
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError('Élément invalide')
+                answers = item.get('answers', item)
+                if not isinstance(answers, dict):
+                    raise ValueError('answers doit être un objet')
+                # Même repli que le calcul scalaire pour une surface absente
+                area = float(item.get('roof_area_sqm') or random.randint(80, 180))
+                if not math.isfinite(area) or area <= 0:
+                    raise ValueError('roof_area_sqm doit être un nombre positif')
+                codes.append(self.encode(answers))
+            except (TypeError, ValueError) as e:
+                results[row] = {'row': row, 'error': str(e)}
+                continue
+            valid.append((row, item, area))
+            areas.append(area)
+
+        if valid:
+            totals_min, totals_max = self.evaluate(areas, codes)
+            for (row, item, area), cost_min, cost_max in zip(valid, totals_min.tolist(), totals_max.tolist()):
+                results[row] = {
+                    'row': row,
+                    'address': item.get('address'),
+                    'roof_area_sqm': area,
+                    'estimated_cost_min': cost_min,
+                    'estimated_cost_max': cost_max
+                }
+
+        for row, _ in chunk:
+            yield results[row]
+
+
+def _csv_item(record, question_ids):
+    answers = {}
+    for question_id in question_ids:
+        value = (record.get(question_id) or '').strip()
+        if not value:
+            continue
+        if question_id == 'roof_elements':
+            answers[question_id] = [element.strip() for element in value.split(CSV_ELEMENT_SEPARATOR) if element.strip()]
+        else:
+            answers[question_id] = value
+    return {'address': record.get('address'), 'roof_area_sqm': record.get('roof_area_sqm') or None, 'answers': answers}
+
+
+def iter_items(stream, input_format, question_ids):
+    """
+    Lit des éléments depuis un flux binaire, sans le charger entièrement
+    pour les formats ``csv`` et ``ndjson`` ; ``json`` attend une liste ou
+    ``{'items': [...]}``.
+    """
+    records = iter_records(stream, input_format)
+    if input_format == 'csv':
+        return (_csv_item(record, question_ids) for record in records)
+    return records
@@ -0,0 +1,241 @@
+"""
+Cache des réponses Google (géocodage, Solar).
+
+Un niveau mémoire LRU avec TTL, un niveau SQLite persistant optionnel et la
+fusion des requêtes concurrentes : pour une même clé absente du cache, un
+seul appel amont est effectué, les autres appelants attendent son résultat.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+from src.utils.address import canonical_address
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+def address_key(address):
+    """Clé canonique d'une adresse : casse, accents, abréviations et complément de logement neutralisés"""
+    return 'geocode:' + canonical_address(address)
+
+
+def location_key(lat, lng, precision=5):
+    """Clé d'une position arrondie (5 décimales ≈ 1 m)"""
+    return f'solar:{round(float(lat), precision):.{precision}f},{round(float(lng), precision):.{precision}f}'
+
+
+class CacheStats:
+    """Compteurs de hits/misses/évictions d'un cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'coalesced': 0}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+class MemoryCache:
+    """Cache LRU en mémoire avec expiration par entrée"""
+
+    def __init__(self, maxsize=1024, stats=None):
+        self.maxsize = maxsize
+        self.stats = stats or CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.stats.incr('expirations')
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.incr('evictions')
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Niveau persistant : valeurs JSON dans une base SQLite dédiée"""
+
+    def __init__(self, path, stats=None):
+        self.path = path
+        self.stats = stats or CacheStats()
+        self.reconnect()
+
+    def reconnect(self):
+        """Ouvre une connexion propre au processus (une connexion SQLite ne survit pas à un fork)"""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache_entry '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM cache_entry WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+                self._conn.commit()
+                self.stats.incr('expirations')
+                return None
+            return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl)
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    Cache à niveaux (mémoire puis persistant) avec fusion des requêtes
+    concurrentes sur une même clé.
+    """
+
+    def __init__(self, ttl, maxsize=1024, persistent_path=None):
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.memory = MemoryCache(maxsize, stats=self.stats)
+        self.persistent = SQLiteCache(persistent_path, stats=self.stats) if persistent_path else None
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Dans un worker forké : connexion persistante rouverte, appels en vol du maître oubliés"""
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        if self.persistent is not None:
+            self.persistent.reconnect()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value, self.ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl)
+        if self.persistent is not None:
+            self.persistent.set(key, value, ttl)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Retourne la valeur en cache ou appelle ``fetch()`` une seule fois pour
+        l'ensemble des appelants concurrents. Les exceptions de ``fetch`` sont
+        propagées à tous les appelants et ne sont pas mises en cache.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.stats.incr('hits')
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            self.stats.incr('coalesced')
+            return future.result()
+
+        self.stats.incr('misses')
+        try:
+            value = fetch()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def aget_or_fetch(self, key, fetch):
+        """
+        Variante asynchrone de get_or_fetch : ``fetch`` est une coroutine et
+        la fusion des appels concurrents se fait sur la boucle d'événements.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.stats.incr('hits')
+            return value
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            self.stats.incr('coalesced')
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        self.stats.incr('misses')
+        try:
+            value = await fetch()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" sans attente
+            future.exception()
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    def to_dict(self):
+        return dict(self.stats.to_dict(), size=len(self.memory), ttl=self.ttl,
+                    persistent=self.persistent is not None)
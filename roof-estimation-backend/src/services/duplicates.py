@@ -0,0 +1,237 @@
+"""
+Détection des adresses en double parmi les leads et les sessions.
+
+Deux niveaux, servis par les colonnes calculées et indexées des modèles
+(voir src/utils/address.py) :
+
+- exact : même clé canonique ``address_canonical`` (« 12 r. de la Paix,
+  apt 3 » et « 12 Rue de la Paix » se confondent), une recherche d'index ;
+- approché : même bloc ``address_block`` (code postal et numéro), puis
+  similarité de Jaccard des trigrammes des noms de voie, calculée en
+  Python sur les quelques lignes du bloc (fautes de frappe, mots omis).
+
+Les grappes de doublons sont parcourues par clé (canonique ou bloc)
+croissante, avec un curseur opaque comme les listes. La position d'un
+lead de même clé canonique évite un géocodage (google_api.resolve_roof).
+"""
+from flask import jsonify
+from sqlalchemy import func, select
+from src.models.user import db
+from src.utils.address import address_block_key, canonical_address, street_name
+from src.utils.pagination import KeysetQuery, PaginationError
+import base64
+import os
+
+ADDRESS_FUZZY_THRESHOLD = float(os.getenv('ADDRESS_FUZZY_THRESHOLD', 0.6))  # similarité minimale
+DUPLICATE_BLOCK_LIMIT = 200  # lignes lues au plus par clé ou par bloc
+DUPLICATES_DEFAULT_LIMIT = 100
+DUPLICATES_MAX_LIMIT = 1000
+MODES = ('exact', 'fuzzy')
+
+
+class DuplicateQueryError(ValueError):
+    """Paramètre de recherche de doublons invalide (renvoyé en 400 par les routes)"""
+
+
+def trigrams(text):
+    """Trigrammes d'un texte, bornes de mots comprises"""
+    padded = f'  {text} '
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+def similarity(left, right):
+    """Indice de Jaccard des trigrammes des noms de voie de deux clés canoniques (1.0 si identiques)"""
+    if left == right:
+        return 1.0
+    return _jaccard(trigrams(street_name(left)), trigrams(street_name(right)))
+
+
+def _jaccard(left, right):
+    union = left | right
+    return len(left & right) / len(union) if union else 1.0
+
+
+def group_column(table, mode):
+    return table.c.address_canonical if mode == 'exact' else table.c.address_block
+
+
+def keys_statement(table, mode, after=None, limit=DUPLICATES_DEFAULT_LIMIT):
+    """(clé, nombre de lignes) des clés partagées par plusieurs lignes, par clé croissante"""
+    column = group_column(table, mode)
+    statement = (
+        select(column, func.count())
+        .where(column.isnot(None))
+        .group_by(column)
+        .having(func.count() > 1)
+        .order_by(column)
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(column > after)
+    return statement
+
+
+def members_statement(table, mode, key, projection):
+    """Lignes d'une clé, les plus récentes d'abord ; chaque ligne commence par (clé canonique, id)"""
+    return (
+        select(table.c.address_canonical, table.c.id, *projection)
+        .where(group_column(table, mode) == key)
+        .order_by(table.c.timestamp.desc(), table.c.id.desc())
+        .limit(DUPLICATE_BLOCK_LIMIT)
+    )
+
+
+def fuzzy_groups(rows, threshold=ADDRESS_FUZZY_THRESHOLD):
+    """Groupes (union-find) des lignes d'un bloc reliées par une similarité suffisante"""
+    parents = list(range(len(rows)))
+    grams = [trigrams(street_name(row[0])) for row in rows]
+
+    def root(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for first in range(len(rows)):
+        for second in range(first + 1, len(rows)):
+            if rows[first][0] == rows[second][0] or _jaccard(grams[first], grams[second]) >= threshold:
+                parents[root(second)] = root(first)
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(root(index), []).append(row)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_matches(model, address, mode='fuzzy', query=None):
+    """
+    (similarité, ligne) des lignes en double d'une adresse, les correspondances
+    exactes d'abord ; chaque ligne commence par (clé canonique, id)
+    """
+    table = model.__table__
+    query = query or KeysetQuery(model)
+    canonical = canonical_address(address)
+    if not canonical:
+        return []
+    block = address_block_key(address)
+    if mode == 'exact' or block is None:
+        rows = db.session.execute(members_statement(table, 'exact', canonical, query.projection)).all()
+        return [(1.0, row) for row in rows]
+    matches = []
+    for row in db.session.execute(members_statement(table, 'fuzzy', block, query.projection)):
+        score = similarity(canonical, row[0])
+        if score >= ADDRESS_FUZZY_THRESHOLD:
+            matches.append((score, row))
+    matches.sort(key=lambda match: -match[0])
+    return matches
+
+
+def known_location(model, address):
+    """
+    (latitude, longitude) de la ligne la plus récente de même clé canonique
+    qui en a une, (None, None) sinon : une adresse déjà saisie n'est pas
+    géocodée à nouveau
+    """
+    canonical = canonical_address(address)
+    if not canonical:
+        return None, None
+    table = model.__table__
+    statement = (
+        select(table.c.latitude, table.c.longitude)
+        .where(table.c.address_canonical == canonical, table.c.latitude.isnot(None), table.c.longitude.isnot(None))
+        .order_by(table.c.timestamp.desc(), table.c.id.desc())
+        .limit(1)
+    )
+    row = db.session.execute(statement).first()
+    return (row[0], row[1]) if row is not None else (None, None)
+
+
+def _mode(args):
+    mode = args.get('mode', 'fuzzy')
+    if mode not in MODES:
+        raise DuplicateQueryError(f'Mode non supporté: {mode} ({", ".join(MODES)})')
+    return mode
+
+
+def _limit(args):
+    try:
+        limit = int(args.get('limit', DUPLICATES_DEFAULT_LIMIT))
+    except ValueError:
+        raise DuplicateQueryError('limit doit être un entier')
+    if limit < 1:
+        raise DuplicateQueryError('limit doit être positif')
+    return min(limit, DUPLICATES_MAX_LIMIT)
+
+
+def _cursor(args):
+    cursor = args.get('cursor')
+    if not cursor:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except ValueError:
+        raise DuplicateQueryError('Curseur invalide')
+
+
+def _projection(model, args):
+    try:
+        return KeysetQuery(model, fields=args.get('fields'))
+    except PaginationError as e:
+        raise DuplicateQueryError(str(e))
+
+
+def _item(query, score, row):
+    item = query.row_to_dict(row)
+    item['similarity'] = round(score, 3)
+    return item
+
+
+def clusters(model, args):
+    """
+    Grappes de doublons, par clé croissante à partir du curseur : ``(grappes,
+    dernière clé lue ou None si fin)``. En mode approché, un bloc peut
+    donner plusieurs grappes ou aucune.
+    """
+    table = model.__table__
+    mode = _mode(args)
+    limit = _limit(args)
+    after = _cursor(args)
+    query = _projection(model, args)
+
+    found = []
+    keys = db.session.execute(keys_statement(table, mode, after, limit)).all()
+    for key, count in keys:
+        rows = db.session.execute(members_statement(table, mode, key, query.projection)).all()
+        if mode == 'exact':
+            found.append({'key': key, 'count': count, 'items': [_item(query, 1.0, row) for row in rows]})
+            continue
+        for group in fuzzy_groups(rows):
+            # Similarité de chaque ligne avec la plus récente de la grappe
+            reference = group[0][0]
+            found.append({
+                'key': key,
+                'count': len(group),
+                'items': [_item(query, similarity(reference, row[0]), row) for row in group],
+            })
+    last = keys[-1][0] if len(keys) == limit else None
+    return found, last
+
+
+def duplicates_response(model, args):
+    """
+    Avec ``address`` : lignes en double de cette adresse. Sinon : grappes de
+    doublons (``mode=exact`` sur la clé canonique, ``fuzzy`` par défaut sur
+    les blocs), paginées par ``limit`` / ``cursor`` ; ``fields`` comme les listes.
+    """
+    if args.get('address'):
+        address = args['address']
+        query = _projection(model, args)
+        matches = find_matches(model, address, _mode(args), query)[:_limit(args)]
+        return jsonify({
+            'address': address,
+            'canonical': canonical_address(address),
+            'items': [_item(query, score, row) for score, row in matches],
+            'count': len(matches),
+        })
+    found, last = clusters(model, args)
+    next_cursor = base64.urlsafe_b64encode(last.encode('utf-8')).decode('ascii') if last is not None else None
+    return jsonify({'clusters': found, 'count': len(found), 'next_cursor': next_cursor})
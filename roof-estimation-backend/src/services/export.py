@@ -0,0 +1,272 @@
+"""
+Export en flux des leads et des sessions (synchronisation CRM).
+
+Les lignes sont lues par un curseur serveur (``stream_results``) par
+tranches de EXPORT_CHUNK_SIZE, encodées au fil de l'eau en CSV, NDJSON ou
+Parquet (colonnes typées, un groupe de lignes par tranche ; nécessite
+pyarrow), éventuellement compressées en gzip : la mémoire reste constante
+quel que soit le nombre de lignes.
+
+Export incrémental : les lignes retenues vérifient
+``since <= colonne de filigrane < until`` (``timestamp`` pour les leads,
+``last_updated`` pour les sessions). ``until`` vaut par défaut l'instant
+de l'export moins EXPORT_WATERMARK_LAG secondes, marge laissée aux
+écritures encore en vol (voir SESSION_FLUSH_INTERVAL) ; il est renvoyé
+comme filigrane à passer en ``since`` à l'export suivant, qui ne transfère
+alors que les lignes ajoutées ou modifiées entre-temps.
+"""
+from datetime import datetime, timedelta
+from flask import Response, stream_with_context
+from sqlalchemy import Boolean, DateTime, Float, Integer, select
+from src.models.user import db
+from src.utils.pagination import KeysetQuery, PaginationError, list_filters, parse_datetime
+import csv
+import io
+import json
+import os
+import zlib
+
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 5000))  # lignes par tranche
+EXPORT_WATERMARK_LAG = float(os.getenv('EXPORT_WATERMARK_LAG', 60))  # secondes
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(PaginationError):
+    """Paramètre d'export invalide (renvoyé en 400 par les routes)"""
+
+
+class CsvWriter:
+    def __init__(self, query, columns):
+        self.query = query
+        self.fields = query.fields
+
+    def header(self):
+        return self._encode([self.fields])
+
+    def chunk(self, rows):
+        items = (self.query.row_to_dict(row, 0) for row in rows)
+        return self._encode([[self._cell(item[name]) for name in self.fields] for item in items])
+
+    def footer(self):
+        return b''
+
+    @staticmethod
+    def _cell(value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return '' if value is None else value
+
+    @staticmethod
+    def _encode(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+
+class NdjsonWriter:
+    """Lignes encodées directement par le plan compilé de la requête (voir src/utils/serializer.py)"""
+
+    def __init__(self, query, columns):
+        self.query = query
+
+    def header(self):
+        return b''
+
+    def chunk(self, rows):
+        return ''.join(self.query.row_to_json(row, 0) + '\n' for row in rows).encode('utf-8')
+
+    def footer(self):
+        return b''
+
+
+class _Sink:
+    """Fichier en écriture seule vidé à chaque tranche ; tell() reste la position absolue"""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class ParquetWriter:
+    """Parquet en flux : schéma typé d'après les colonnes, un groupe de lignes par tranche"""
+
+    def __init__(self, query, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError('Le format parquet nécessite le paquet pyarrow')
+        self.pa = pyarrow
+        self.query = query
+        self.fields = query.fields
+        self.types = [self._type(columns.get(name)) for name in fields]
+        self.schema = pyarrow.schema(list(zip(fields, self.types)))
+        self.sink = _Sink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema)
+
+    def _type(self, column):
+        column_type = column.type if column is not None else None
+        if isinstance(column_type, Boolean):
+            return self.pa.bool_()
+        if isinstance(column_type, Integer):
+            return self.pa.int64()
+        if isinstance(column_type, Float):
+            return self.pa.float64()
+        if isinstance(column_type, DateTime):
+            return self.pa.timestamp('us')
+        return self.pa.string()  # texte, champs composés en JSON
+
+    def _values(self, items, name, data_type):
+        values = [item[name] for item in items]
+        if data_type == self.pa.timestamp('us'):
+            return [datetime.fromisoformat(value) if value else None for value in values]
+        if data_type == self.pa.string():
+            return [json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                    for value in values]
+        return values
+
+    def header(self):
+        return self.sink.drain()
+
+    def chunk(self, rows):
+        items = [self.query.row_to_dict(row, 0) for row in rows]
+        arrays = [self.pa.array(self._values(items, name, data_type), type=data_type)
+                  for name, data_type in zip(self.fields, self.types)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        return self.sink.drain()
+
+    def footer(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+    'parquet': ParquetWriter,
+}
+
+
+class Export:
+    """Export d'un modèle : requête bornée par le filigrane, format et compression"""
+
+    def __init__(self, model, args, now=None):
+        self.model = model
+        self.output_format = args.get('format', 'ndjson')
+        if self.output_format not in WRITERS:
+            raise ExportError(f'Format non supporté: {self.output_format}')
+        self.compress = args.get('compress')
+        if self.compress not in (None, 'gzip'):
+            raise ExportError(f'Compression non supportée: {self.compress}')
+        self.watermark = getattr(model, '__export_watermark__', 'timestamp')
+        self.rows = 0
+
+        args = {name: value for name, value in args.items()
+                if name not in ('format', 'compress', 'sort') and value not in (None, '')}
+        self.since = parse_datetime(args['since']) if args.get('since') else None
+        self.until = parse_datetime(args['until']) if args.get('until') else (
+            (now or datetime.utcnow()) - timedelta(seconds=EXPORT_WATERMARK_LAG)
+        )
+        args['until'] = self.until.isoformat()
+        # Mêmes filtres indexés que les listes ; ordre croissant sur (filigrane, id)
+        self.query = KeysetQuery(model, fields=args.get('fields'), filters=list_filters(model, args, self.watermark),
+                                 sort=self.watermark)
+        self.writer = WRITERS[self.output_format](self.query, model.__table__.c)
+
+    @property
+    def filename(self):
+        suffix = '.gz' if self.compress else ''
+        return f'{self.model.__tablename__}-{self.until:%Y%m%dT%H%M%S}.{self.output_format}{suffix}'
+
+    @property
+    def mimetype(self):
+        return 'application/gzip' if self.compress else EXPORT_MIMETYPES[self.output_format]
+
+    def statement(self):
+        table = self.query.table
+        return (
+            select(*self.query.projection)
+            .where(*self.query.filters)
+            .order_by(self.query.sort_column, table.c.id)
+        )
+
+    def iter_rows(self, chunk_size=EXPORT_CHUNK_SIZE):
+        """Tranches de lignes (projection de la requête) lues par un curseur serveur"""
+        with db.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(self.statement())
+            yield from result.partitions(chunk_size)
+
+    def iter_bytes(self, chunk_size=EXPORT_CHUNK_SIZE):
+        """Contenu du fichier exporté, tranche par tranche"""
+        self.rows = 0
+        compressor = zlib.compressobj(wbits=31) if self.compress else None  # 31 : en-tête gzip
+        encode = compressor.compress if compressor else (lambda data: data)
+
+        yield encode(self.writer.header())
+        for rows in self.iter_rows(chunk_size):
+            self.rows += len(rows)
+            data = encode(self.writer.chunk(rows))
+            if data:
+                yield data
+        data = encode(self.writer.footer())
+        yield data + compressor.flush() if compressor else data
+
+    def headers(self):
+        return {
+            'Content-Disposition': f'attachment; filename="{self.filename}"',
+            # Filigrane à repasser en ``since`` au prochain export incrémental
+            'X-Export-Watermark': self.until.isoformat(),
+            'X-Export-Since': self.since.isoformat() if self.since else '',
+        }
+
+
+def export_response(model, args):
+    """Réponse HTTP en flux d'un export (paramètres : format, compress, since, until, fields, filtres)"""
+    export = Export(model, args)
+    return Response(stream_with_context(export.iter_bytes()), mimetype=export.mimetype, headers=export.headers())
+
+
+def export_to_file(model, args, output, state_file=None):
+    """
+    Écrit un export dans un fichier binaire ouvert. Avec ``state_file``, le
+    filigrane du dernier export réussi y est relu (``since`` par défaut) puis
+    mis à jour. Retourne (lignes exportées, filigrane).
+    """
+    args = dict(args)
+    if state_file and not args.get('since') and os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as f:
+            args['since'] = json.load(f)['watermark']
+    export = Export(model, args)
+    for data in export.iter_bytes():
+        output.write(data)
+    output.flush()
+    if state_file:
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump({'watermark': export.until.isoformat(), 'rows': export.rows}, f)
+    return export.rows, export.until
@@ -0,0 +1,218 @@
+"""
+Client HTTP partagé pour les API amont (Google Geocoding, Google Solar).
+
+Chaque client garde une ``requests.Session`` avec un pool de connexions
+keep-alive par hôte, applique des timeouts de connexion/lecture, rejoue les
+réponses 429/5xx avec un backoff exponentiel à jitter borné (ou le délai
+Retry-After de la réponse, borné de même) et coupe les appels via un
+disjoncteur tant que l'amont est dégradé.
+"""
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from src.services import metrics
+import random
+import requests
+import threading
+import time
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def retry_after(value):
+    """Délai en secondes d'un en-tête Retry-After (secondes ou date HTTP), None s'il est absent ou invalide"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class UpstreamError(Exception):
+    """L'appel amont a échoué après épuisement des tentatives"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Le disjoncteur est ouvert : l'appel n'est pas tenté"""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à trois états. Ouvert après ``failure_threshold`` échecs
+    consécutifs, il laisse passer un appel d'essai (semi-ouvert) une fois
+    ``reset_timeout`` secondes écoulées.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            # En semi-ouvert, un seul appel d'essai à la fois
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def to_dict(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class LatencyStats:
+    """Latences des appels amont (compteurs et histogramme cumulatif)"""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            for index, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    self.buckets[index] += 1
+                    break
+            else:
+                self.buckets[-1] += 1
+        # Temps d'attente attribué à la requête HTTP en cours
+        metrics.record_upstream(seconds)
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'avg_ms': round(self.total_seconds / self.calls * 1000, 2) if self.calls else None,
+                'max_ms': round(self.max_seconds * 1000, 2),
+                'histogram': {
+                    **{f'le_{bound}': count for bound, count in zip(self.BUCKETS, self.buckets)},
+                    'le_inf': self.buckets[-1]
+                }
+            }
+
+
+class UpstreamClient:
+    """Client d'une API amont avec pool, timeouts, retries et disjoncteur"""
+
+    def __init__(self, name, pool_size=10, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0, breaker=None):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def after_fork(self):
+        """Dans un worker forké : connexions héritées du maître abandonnées (le pool se reconstitue)"""
+        self.session.close()
+
+    def backoff(self, attempt, response=None):
+        """
+        Attente avant une nouvelle tentative : Retry-After de la réponse
+        (429/503) s'il est présent, sinon full jitter, aléatoire dans
+        [0, min(max, base * 2^attempt)] ; toujours bornée par backoff_max
+        """
+        delay = retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if delay is not None:
+            return min(delay, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, params=None):
+        """
+        GET avec retries sur 429/5xx et erreurs réseau. Les autres réponses
+        (y compris 4xx) sont renvoyées telles quelles à l'appelant.
+        """
+        if not self.breaker.allow():
+            self.stats.incr('rejected')
+            raise CircuitOpenError(f'{self.name}: service amont temporairement indisponible')
+
+        try:
+            response = self._attempts(url, params)
+        except BaseException:
+            # Toute issue autre qu'une réponse compte comme un échec : un appel
+            # d'essai interrompu ne doit pas laisser le disjoncteur semi-ouvert
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _attempts(self, url, params):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.stats.observe(time.perf_counter() - started, error=True)
+                failure = UpstreamError(f'{self.name}: {e.__class__.__name__}')
+                response = None
+            else:
+                retryable = response.status_code in RETRY_STATUSES
+                self.stats.observe(time.perf_counter() - started, error=retryable)
+                if not retryable:
+                    return response
+                failure = UpstreamError(f'{self.name}: HTTP {response.status_code}')
+
+            if attempt < self.max_retries:
+                self.stats.incr('retries')
+                time.sleep(self.backoff(attempt, response))
+
+        raise failure
+
+    def to_dict(self):
+        return dict(self.stats.to_dict(), circuit=self.breaker.to_dict())
@@ -0,0 +1,404 @@
+"""
+File de tâches de fond persistée, exécutée par un pool local de threads.
+
+Les appels amont lents (géocodage, Google Solar) ne retiennent plus la
+requête : la tâche est enregistrée dans la table ``job``, où elle survit à
+un redémarrage et peut être prise par n'importe quel processus, puis
+exécutée par l'un des JOB_WORKERS threads du processus.
+
+Prise d'une tâche : UPDATE conditionnel sur son statut (pending ->
+running), atomique quel que soit le nombre de processus. Une tâche
+enregistrée par ce processus est remise directement à ses threads par une
+file bornée. Les autres (autre processus, redémarrage, nouvel essai) sont
+trouvées en interrogeant la table toutes les JOB_POLL_INTERVAL secondes.
+Le bail d'une tâche dont le processus a disparu expire après
+JOB_LEASE_TIMEOUT secondes et la tâche est remise en attente.
+
+Contre-pression : au-delà de JOB_QUEUE_SIZE tâches en attente dans le
+processus (dans la table sans pool local), ``saturated()`` est vrai et
+l'appelant traite la demande lui-même, dans la requête, comme avant
+(voir conversation.start_conversation) : le débit d'entrée retombe au
+rythme des appels amont au lieu d'allonger la file sans limite.
+
+Échecs : nouvel essai après JOB_RETRY_DELAY × 2**(n-1) secondes, au plus
+JOB_MAX_ATTEMPTS essais, puis statut failed et rappel ``on_failure`` du
+type de tâche. Les tâches terminées sont supprimées après JOB_RETENTION
+secondes.
+
+Attente d'un résultat (long-poll, SSE) : ``wait`` est réveillé dès que la
+tâche se termine dans ce processus et relit la table toutes les
+JOB_WAIT_POLL secondes sinon.
+
+JOB_WORKERS=0 : les processus web n'exécutent aucune tâche ; les lancer
+dans un processus dédié avec ``flask --app src.main jobs work``.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from src.models.job import Job
+from src.models.user import db
+from src.services import metrics
+import atexit
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # threads par processus, 0 : aucun
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 100))  # tâches en attente avant contre-pression
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))  # secondes
+JOB_LEASE_TIMEOUT = float(os.getenv('JOB_LEASE_TIMEOUT', 120))  # secondes avant reprise d'une tâche
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 2))  # secondes, doublées à chaque essai
+JOB_WAIT_POLL = float(os.getenv('JOB_WAIT_POLL', 0.5))  # secondes entre deux relectures d'une tâche attendue
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', 7 * 24 * 3600))  # secondes de conservation des tâches terminées
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv('JOB_SHUTDOWN_TIMEOUT', 10))  # secondes laissées aux tâches en cours
+JOB_WAIT_MAX = float(os.getenv('JOB_WAIT_MAX', 30))  # secondes d'attente au plus d'une requête (long-poll, SSE)
+SSE_KEEPALIVE = 15  # secondes entre deux commentaires de maintien d'un flux SSE
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+FINISHED = (DONE, FAILED)
+# Tâches candidates lues à chaque interrogation (d'autres threads peuvent prendre les premières)
+CLAIM_CANDIDATES = 8
+
+_table = Job.__table__
+
+JOB_DURATION = metrics.registry.histogram(
+    'job_duration_seconds', 'Durée des tâches de fond', ('kind', 'status'))
+
+
+class JobError(ValueError):
+    """Paramètre de tâche invalide (renvoyé en 400 par les routes)"""
+
+
+def candidates_statement(kinds, now, limit=CLAIM_CANDIDATES):
+    """Tâches en attente disponibles des types donnés, les plus anciennes d'abord"""
+    return (
+        select(_table.c.id)
+        .where(_table.c.status == PENDING, _table.c.available_at <= now, _table.c.kind.in_(kinds))
+        .order_by(_table.c.available_at, _table.c.id)
+        .limit(limit)
+    )
+
+
+def latest_statement(kind, subject):
+    """Dernière tâche d'un type pour un sujet"""
+    return (
+        select(_table)
+        .where(_table.c.kind == kind, _table.c.subject == subject)
+        .order_by(_table.c.created_at.desc())
+        .limit(1)
+    )
+
+
+def expired_leases_statement(cutoff):
+    """Remise en attente des tâches dont le bail a expiré"""
+    return (
+        _table.update()
+        .where(_table.c.status == RUNNING, _table.c.locked_at < cutoff)
+        .values(status=PENDING, locked_by=None, locked_at=None)
+    )
+
+
+def purge_statement(cutoff):
+    """Suppression des tâches terminées anciennes"""
+    return _table.delete().where(_table.c.status.in_(FINISHED), _table.c.available_at < cutoff)
+
+
+def wait_timeout(args):
+    """Attente demandée par ``wait`` (secondes, bornée par JOB_WAIT_MAX ; 0 par défaut)"""
+    try:
+        wait = float(args.get('wait', 0))
+    except ValueError:
+        raise JobError('wait doit être un nombre')
+    if wait < 0:
+        raise JobError('wait doit être positif')
+    return min(wait, JOB_WAIT_MAX)
+
+
+def sse_event(event, data):
+    """Événement Server-Sent Events (données JSON)"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[-64:]
+
+
+class JobQueue:
+    """File de tâches persistée et pool de threads qui les exécute"""
+
+    def __init__(self, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE, poll_interval=JOB_POLL_INTERVAL,
+                 lease_timeout=JOB_LEASE_TIMEOUT, max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY,
+                 wait_poll=JOB_WAIT_POLL, retention=JOB_RETENTION):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.wait_poll = wait_poll
+        self.retention = retention
+        self.handlers = {}
+        self.app = None
+        self._queue = queue.Queue(queue_size)
+        self._threads = []
+        self._thread_lock = threading.Lock()
+        self._maintenance_lock = threading.Lock()
+        self._next_maintenance = 0.0
+        self._stop = threading.Event()
+        # Réveil des attentes : compteur incrémenté à chaque tâche terminée dans le processus
+        self._finished = threading.Condition()
+        self._generation = 0
+        self._counters_lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'claimed': 0, 'done': 0, 'failed': 0, 'retried': 0, 'recovered': 0,
+                         'purged': 0}
+
+    def register(self, kind, handler, on_failure=None):
+        """
+        Type de tâche : ``handler(payload)`` retourne un résultat JSON ;
+        ``on_failure(payload, error)`` est appelé après le dernier essai
+        """
+        self.handlers[kind] = (handler, on_failure)
+
+    def init_app(self, app):
+        """Application dont le contexte est utilisé par les threads"""
+        if self.app is None:
+            self.app = app
+            atexit.register(self.close)
+
+    def _incr(self, name, amount=1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def saturated(self):
+        """Vrai si une nouvelle tâche attendrait derrière JOB_QUEUE_SIZE autres"""
+        if self.workers > 0:
+            return self._queue.qsize() >= self.queue_size
+        return self.pending_count() >= self.queue_size
+
+    def pending_count(self):
+        with db.engine.connect() as connection:
+            return connection.execute(select(func.count()).where(_table.c.status == PENDING)).scalar()
+
+    def enqueue(self, kind, payload, subject=None):
+        """Enregistre une tâche et la confie au pool local ; retourne son id"""
+        if kind not in self.handlers:
+            raise JobError(f'Type de tâche inconnu: {kind}')
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        with db.engine.begin() as connection:
+            connection.execute(_table.insert().values(
+                id=job_id, kind=kind, subject=subject, payload=json.dumps(payload), status=PENDING, attempts=0,
+                created_at=now, updated_at=now, available_at=now,
+            ))
+        self._incr('enqueued')
+        if self.workers > 0:
+            self.ensure_started()
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                pass  # trouvée à la prochaine interrogation de la table
+        return job_id
+
+    def get(self, job_id):
+        """Ligne (mapping) de la tâche, None si elle n'existe pas"""
+        with db.engine.connect() as connection:
+            return connection.execute(select(_table).where(_table.c.id == job_id)).mappings().first()
+
+    def latest(self, kind, subject):
+        """Dernière tâche d'un type pour un sujet, None s'il n'y en a pas"""
+        with db.engine.connect() as connection:
+            return connection.execute(latest_statement(kind, subject)).mappings().first()
+
+    def wait(self, job_id, timeout):
+        """Ligne de la tâche dès qu'elle est terminée, ou telle quelle après ``timeout`` secondes"""
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = self._generation
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['status'] in FINISHED or remaining <= 0:
+                return job
+            with self._finished:
+                self._finished.wait_for(lambda: self._generation != generation, min(remaining, self.wait_poll))
+
+    def _notify(self):
+        with self._finished:
+            self._generation += 1
+            self._finished.notify_all()
+
+    def ensure_started(self):
+        """Démarre les threads manquants (premier appel dans le processus, après un éventuel fork)"""
+        if self.workers <= 0 or self.app is None or self._stop.is_set():
+            return
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._thread_lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._run, name=f'job-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        idle = True
+        while not self._stop.is_set():
+            try:
+                # File locale d'abord ; sans tâche reçue, interrogation de la table
+                job_id = self._queue.get(timeout=self.poll_interval if idle else 0)
+            except queue.Empty:
+                job_id = None
+            try:
+                with self.app.app_context():
+                    if job_id is None:
+                        self._maintain()
+                        job = self._claim_next()
+                    else:
+                        job = self._claim(job_id)
+                    if job is not None:
+                        self._execute(job)
+                idle = job is None
+            except Exception as e:
+                idle = True
+                logger.warning('Tâche de fond en échec: %s', e)
+
+    def _claim(self, job_id):
+        """Prend la tâche si elle est toujours en attente ; None si un autre l'a prise"""
+        with db.engine.begin() as connection:
+            result = connection.execute(
+                _table.update()
+                .where(_table.c.id == job_id, _table.c.status == PENDING)
+                .values(status=RUNNING, attempts=_table.c.attempts + 1, locked_by=_worker_id(),
+                        locked_at=datetime.utcnow())
+            )
+            if result.rowcount != 1:
+                return None
+            job = connection.execute(select(_table).where(_table.c.id == job_id)).mappings().first()
+        self._incr('claimed')
+        return job
+
+    def _claim_next(self):
+        if not self.handlers:
+            return None
+        with db.engine.connect() as connection:
+            candidates = connection.execute(candidates_statement(list(self.handlers), datetime.utcnow())).scalars().all()
+        for job_id in candidates:
+            job = self._claim(job_id)
+            if job is not None:
+                return job
+        return None
+
+    def _execute(self, job):
+        handler, on_failure = self.handlers[job['kind']]
+        payload = json.loads(job['payload']) if job['payload'] else {}
+        started = time.perf_counter()
+        try:
+            if job['attempts'] > self.max_attempts:
+                # Reprise après expiration de bail : le processus est mort à chaque essai
+                raise RuntimeError('Nombre d\'essais dépassé (bail expiré)')
+            result = handler(payload)
+        except Exception as e:
+            status = self._failed(job, payload, e, on_failure)
+        else:
+            status = DONE
+            self._release(job, status=DONE, result=json.dumps(result), error=None)
+            self._incr('done')
+        JOB_DURATION.observe(time.perf_counter() - started, job['kind'], status)
+        self._notify()
+
+    def _failed(self, job, payload, error, on_failure):
+        if job['attempts'] < self.max_attempts:
+            delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+            logger.info('Tâche %s %s en échec (essai %d), nouvel essai dans %.1f s: %s',
+                        job['kind'], job['id'], job['attempts'], delay, error)
+            self._release(job, status=PENDING, error=str(error),
+                          available_at=datetime.utcnow() + timedelta(seconds=delay))
+            self._incr('retried')
+            return PENDING
+        logger.warning('Tâche %s %s abandonnée après %d essais: %s', job['kind'], job['id'], job['attempts'], error)
+        self._release(job, status=FAILED, error=str(error))
+        self._incr('failed')
+        if on_failure is not None:
+            try:
+                on_failure(payload, error)
+            except Exception as e:
+                logger.warning('Rappel d\'échec de la tâche %s en échec: %s', job['id'], e)
+        return FAILED
+
+    def _release(self, job, **values):
+        """Écrit l'issue d'un essai, sauf si la tâche a été reprise par un autre entre-temps"""
+        with db.engine.begin() as connection:
+            connection.execute(
+                _table.update()
+                .where(_table.c.id == job['id'], _table.c.status == RUNNING, _table.c.locked_by == job['locked_by'])
+                .values(locked_by=None, locked_at=None, **values)
+            )
+
+    def _maintain(self):
+        """Baux expirés et purge, au plus toutes les JOB_LEASE_TIMEOUT / 2 secondes par processus"""
+        if time.monotonic() < self._next_maintenance or not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_maintenance = time.monotonic() + self.lease_timeout / 2
+            self.recover()
+        finally:
+            self._maintenance_lock.release()
+
+    def recover(self, now=None):
+        """Remet en attente les tâches au bail expiré et purge les tâches terminées anciennes"""
+        now = now or datetime.utcnow()
+        with db.engine.begin() as connection:
+            recovered = connection.execute(expired_leases_statement(now - timedelta(seconds=self.lease_timeout)))
+            purged = connection.execute(purge_statement(now - timedelta(seconds=self.retention)))
+        if recovered.rowcount:
+            logger.warning('%d tâche(s) au bail expiré remise(s) en attente', recovered.rowcount)
+        self._incr('recovered', recovered.rowcount)
+        self._incr('purged', purged.rowcount)
+        return recovered.rowcount, purged.rowcount
+
+    def close(self, timeout=JOB_SHUTDOWN_TIMEOUT):
+        """Arrête les threads ; les tâches en cours ont ``timeout`` secondes pour se terminer"""
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def work(self, workers=None):
+        """Exécute les tâches au premier plan (processus dédié) jusqu'à SIGTERM ou Ctrl-C"""
+        if workers is not None:
+            self.workers = workers
+        self.workers = max(self.workers, 1)
+        signal.signal(signal.SIGTERM, lambda *args: self._stop.set())
+        self.ensure_started()
+        try:
+            while not self._stop.wait(1):
+                self.ensure_started()
+        except KeyboardInterrupt:
+            pass
+        self.close()
+
+    def to_dict(self):
+        with db.engine.connect() as connection:
+            statuses = dict(connection.execute(select(_table.c.status, func.count()).group_by(_table.c.status)).all())
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            'workers': self.workers,
+            'threads': sum(1 for thread in self._threads if thread.is_alive()),
+            'queue_size': self.queue_size,
+            'queued': self._queue.qsize(),
+            'saturated': self.saturated(),
+            'kinds': sorted(self.handlers),
+            'jobs': statuses,
+            **counters,
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,157 @@
+"""
+Import en masse de leads (campagnes partenaires).
+
+Les enregistrements sont lus au fil du flux (CSV ou NDJSON, JSON pour les
+petits lots), validés comme par ``POST /api/leads`` puis insérés par
+executemany, LEAD_IMPORT_BATCH_SIZE lignes par transaction. Une ligne
+invalide est rejetée avec son erreur sans interrompre le lot ; si la base
+refuse un lot (ou si la mise à jour des agrégats échoue), ses lignes sont
+réessayées une par une pour isoler la fautive. Le rapport final donne le
+débit en lignes par seconde.
+"""
+from datetime import datetime
+from sqlalchemy import Float, String
+from sqlalchemy.exc import DBAPIError
+from src.models.lead import Lead
+from src.models.user import db
+from src.services.analytics import record_leads
+from src.utils.records import iter_records
+import math
+import os
+import time
+
+LEAD_IMPORT_BATCH_SIZE = int(os.getenv('LEAD_IMPORT_BATCH_SIZE', 1000))  # lignes par transaction
+LEAD_IMPORT_MAX_ERRORS = int(os.getenv('LEAD_IMPORT_MAX_ERRORS', 1000))  # erreurs détaillées dans le rapport
+
+LEAD_REQUIRED_FIELDS = ('address', 'estimated_cost_min', 'estimated_cost_max')
+# Montants : un coût négatif est refusé (il fausserait les agrégats, voir src/services/analytics.py)
+LEAD_NON_NEGATIVE_FIELDS = ('estimated_cost_min', 'estimated_cost_max')
+
+_table = Lead.__table__
+# Champs acceptés en entrée : colonnes du modèle hors clé, horodatage et colonnes internes
+_FIELDS = [
+    column for column in _table.columns
+    if not column.primary_key and column.name != 'timestamp' and not column.info.get('internal')
+]
+# Colonnes dérivées (computed_column), calculées ici plutôt que par les défauts SQLAlchemy ligne à ligne
+_COMPUTED = [(column.name, *column.info['computed_from']) for column in _table.columns if 'computed_from' in column.info]
+
+
+def _convert(column, value):
+    if isinstance(column.type, Float):
+        if isinstance(value, bool):
+            raise ValueError(f'{column.name} doit être un nombre')
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{column.name} doit être un nombre')
+        if not math.isfinite(number):
+            raise ValueError(f'{column.name} doit être un nombre fini')
+        if number < 0 and column.name in LEAD_NON_NEGATIVE_FIELDS:
+            raise ValueError(f'{column.name} doit être positif ou nul')
+        return number
+    if not isinstance(value, str):
+        raise ValueError(f'{column.name} doit être une chaîne')
+    value = value.strip()
+    if isinstance(column.type, String) and column.type.length and len(value) > column.type.length:
+        raise ValueError(f'{column.name} dépasse {column.type.length} caractères')
+    return value
+
+
+def convert_field(name, value):
+    """Valeur d'un champ de lead convertie et validée, ValueError si elle est invalide"""
+    return _convert(_table.c[name], value)
+
+
+def lead_row(record):
+    """Valeurs d'insertion d'un enregistrement, ValueError s'il est invalide"""
+    if not isinstance(record, dict):
+        raise ValueError('Enregistrement invalide')
+    row = {}
+    for column in _FIELDS:
+        value = record.get(column.name)
+        if value is None or value == '':
+            if column.name in LEAD_REQUIRED_FIELDS:
+                raise ValueError(f'Champ requis manquant: {column.name}')
+            row[column.name] = None
+        else:
+            row[column.name] = _convert(column, value)
+    for name, sources, compute in _COMPUTED:
+        row[name] = compute(*(row[source] for source in sources))
+    return row
+
+
+class LeadImport:
+    """Un import : lots de lignes valides, erreurs par ligne et compteurs"""
+
+    def __init__(self, batch_size=LEAD_IMPORT_BATCH_SIZE, max_errors=LEAD_IMPORT_MAX_ERRORS):
+        self.batch_size = max(1, batch_size)
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors = []
+
+    def _reject(self, row, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'error': message})
+
+    def _write(self, batch):
+        now = datetime.utcnow()
+        rows = [dict(values, timestamp=now) for _, values in batch]
+        with db.engine.begin() as connection:
+            connection.execute(_table.insert(), rows)
+            # Agrégats statistiques mis à jour dans la transaction du lot
+            record_leads(connection, rows)
+        self.inserted += len(batch)
+
+    def _insert(self, batch):
+        try:
+            self._write(batch)
+        except Exception:
+            # Lot refusé (base ou agrégats) : chaque ligne dans sa propre transaction pour isoler la fautive
+            for row, values in batch:
+                try:
+                    self._write([(row, values)])
+                except DBAPIError as e:
+                    self._reject(row, str(e.orig))
+                except Exception as e:
+                    self._reject(row, str(e))
+
+    def run(self, records):
+        """Importe un flux d'enregistrements et retourne le rapport"""
+        started = time.monotonic()
+        batch = []
+        for row, record in enumerate(records):
+            try:
+                batch.append((row, lead_row(record)))
+            except ValueError as e:
+                self._reject(row, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self._insert(batch)
+                self.batches += 1
+                batch = []
+        if batch:
+            self._insert(batch)
+            self.batches += 1
+        return self.report(time.monotonic() - started)
+
+    def report(self, duration):
+        processed = self.inserted + self.rejected
+        return {
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'batch_size': self.batch_size,
+            'errors': self.errors,
+            'errors_truncated': self.rejected > len(self.errors),
+            'duration_seconds': round(duration, 3),
+            'rows_per_second': round(processed / duration, 1) if duration > 0 else None,
+        }
+
+
+def import_leads(stream, input_format, batch_size=LEAD_IMPORT_BATCH_SIZE):
+    """Importe les leads d'un flux binaire (csv, ndjson ou json)"""
+    return LeadImport(batch_size).run(iter_records(stream, input_format))
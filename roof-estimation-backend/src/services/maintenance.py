@@ -0,0 +1,205 @@
+"""
+Expiration et compactage des sessions de conversation abandonnées.
+
+Chaque visiteur crée une ligne conversation_session ; celles qui ne sont
+jamais terminées sont supprimées une fois inactives depuis plus de
+SESSION_EXPIRY_TTL secondes. La purge avance par lots de
+MAINTENANCE_BATCH_SIZE lignes, chacun dans sa propre transaction courte
+suivie d'une pause, pour ne jamais garder le verrou d'écriture longtemps.
+Les lignes effectivement supprimées (DELETE ... RETURNING) peuvent être
+archivées en NDJSON compressé (gzip) dans la même transaction, puis
+l'espace libéré est rendu au système par ``PRAGMA incremental_vacuum``
+(SQLite, auto_vacuum=INCREMENTAL posé par la migration).
+
+Le worker tourne toutes les MAINTENANCE_INTERVAL secondes dans un seul
+processus : désactivé par défaut (0), il est activé par python -m
+src.server dans son premier worker uniquement (voir src/server.py).
+Ailleurs (ASGI, plusieurs instances), lancer plutôt
+``flask --app src.main conversation expire-sessions`` depuis un
+planificateur, ou poser MAINTENANCE_INTERVAL sur un seul processus.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from src.models.conversation import ConversationSession
+from src.models.user import db
+from src.services.session_store import SessionState, session_store
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SESSION_EXPIRY_TTL = float(os.getenv('SESSION_EXPIRY_TTL', 30 * 24 * 3600))  # secondes d'inactivité
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 0))  # secondes, 0 : désactivé
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', 500))
+MAINTENANCE_BATCH_PAUSE = float(os.getenv('MAINTENANCE_BATCH_PAUSE', 0.05))  # secondes entre deux lots
+SESSION_ARCHIVE_DIR = os.getenv('SESSION_ARCHIVE_DIR')  # archivage désactivé si absent
+VACUUM_PAGES = int(os.getenv('VACUUM_PAGES', 0))  # pages rendues par passe, 0 : toutes
+
+_table = ConversationSession.__table__
+
+
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _database_size():
+    """Taille occupée par la base en octets (SQLite), None pour les autres moteurs"""
+    if not _is_sqlite():
+        return None
+    with db.engine.connect() as connection:
+        page_count = connection.exec_driver_sql('PRAGMA page_count').scalar()
+        page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+    return page_count * page_size
+
+
+def incremental_vacuum(pages=VACUUM_PAGES):
+    """Rend au système les pages libres (toutes si pages vaut 0)"""
+    if not _is_sqlite():
+        return
+    connection = db.engine.raw_connection()
+    try:
+        # executescript déroule le pragma jusqu'au bout ; execute ne libérerait qu'une page
+        connection.driver_connection.executescript(f'PRAGMA incremental_vacuum({pages:d});')
+    finally:
+        connection.close()
+
+
+class SessionMaintenance:
+    """Purge par lots des sessions abandonnées, archivage et compactage"""
+
+    def __init__(self, ttl=SESSION_EXPIRY_TTL, interval=MAINTENANCE_INTERVAL, batch_size=MAINTENANCE_BATCH_SIZE,
+                 batch_pause=MAINTENANCE_BATCH_PAUSE, archive_dir=SESSION_ARCHIVE_DIR):
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.archive_dir = archive_dir
+        self.app = None
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def ensure_started(self):
+        """Démarre le worker au premier appel dans le processus (après un éventuel fork)"""
+        if self.interval <= 0 or self.app is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='session-maintenance', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.run()
+            except Exception as e:
+                logger.warning('Maintenance des sessions en échec: %s', e)
+
+    def _expired_ids(self, cutoff):
+        # Recherche sur l'index (last_updated, id)
+        statement = (
+            select(_table.c.id)
+            .where(_table.c.last_updated < cutoff, _table.c.is_completed.is_not(True))
+            .order_by(_table.c.last_updated, _table.c.id)
+            .limit(self.batch_size)
+        )
+        with db.engine.connect() as connection:
+            return [row_id for row_id, in connection.execute(statement)]
+
+    def _delete(self, connection, ids, cutoff):
+        """Supprime celles de ``ids`` encore expirées et retourne leurs lignes"""
+        # La condition est répétée : une session reprise entre-temps n'est pas supprimée
+        condition = (_table.c.id.in_(ids), _table.c.last_updated < cutoff, _table.c.is_completed.is_not(True))
+        if connection.dialect.delete_returning:
+            return connection.execute(_table.delete().where(*condition).returning(*_table.c)).mappings().all()
+        # Sans RETURNING (SQLite < 3.35) : lignes lues avant, puis restreintes à celles disparues
+        rows = connection.execute(select(_table).where(*condition)).mappings().all()
+        connection.execute(_table.delete().where(*condition))
+        kept = set(connection.scalars(select(_table.c.id).where(_table.c.id.in_(ids))))
+        return [row for row in rows if row['id'] not in kept]
+
+    def _archive(self, archive, rows):
+        for row in rows:
+            archive.write(json.dumps(SessionState.from_row(row).to_dict()) + '\n')
+
+    def run(self, now=None):
+        """Exécute une passe complète et retourne son rapport"""
+        if not self._lock.acquire(blocking=False):
+            return None  # passe déjà en cours dans ce processus
+        try:
+            return self._run_once(now or datetime.utcnow())
+        finally:
+            self._lock.release()
+
+    def _run_once(self, now):
+        started = time.monotonic()
+        cutoff = now - timedelta(seconds=self.ttl)
+        size_before = _database_size()
+        archive_path = None
+        archive = None
+
+        purged = batches = 0
+        try:
+            while True:
+                ids = self._expired_ids(cutoff)
+                if not ids:
+                    break
+                # Sessions reprises mais pas encore écrites (écriture différée) : last_updated mis à jour en base
+                session_store.flush_sessions(ids)
+                with db.engine.begin() as connection:
+                    rows = self._delete(connection, ids, cutoff)
+                    if self.archive_dir and rows:
+                        if archive is None:
+                            os.makedirs(self.archive_dir, exist_ok=True)
+                            archive_path = os.path.join(self.archive_dir, f'sessions-{now:%Y%m%dT%H%M%S}.ndjson.gz')
+                            archive = gzip.open(archive_path, 'wt', encoding='utf-8')
+                        # Archive écrite avant la validation : une erreur d'écriture annule la suppression
+                        self._archive(archive, rows)
+                        archive.flush()
+                deleted = [row['id'] for row in rows]
+                session_store.discard(deleted)
+                purged += len(deleted)
+                batches += 1
+                if len(ids) < self.batch_size:
+                    break
+                time.sleep(self.batch_pause)
+        finally:
+            if archive is not None:
+                archive.close()
+
+        if purged:
+            incremental_vacuum()
+        size_after = _database_size()
+        self.last_report = {
+            'started_at': now.isoformat(),
+            'cutoff': cutoff.isoformat(),
+            'rows_purged': purged,
+            'batches': batches,
+            'archive': archive_path,
+            'bytes_reclaimed': (size_before - size_after) if size_before is not None else None,
+            'duration_seconds': round(time.monotonic() - started, 3),
+        }
+        logger.info('Maintenance des sessions: %s', self.last_report)
+        return self.last_report
+
+    def to_dict(self):
+        return {
+            'ttl_seconds': self.ttl,
+            'interval_seconds': self.interval,
+            'batch_size': self.batch_size,
+            'archive_dir': self.archive_dir,
+            'last_report': self.last_report,
+        }
+
+
+session_maintenance = SessionMaintenance()
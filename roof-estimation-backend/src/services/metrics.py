@@ -0,0 +1,300 @@
+"""
+Instrumentation des requêtes et exposition au format texte Prometheus.
+
+Pour chaque requête Flask (tous les blueprints, y compris le service des
+fichiers statiques) : latence par route, tailles de requête et de réponse,
+nombre et durée des requêtes SQL (événements SQLAlchemy), temps passé à
+attendre les API amont, et durée des étapes déclarées par les routes avec
+``phase('nom')``. Les latences des clients amont (LatencyStats) sont
+reprises telles quelles.
+
+Les métriques sont propres à chaque processus : derrière plusieurs
+workers, chaque scrape de /metrics décrit le worker qui répond.
+
+Profilage échantillonné : une fraction PROFILE_SAMPLE_RATE des requêtes
+est profilée avec cProfile et le résultat écrit dans PROFILE_DIR
+(``<route>-<horodatage>.prof``, lisible avec pstats ou snakeviz). Le taux
+se modifie à chaud via /metrics/profiling (protégé par METRICS_TOKEN).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import cProfile
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # 0 : profilage désactivé
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'roof-profiles'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Histogramme cumulatif par combinaison d'étiquettes"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items())
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    """Métriques déclarées et collecteurs appelés à chaque rendu"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'Durée des requêtes HTTP', ('method', 'route', 'status'))
+REQUEST_SIZE = registry.histogram(
+    'http_request_size_bytes', 'Taille du corps des requêtes', ('route',), SIZE_BUCKETS)
+RESPONSE_SIZE = registry.histogram(
+    'http_response_size_bytes', 'Taille du corps des réponses (hors flux)', ('route',), SIZE_BUCKETS)
+REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'Requêtes SQL par requête HTTP', ('route',), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = registry.histogram(
+    'http_request_db_seconds', 'Temps SQL cumulé par requête HTTP', ('route',))
+REQUEST_UPSTREAM_SECONDS = registry.histogram(
+    'http_request_upstream_seconds', 'Attente des API amont par requête HTTP', ('route',))
+PHASE_DURATION = registry.histogram(
+    'http_request_phase_seconds', 'Durée des étapes déclarées par les routes', ('route', 'phase'))
+DB_QUERY_DURATION = registry.histogram(
+    'db_query_duration_seconds', 'Durée des requêtes SQL (tous contextes)')
+
+
+class RequestMetrics:
+    """Compteurs de la requête en cours"""
+    __slots__ = ('route', 'db_queries', 'db_seconds', 'upstream_seconds')
+
+    def __init__(self, route):
+        self.route = route
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream_seconds = 0.0
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def current():
+    return _current.get()
+
+
+def start_request(route):
+    metrics = RequestMetrics(route)
+    return metrics, _current.set(metrics)
+
+
+def finish_request(metrics, token, method, status, seconds, request_size=None, response_size=None):
+    _current.reset(token)
+    route = metrics.route
+    REQUEST_DURATION.observe(seconds, method, route, str(status))
+    REQUEST_DB_QUERIES.observe(metrics.db_queries, route)
+    REQUEST_DB_SECONDS.observe(metrics.db_seconds, route)
+    REQUEST_UPSTREAM_SECONDS.observe(metrics.upstream_seconds, route)
+    if request_size is not None:
+        REQUEST_SIZE.observe(request_size, route)
+    if response_size is not None:
+        RESPONSE_SIZE.observe(response_size, route)
+
+
+@contextmanager
+def phase(name):
+    """Mesure une étape de la requête en cours (sans effet hors requête)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            PHASE_DURATION.observe(time.perf_counter() - started, metrics.route, name)
+
+
+def record_upstream(seconds):
+    """Appelé par les clients amont pour chaque tentative"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.upstream_seconds += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    DB_QUERY_DURATION.observe(seconds)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_seconds += seconds
+
+
+def upstream_collector(clients):
+    """Collecteur des histogrammes LatencyStats des clients amont"""
+    def collect():
+        name = 'upstream_request_duration_seconds'
+        lines = [f'# HELP {name} Durée des appels aux API amont (par tentative)', f'# TYPE {name} histogram']
+        for client in clients:
+            stats = client.stats
+            with stats._lock:
+                buckets, total, calls = list(stats.buckets), stats.total_seconds, stats.calls
+                errors, retries, rejected = stats.errors, stats.retries, stats.rejected
+            cumulative = 0
+            for bound, count in zip(stats.BUCKETS + ('+Inf',), buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{upstream="{client.name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{upstream="{client.name}"}} {total!r}')
+            lines.append(f'{name}_count{{upstream="{client.name}"}} {calls}')
+        for counter, attribute in (('errors', 'errors'), ('retries', 'retries'), ('rejected', 'rejected')):
+            lines.append(f'# TYPE upstream_{counter}_total counter')
+            for client in clients:
+                lines.append(f'upstream_{counter}_total{{upstream="{client.name}"}} {getattr(client.stats, attribute)}')
+        return lines
+    return collect
+
+
+class Profiler:
+    """cProfile échantillonné, une requête profilée à la fois par processus"""
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.dumps = 0
+        self._busy = threading.Lock()
+
+    def start(self):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, route):
+        try:
+            profile.disable()
+            name = re.sub(r'[^A-Za-z0-9_.-]+', '_', route).strip('_') or 'root'
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, f'{name}-{time.time():.6f}.prof'))
+            self.dumps += 1
+        except OSError as e:
+            logger.warning('Profil non écrit dans %s: %s', self.directory, e)
+        finally:
+            self._busy.release()
+
+    def to_dict(self):
+        return {'sample_rate': self.sample_rate, 'directory': self.directory, 'dumps': self.dumps}
+
+
+profiler = Profiler()
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_app(app):
+    """Instrumente toutes les requêtes de l'application et les moteurs SQLAlchemy"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def _start():
+        request.environ['metrics.started'] = time.perf_counter()
+        request.environ['metrics.state'] = start_request(_route())
+        request.environ['metrics.profile'] = profiler.start()
+
+    def _finish(status, response_size=None):
+        state = request.environ.pop('metrics.state', None)
+        if state is not None:
+            finish_request(*state, request.method, status, time.perf_counter() - request.environ['metrics.started'],
+                           request.content_length, response_size)
+
+    @app.after_request
+    def _after(response):
+        # Les réponses en flux n'ont pas de taille connue à ce stade
+        _finish(response.status_code, None if response.is_streamed else response.calculate_content_length())
+        return response
+
+    @app.teardown_request
+    def _teardown(exc):
+        profile = request.environ.pop('metrics.profile', None)
+        if profile is not None:
+            profiler.stop(profile, _route())
+        # Exception non gérée : after_request n'a pas été appelé
+        _finish(500)
@@ -0,0 +1,261 @@
+"""
+Moteur de règles de tarification partagé par /api/estimate et la conversation.
+
+La table déclarative (pricing_rules.json) décrit les coûts matériau, les
+facteurs de main d'œuvre, les coûts additionnels au m², les majorations de
+complexité et les ajustements multiplicatifs. Elle est compilée une fois en
+un plan d'évaluation à plat : tables résolues et fonction Python générée
+sans boucle ni indirection, puis rechargée à chaud lorsque le fichier
+change sur disque.
+
+L'ordre des opérations du plan reproduit exactement celui des anciens
+calculs : les estimations sont identiques bit à bit.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PRICING_RULES_PATH = os.getenv('PRICING_RULES_PATH', os.path.join(os.path.dirname(__file__), 'pricing_rules.json'))
+PRICING_RELOAD_INTERVAL = float(os.getenv('PRICING_RELOAD_INTERVAL', 5))  # secondes entre deux vérifications
+
+
+def _bounds(cost):
+    return cost['min'], cost['max']
+
+
+def _lookup(table, value, unknown):
+    # Une réponse non textuelle (liste, objet) est traitée comme inconnue
+    return table.get(value, unknown) if isinstance(value, str) else unknown
+
+
+class PricingPlan:
+    """Plan d'évaluation compilé à partir d'une table de règles"""
+
+    def __init__(self, rules, version=None):
+        self.rules = rules
+        self.version = version
+
+        labor = rules['labor']
+        self.hours_per_sqm = labor['hours_per_sqm']
+        self.cost_per_hour = labor['cost_per_hour']
+
+        material = rules['material']
+        self.material_answer = material['answer']
+        self.material_default = material['default']
+        self.material_costs = {key: _bounds(cost) for key, cost in material['costs'].items()}
+
+        # (réponse, valeur par défaut, table, valeur pour une réponse inconnue)
+        self.labor_factors = tuple(
+            (factor['answer'], factor['default'], dict(factor['values']), factor['unknown'])
+            for factor in rules.get('labor_factors', [])
+        )
+        self.additional_costs = tuple(
+            (
+                additional['answer'],
+                additional['default'],
+                {key: _bounds(cost) for key, cost in additional['costs'].items()},
+                _bounds(additional['costs'][additional['default']])
+            )
+            for additional in rules.get('additional_costs', [])
+        )
+
+        complexity = rules.get('complexity', {})
+        self.complexity_answer = complexity.get('answer')
+        self.complexity_increments = tuple(complexity.get('increments', {}).items())
+
+        self.adjustments = tuple(
+            (adjustment['answer'], {key: tuple(values) for key, values in adjustment['values'].items()})
+            for adjustment in rules.get('adjustments', [])
+        )
+
+        quick = rules.get('quick_estimate', {})
+        self.quick_materials = tuple(quick.get('materials', self.material_costs))
+        self.quick_complexity_levels = tuple(quick.get('complexity_levels', ()))
+        self.quick_fixed_answers = dict(quick.get('fixed_answers', {}))
+
+        self._batch_estimator = None
+        self.evaluate = _compile_evaluator(self)
+
+    def evaluate_generic(self, answers, roof_area):
+        """
+        Évaluation interprétée du plan, retourne (min, max) arrondis à l'euro
+        supérieur. ``evaluate`` (fonction compilée) fait le même calcul et s'y
+        replie pour les réponses non hachables.
+        """
+        material_default = self.material_costs[self.material_default]
+        material_min, material_max = _lookup(
+            self.material_costs, answers.get(self.material_answer, self.material_default), material_default
+        )
+
+        labor_hours_per_sqm = self.hours_per_sqm
+        for answer, default, values, unknown in self.labor_factors:
+            labor_hours_per_sqm = labor_hours_per_sqm * _lookup(values, answers.get(answer, default), unknown)
+        labor_cost = roof_area * labor_hours_per_sqm * self.cost_per_hour
+
+        total_min = roof_area * material_min + labor_cost
+        total_max = roof_area * material_max + labor_cost
+        for answer, default, costs, unknown in self.additional_costs:
+            cost_min, cost_max = _lookup(costs, answers.get(answer, default), unknown)
+            total_min = total_min + roof_area * cost_min
+            total_max = total_max + roof_area * cost_max
+
+        complexity_factor = 1.0
+        elements = answers.get(self.complexity_answer, [])
+        if isinstance(elements, list):
+            for element, increment in self.complexity_increments:
+                if element in elements:
+                    complexity_factor += increment
+        total_min *= complexity_factor
+        total_max *= complexity_factor
+
+        for answer, values in self.adjustments:
+            value = answers.get(answer)
+            if isinstance(value, str) and value in values:
+                min_factor, max_factor = values[value]
+                total_min *= min_factor
+                total_max *= max_factor
+
+        return math.ceil(total_min), math.ceil(total_max)
+
+    @property
+    def batch_estimator(self):
+        """Évaluateur vectorisé du même plan (construit à la première utilisation)"""
+        if self._batch_estimator is None:
+            from src.services.batch_estimation import BatchEstimator
+            self._batch_estimator = BatchEstimator(self)
+        return self._batch_estimator
+
+
+def _literal(value):
+    """Nombre de la table inséré tel quel dans le code généré (repr exact)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f'Valeur numérique attendue: {value!r}')
+    return repr(value)
+
+
+def _compile_evaluator(plan):
+    """
+    Génère la fonction d'évaluation du plan : les recherches en table sont
+    déroulées, les méthodes ``get`` des tables liées en variables globales et
+    les constantes insérées comme littéraux. L'ordre des opérations est
+    celui d'evaluate_generic.
+    """
+    namespace = {
+        'ceil': math.ceil,
+        'generic': plan.evaluate_generic,
+        'MATERIAL_GET': plan.material_costs.get,
+        'MATERIAL_DEFAULT': plan.material_costs[plan.material_default],
+    }
+    lookups = [
+        f'material_min, material_max = MATERIAL_GET(get({plan.material_answer!r}, {plan.material_default!r}), MATERIAL_DEFAULT)'
+    ]
+    labor_terms = [_literal(plan.hours_per_sqm)]
+    for position, (answer, default, values, unknown) in enumerate(plan.labor_factors):
+        namespace[f'FACTOR_{position}_GET'] = values.get
+        lookups.append(f'factor_{position} = FACTOR_{position}_GET(get({answer!r}, {default!r}), {_literal(unknown)})')
+        labor_terms.append(f'factor_{position}')
+    min_terms = ['roof_area * material_min', 'labor_cost']
+    max_terms = ['roof_area * material_max', 'labor_cost']
+    for position, (answer, default, costs, unknown) in enumerate(plan.additional_costs):
+        namespace[f'COST_{position}_GET'] = costs.get
+        namespace[f'COST_{position}_UNKNOWN'] = unknown
+        lookups.append(f'cost_{position}_min, cost_{position}_max = COST_{position}_GET(get({answer!r}, {default!r}), COST_{position}_UNKNOWN)')
+        min_terms.append(f'roof_area * cost_{position}_min')
+        max_terms.append(f'roof_area * cost_{position}_max')
+    for position, (answer, values) in enumerate(plan.adjustments):
+        namespace[f'ADJUSTMENT_{position}_GET'] = values.get
+        lookups.append(f'adjustment_{position} = ADJUSTMENT_{position}_GET(get({answer!r}))')
+
+    lines = ['def evaluate(answers, roof_area):', '    get = answers.get', '    try:']
+    lines += [f'        {lookup}' for lookup in lookups]
+    lines += [
+        '    except TypeError:',
+        '        return generic(answers, roof_area)',
+        f'    labor_cost = roof_area * ({" * ".join(labor_terms)}) * {_literal(plan.cost_per_hour)}',
+        f'    total_min = {" + ".join(min_terms)}',
+        f'    total_max = {" + ".join(max_terms)}',
+    ]
+    if plan.complexity_increments:
+        lines += [
+            '    complexity_factor = 1.0',
+            f'    elements = get({plan.complexity_answer!r}, [])',
+            '    if isinstance(elements, list):',
+        ]
+        for element, increment in plan.complexity_increments:
+            lines += [f'        if {element!r} in elements:', f'            complexity_factor += {_literal(increment)}']
+        lines += ['    total_min *= complexity_factor', '    total_max *= complexity_factor']
+    for position in range(len(plan.adjustments)):
+        lines += [
+            f'    if adjustment_{position} is not None:',
+            f'        total_min *= adjustment_{position}[0]',
+            f'        total_max *= adjustment_{position}[1]',
+        ]
+    lines.append('    return ceil(total_min), ceil(total_max)')
+
+    exec(compile('\n'.join(lines) + '\n', f'<pricing plan {plan.version}>', 'exec'), namespace)
+    return namespace['evaluate']
+
+
+def load_plan(path):
+    """Lit et compile une table de règles"""
+    with open(path, encoding='utf-8') as rules_file:
+        rules = json.load(rules_file)
+    return PricingPlan(rules, version=os.stat(path).st_mtime_ns)
+
+
+class PricingEngine:
+    """
+    Détient le plan courant et le recharge à chaud : un thread compare toutes
+    les ``check_interval`` secondes la date de modification du fichier à
+    celle du plan chargé, hors du chemin des estimations. Un fichier invalide
+    est ignoré et le plan précédent reste en service.
+    """
+
+    def __init__(self, path, check_interval=PRICING_RELOAD_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.plan = load_plan(path)
+        self._lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    def current(self):
+        return self.plan
+
+    def ensure_started(self):
+        """Démarre la surveillance du fichier au premier appel dans le processus (après un éventuel fork)"""
+        if self.check_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._watch, name='pricing-reload', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """Recharge le plan si le fichier a changé ; retourne True si rechargé"""
+        with self._lock:
+            try:
+                if os.stat(self.path).st_mtime_ns == self.plan.version:
+                    return False
+                self.plan = load_plan(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning('Règles de tarification non rechargées (%s): %s', self.path, e)
+                return False
+            logger.info('Règles de tarification rechargées depuis %s', self.path)
+            return True
+
+    def estimate(self, answers, roof_area):
+        return self.plan.evaluate(answers, roof_area)
+
+
+pricing_engine = PricingEngine(PRICING_RULES_PATH)
@@ -0,0 +1,92 @@
+"""
+Catalogue des questions du moteur de conversation et encodeur des réponses
+correspondant (colonne conversation_answers, voir src/services/answer_codec.py).
+
+Le catalogue vit hors des routes : le modèle ConversationSession décode les
+réponses stockées même lorsque le blueprint conversation n'est pas chargé
+(autres blueprints, CLI, tâches de fond).
+"""
+from src.services.answer_codec import AnswerCodec
+
+# Questions du moteur de conversation
+CONVERSATION_QUESTIONS = {
+    'roof_type': {
+        'id': 'roof_type',
+        'question': 'Quel est le type de votre toiture actuelle ?',
+        'type': 'choice',
+        'options': [
+            {'value': 'tuiles_terre_cuite', 'label': 'Tuiles en terre cuite'},
+            {'value': 'tuiles_beton', 'label': 'Tuiles en béton'},
+            {'value': 'ardoise', 'label': 'Ardoise'},
+            {'value': 'zinc', 'label': 'Zinc'},
+            {'value': 'bac_acier', 'label': 'Bac acier'},
+            {'value': 'autre', 'label': 'Autre / Je ne sais pas'}
+        ],
+        'next_question': 'roof_condition'
+    },
+    'roof_condition': {
+        'id': 'roof_condition',
+        'question': 'Quel est l\'état général de votre toiture ?',
+        'type': 'choice',
+        'options': [
+            {'value': 'neuve', 'label': 'Neuve (moins de 5 ans)'},
+            {'value': 'bon_etat', 'label': 'Bon état (5-15 ans)'},
+            {'value': 'usee', 'label': 'Usée (15-30 ans)'},
+            {'value': 'endommagee', 'label': 'Endommagée (fuites, tuiles cassées)'}
+        ],
+        'next_question': 'roof_elements'
+    },
+    'roof_elements': {
+        'id': 'roof_elements',
+        'question': 'Y a-t-il des éléments spécifiques sur votre toiture ?',
+        'type': 'multiple_choice',
+        'options': [
+            {'value': 'cheminee', 'label': 'Cheminée(s)'},
+            {'value': 'lucarne', 'label': 'Lucarne(s)'},
+            {'value': 'fenetre_toit', 'label': 'Fenêtre(s) de toit'},
+            {'value': 'panneaux_solaires', 'label': 'Panneaux solaires'},
+            {'value': 'antenne', 'label': 'Antenne/Parabole'},
+            {'value': 'aucun', 'label': 'Aucun élément particulier'}
+        ],
+        'next_question': 'roof_access'
+    },
+    'roof_access': {
+        'id': 'roof_access',
+        'question': 'Comment évaluez-vous l\'accès à votre toiture ?',
+        'type': 'choice',
+        'options': [
+            {'value': 'facile', 'label': 'Facile (maison plain-pied, bon accès)'},
+            {'value': 'moyen', 'label': 'Moyen (étage, quelques contraintes)'},
+            {'value': 'difficile', 'label': 'Difficile (hauteur importante, accès restreint)'}
+        ],
+        'next_question': 'material_preference'
+    },
+    'material_preference': {
+        'id': 'material_preference',
+        'question': 'Avez-vous une préférence pour le type de matériau ?',
+        'type': 'choice',
+        'options': [
+            {'value': 'identique', 'label': 'Identique à l\'existant'},
+            {'value': 'amelioration', 'label': 'Amélioration (meilleure qualité)'},
+            {'value': 'economique', 'label': 'Solution économique'},
+            {'value': 'ecologique', 'label': 'Solution écologique'},
+            {'value': 'pas_preference', 'label': 'Pas de préférence particulière'}
+        ],
+        'next_question': 'insulation'
+    },
+    'insulation': {
+        'id': 'insulation',
+        'question': 'Souhaitez-vous améliorer l\'isolation de votre toiture ?',
+        'type': 'choice',
+        'options': [
+            {'value': 'oui_complete', 'label': 'Oui, isolation complète'},
+            {'value': 'oui_partielle', 'label': 'Oui, amélioration partielle'},
+            {'value': 'non', 'label': 'Non, pas d\'isolation'},
+            {'value': 'pas_sur', 'label': 'Je ne sais pas / À voir'}
+        ],
+        'next_question': None  # Dernière question
+    }
+}
+
+# Réponses stockées en codes d'options (colonne conversation_answers)
+answer_codec = AnswerCodec(CONVERSATION_QUESTIONS)
@@ -0,0 +1,424 @@
+"""
+État des conversations en cours, gardé en mémoire et écrit en différé.
+
+Les sessions actives sont servies depuis un magasin d'états ; /answer ne
+touche plus la base de données. Les états modifiés sont écrits par un
+thread de fond toutes les SESSION_FLUSH_INTERVAL secondes, en une seule
+transaction (INSERT/UPDATE groupés), ce qui évite de sérialiser les
+utilisateurs sur le verrou d'écriture SQLite.
+
+Points de durabilité :
+
+- fin de conversation : écriture immédiate si SESSION_PERSIST_ON_COMPLETE ;
+- réponses intermédiaires : au plus SESSION_FLUSH_INTERVAL secondes de retard
+  (0 : écriture synchrone à chaque réponse, comme avant) ;
+- arrêt du processus : les états en attente sont écrits (atexit).
+
+Le magasin par défaut (LocalStateBackend) est local au processus :
+l'écriture différée n'est active que sur demande (SESSION_WRITE_BEHIND=true),
+lorsqu'un seul processus sert toutes les sessions. python -m src.server
+l'active avec un seul worker et refuse de démarrer plusieurs workers avec
+elle (voir src/server.py). Avec plusieurs processus, brancher un magasin
+partagé offrant les mêmes méthodes (get/put/pop/items). Les listes
+(/sessions) lisent la base et peuvent avoir jusqu'à SESSION_FLUSH_INTERVAL
+secondes de retard.
+
+Un état que la base refuse (contrainte, valeur invalide) est journalisé et
+retiré de la mémoire plutôt que réécrit en échec à chaque passage
+(compteur ``quarantined``).
+"""
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, StatementError
+from src.models.conversation import ConversationSession
+from src.models.user import db
+from src.services.analytics import record_sessions
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SESSION_WRITE_BEHIND = os.getenv('SESSION_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', 2))  # secondes
+SESSION_PERSIST_ON_COMPLETE = os.getenv('SESSION_PERSIST_ON_COMPLETE', 'true').lower() in ('1', 'true', 'yes')
+SESSION_STORE_MAXSIZE = int(os.getenv('SESSION_STORE_MAXSIZE', 10000))
+SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', 900))  # secondes avant éviction d'un état écrit
+
+_table = ConversationSession.__table__
+# Colonnes gardées telles quelles dans l'état ; les réponses sont gardées décodées
+_COLUMNS = [column.name for column in _table.columns if column.name not in ('conversation_data', 'conversation_answers')]
+# Colonnes écrites par l'analyse du toit en tâche de fond (voir apply) : jamais réécrites par une mise à jour
+_ANALYSIS_COLUMNS = ConversationSession.__analysis_columns__
+
+
+def _row_error(error):
+    """Erreur due au contenu d'une ligne (contrainte, valeur refusée), pas à la base elle-même"""
+    if isinstance(error, (IntegrityError, DataError, TypeError, ValueError)):
+        return True
+    # Valeur refusée à la conversion des paramètres, avant d'atteindre la base
+    return isinstance(error, StatementError) and not isinstance(error, DBAPIError)
+
+
+class SessionState:
+    """
+    État d'une session de conversation, avec la même interface que le modèle
+    pour les réponses (get/set_conversation_data) et la sérialisation (to_dict)
+    """
+
+    def __init__(self, values, answers, is_new=False):
+        for name in _COLUMNS:
+            setattr(self, name, values.get(name))
+        self.answers = answers
+        self.is_new = is_new
+        self.dirty = is_new
+        # Fin de conversation à comptabiliser dans les agrégats, avec l'écriture de la ligne
+        self.record_completion = False
+        self.touched_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_row(cls, row):
+        values = dict(row)
+        answers = ConversationSession.decode_conversation_data(
+            values.get('conversation_data'), values.get('conversation_answers')
+        )
+        return cls(values, answers)
+
+    @classmethod
+    def from_model(cls, session):
+        """État d'une session créée mais pas encore écrite en base"""
+        now = datetime.utcnow()
+        state = cls({name: getattr(session, name) for name in _COLUMNS}, session.get_conversation_data(), is_new=True)
+        state.is_completed = bool(state.is_completed)
+        state.timestamp = state.timestamp or now
+        state.last_updated = state.last_updated or now
+        return state
+
+    def get_conversation_data(self):
+        return dict(self.answers)
+
+    def set_conversation_data(self, data):
+        self.answers = dict(data)
+
+    def to_row(self):
+        row = {name: getattr(self, name) for name in _COLUMNS}
+        row['conversation_data'], row['conversation_answers'] = ConversationSession.encode_conversation_data(self.answers)
+        return row
+
+    def to_dict(self):
+        # Mêmes clés, dans le même ordre, que ConversationSession.to_dict
+        result = {}
+        for column in _table.columns:
+            if column.name == 'conversation_answers' or column.info.get('internal'):
+                continue
+            if column.name == 'conversation_data':
+                result['conversation_data'] = self.get_conversation_data()
+                continue
+            value = getattr(self, column.name)
+            result[column.name] = value.isoformat() if isinstance(value, datetime) else value
+        return result
+
+
+class LocalStateBackend:
+    """Magasin d'états en mémoire du processus, ordonné par dernier accès"""
+
+    def __init__(self):
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is not None:
+                self._states.move_to_end(session_id)
+            return state
+
+    def put(self, session_id, state):
+        with self._lock:
+            self._states[session_id] = state
+            self._states.move_to_end(session_id)
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._states.pop(session_id, None)
+
+    def items(self):
+        """Copie des (id, état), du moins au plus récemment utilisé"""
+        with self._lock:
+            return list(self._states.items())
+
+    def __len__(self):
+        return len(self._states)
+
+
+class SessionStore:
+    """États des conversations en cours avec écriture différée en base"""
+
+    def __init__(self, backend=None, write_behind=SESSION_WRITE_BEHIND, flush_interval=SESSION_FLUSH_INTERVAL,
+                 persist_on_complete=SESSION_PERSIST_ON_COMPLETE, maxsize=SESSION_STORE_MAXSIZE,
+                 idle_ttl=SESSION_IDLE_TTL):
+        self.backend = backend if backend is not None else LocalStateBackend()
+        self.write_behind = write_behind and flush_interval > 0
+        self.flush_interval = flush_interval
+        self.persist_on_complete = persist_on_complete
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self.app = None
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = {'loads': 0, 'flushes': 0, 'rows_written': 0, 'flush_errors': 0, 'quarantined': 0,
+                         'evictions': 0}
+
+    def init_app(self, app):
+        """Application dont le contexte est utilisé par le thread d'écriture"""
+        if self.app is None:
+            self.app = app
+            atexit.register(self.close)
+
+    def _incr(self, name, amount=1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def get(self, session_id):
+        """
+        État de la session ou None. Chargé depuis la base au premier accès, puis
+        gardé en mémoire si l'écriture est différée (sinon relu à chaque appel,
+        pour ne jamais servir un état périmé écrit par un autre processus).
+        """
+        state = self.backend.get(session_id) if self.write_behind else None
+        if state is None:
+            row = db.session.execute(select(_table).where(_table.c.id == session_id)).mappings().first()
+            if row is None:
+                return None
+            self._incr('loads')
+            state = SessionState.from_row(row)
+            if self.write_behind:
+                self.backend.put(session_id, state)
+        state.touched_at = time.monotonic()
+        return state
+
+    def add(self, session):
+        """Enregistre une session nouvellement créée (modèle ConversationSession)"""
+        state = SessionState.from_model(session)
+        if self.write_behind:
+            self.backend.put(state.id, state)
+        self._written(state)
+        return state
+
+    def save(self, state, completed=False):
+        """
+        Marque l'état modifié et l'écrit tout de suite selon les points de
+        durabilité. ``completed`` : la conversation vient de se terminer, elle
+        est comptabilisée dans les statistiques dans la transaction qui écrit
+        la ligne. À appeler hors de ``state.lock`` (pris par flush).
+        """
+        with state.lock:
+            state.last_updated = datetime.utcnow()
+            state.dirty = True
+            if completed:
+                state.record_completion = True
+        self._written(state)
+
+    def _written(self, state):
+        if not self.write_behind or (state.is_completed and self.persist_on_complete):
+            self.flush([state])
+        else:
+            self._ensure_thread()
+
+    def flush(self, states=None):
+        """
+        Écrit les états modifiés (tous par défaut) en une transaction ; retourne
+        le nombre de lignes. Un lot refusé à cause de son contenu (contrainte,
+        valeur invalide) est réécrit ligne par ligne et les états refusés sont
+        mis de côté (voir _quarantine), l'erreur étant relevée si des états
+        précis étaient demandés. Base indisponible : les états restent à écrire
+        et l'erreur est relevée.
+        """
+        with self._flush_lock:
+            if states is None:
+                states_given = False
+                states = [state for _, state in self.backend.items() if state.dirty]
+            else:
+                states_given = True
+            rows, failures = [], []
+            for state in states:
+                with state.lock:
+                    if not state.dirty:
+                        continue
+                    state.dirty = False
+                    try:
+                        rows.append((state, state.to_row()))
+                    except (TypeError, ValueError) as e:
+                        failures.append((state, e))
+            written = 0
+            try:
+                try:
+                    self._write(rows)
+                    written = len(rows)
+                except Exception as e:
+                    self._incr('flush_errors')
+                    if not _row_error(e):
+                        self._keep_dirty(rows)
+                        raise
+                    if len(rows) == 1:
+                        failures.append((rows[0][0], e))
+                    else:
+                        # Une transaction par ligne pour isoler celles que la base refuse
+                        for index, row in enumerate(rows):
+                            try:
+                                self._write([row])
+                                written += 1
+                            except Exception as row_e:
+                                if not _row_error(row_e):
+                                    self._keep_dirty(rows[index:])
+                                    raise
+                                failures.append((row[0], row_e))
+            finally:
+                for state, error in failures:
+                    self._quarantine(state, error)
+            if failures and states_given:
+                raise failures[0][1]
+            return written
+
+    def _write(self, rows):
+        """INSERT des nouveaux états et UPDATE des autres, en une transaction"""
+        if not rows:
+            return
+        inserts, updates = [], []
+        for state, row in rows:
+            if state.is_new:
+                inserts.append(row)
+            else:
+                update = {name: value for name, value in row.items() if name not in _ANALYSIS_COLUMNS}
+                update['b_id'] = update.pop('id')
+                updates.append(update)
+        completed = [state for state, _ in rows if state.record_completion]
+        with db.engine.begin() as connection:
+            if inserts:
+                connection.execute(_table.insert(), inserts)
+            if updates:
+                statement = _table.update().where(_table.c.id == bindparam('b_id'))
+                connection.execute(statement, updates)
+            if completed:
+                record_sessions(connection, completed)
+        for state, _ in rows:
+            state.is_new = False
+        for state in completed:
+            state.record_completion = False
+        self._incr('flushes')
+        self._incr('rows_written', len(rows))
+
+    def _keep_dirty(self, rows):
+        """États à réécrire au prochain passage (écriture en échec)"""
+        for state, _ in rows:
+            with state.lock:
+                state.dirty = True
+
+    def _quarantine(self, state, error):
+        """
+        État refusé par la base : journalisé avec ses réponses puis retiré de
+        la mémoire (la prochaine lecture repart de la ligne en base), plutôt
+        que réécrit en échec à chaque passage
+        """
+        self._incr('quarantined')
+        logger.error('Session %s non écrite, état mis de côté (%s): réponses %r',
+                     state.id, error, state.answers)
+        with state.lock:
+            if not state.dirty and self.backend.get(state.id) is state:
+                self.backend.pop(state.id)
+
+    def flush_sessions(self, session_ids):
+        """Écrit les états modifiés en mémoire de ces sessions ; retourne le nombre de lignes"""
+        if not self.write_behind:
+            return 0
+        states = [self.backend.get(session_id) for session_id in session_ids]
+        return self.flush([state for state in states if state is not None and state.dirty])
+
+    def discard(self, session_ids):
+        """Retire de la mémoire les états de sessions supprimées en base (sauf modifiés entre-temps)"""
+        for session_id in session_ids:
+            state = self.backend.get(session_id)
+            if state is not None and not state.dirty:
+                self.backend.pop(session_id)
+
+    def apply(self, session_id, values):
+        """
+        Écrit des colonnes d'analyse (``__analysis_columns__``) calculées hors
+        de la requête : état en mémoire mis à jour s'il est chargé, UPDATE
+        ciblé en base (une réponse écrite entre-temps ne les écrase pas).
+        LookupError si la session n'existe pas (encore) en base ni en mémoire.
+        """
+        state = self.backend.get(session_id)
+        pending_insert = False
+        if state is not None:
+            with state.lock:
+                for name, value in values.items():
+                    setattr(state, name, value)
+                pending_insert = state.is_new
+        with db.engine.begin() as connection:
+            # last_updated inchangé : l'analyse n'est pas une activité de la session (filigrane des exports, TTL)
+            result = connection.execute(_table.update().where(_table.c.id == session_id).values(
+                last_updated=_table.c.last_updated, **values
+            ))
+        if result.rowcount == 0 and not pending_insert:
+            raise LookupError(f'Session {session_id} introuvable')
+
+    def evict(self):
+        """Retire les états écrits inactifs (ou en surnombre), et ceux des conversations terminées"""
+        now = time.monotonic()
+        states = self.backend.items()
+        excess = len(states) - self.maxsize
+        for session_id, state in states:
+            if state.dirty:
+                continue
+            if excess > 0 or state.is_completed or now - state.touched_at >= self.idle_ttl:
+                self.backend.pop(session_id)
+                self._incr('evictions')
+                excess -= 1
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='session-store-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with self.app.app_context():
+                    self.flush()
+                    self.evict()
+            except Exception as e:
+                logger.warning('Écriture différée des sessions en échec: %s', e)
+
+    def close(self):
+        """Arrête le thread et écrit les états en attente"""
+        self._stop.set()
+        if self.app is not None:
+            with self.app.app_context():
+                self.flush()
+
+    def to_dict(self):
+        return {
+            'write_behind': self.write_behind,
+            'flush_interval': self.flush_interval,
+            'persist_on_complete': self.persist_on_complete,
+            'sessions': len(self.backend),
+            'pending': sum(1 for _, state in self.backend.items() if state.dirty),
+            **self._counters_snapshot()
+        }
+
+    def _counters_snapshot(self):
+        with self._counters_lock:
+            return dict(self.counters)
+
+
+session_store = SessionStore()
@@ -0,0 +1,99 @@
+"""
+Réutilisation des analyses Google Solar déjà obtenues à proximité.
+
+Chaque réponse amont est enregistrée dans la table solar_analysis avec sa
+position. Avant un nouvel appel, on cherche via l'index spatial
+(src/services/spatial.py) l'analyse la plus proche dans un rayon de
+SOLAR_DEDUP_RADIUS_M mètres, plus récente que SOLAR_DEDUP_MAX_AGE secondes :
+deux clics sur le même toit ne coûtent plus qu'un appel, même si les
+coordonnées diffèrent au-delà de l'arrondi du cache (SOLAR_CACHE_PRECISION).
+
+La géométrie du toit (RoofGeometry : surface, pans, pente, orientation)
+est extraite une seule fois, à l'enregistrement, dans des colonnes dédiées
+(avec l'identifiant du bâtiment, conservé mais non indexé : il n'est connu
+qu'une fois la réponse amont obtenue, la recherche se fait donc par
+position). Les estimations la relisent
+sans décoder le JSON, et la gardent en mémoire (geometry_cache) par
+position arrondie : une nouvelle estimation du même toit ne fait ni appel
+amont ni requête ni décodage.
+
+Les requêtes sont construites ici et exécutées par l'appelant, avec la
+session Flask-SQLAlchemy ou une session asynchrone (src/asgi.py).
+"""
+from datetime import datetime, timedelta
+from src.models.solar import RoofGeometry, SolarAnalysis
+from src.services.cache import MemoryCache
+from src.services.spatial import nearby_statement, within_radius
+import json
+import os
+
+SOLAR_DEDUP_RADIUS_M = float(os.getenv('SOLAR_DEDUP_RADIUS_M', 15))  # 0 : pas de réutilisation
+SOLAR_DEDUP_MAX_AGE = float(os.getenv('SOLAR_DEDUP_MAX_AGE', os.getenv('SOLAR_CACHE_TTL', 30 * 24 * 3600)))  # secondes
+SOLAR_GEOMETRY_CACHE_SIZE = int(os.getenv('SOLAR_GEOMETRY_CACHE_SIZE', 10000))  # entrées
+
+_table = SolarAnalysis.__table__
+_geometry_columns = tuple(_table.c[name] for name in RoofGeometry.FIELDS)
+
+geometry_cache = MemoryCache(SOLAR_GEOMETRY_CACHE_SIZE)
+
+
+def nearest_statement(lat, lng, radius_m=SOLAR_DEDUP_RADIUS_M):
+    """Candidats autour de la position : (latitude, longitude, timestamp, response)"""
+    return nearby_statement(_table, float(lat), float(lng), radius_m, (_table.c.timestamp, _table.c.response))
+
+
+def nearest_geometry_statement(lat, lng, radius_m=SOLAR_DEDUP_RADIUS_M):
+    """Candidats autour de la position : (latitude, longitude, timestamp, *RoofGeometry.FIELDS)"""
+    return nearby_statement(_table, float(lat), float(lng), radius_m, (_table.c.timestamp,) + _geometry_columns)
+
+
+def _pick(rows, lat, lng, radius_m, max_age, now):
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=max_age)
+    recent = [row for row in rows if row[2] is not None and row[2] >= cutoff]
+    for distance, row in within_radius(recent, float(lat), float(lng), radius_m, limit=1):
+        return row
+    return None
+
+
+def pick_nearest(rows, lat, lng, radius_m=SOLAR_DEDUP_RADIUS_M, max_age=SOLAR_DEDUP_MAX_AGE, now=None):
+    """Réponse décodée de l'analyse récente la plus proche, None si aucune"""
+    row = _pick(rows, lat, lng, radius_m, max_age, now)
+    return json.loads(row[3]) if row is not None else None
+
+
+def pick_geometry(rows, lat, lng, radius_m=SOLAR_DEDUP_RADIUS_M, max_age=SOLAR_DEDUP_MAX_AGE, now=None):
+    """Géométrie de l'analyse récente la plus proche, None si aucune"""
+    row = _pick(rows, lat, lng, radius_m, max_age, now)
+    return RoofGeometry(*row[3:]) if row is not None else None
+
+
+def insert_statement(lat, lng, data, geometry=None):
+    """Insertion d'une réponse amont, avec sa géométrie extraite une seule fois"""
+    geometry = geometry or RoofGeometry.from_response(data)
+    return _table.insert().values(
+        latitude=float(lat), longitude=float(lng), response=json.dumps(data), **geometry.to_dict()
+    )
+
+
+def find_nearest(connection, lat, lng):
+    """Recherche synchrone (connexion ou session SQLAlchemy)"""
+    if SOLAR_DEDUP_RADIUS_M <= 0:
+        return None
+    return pick_nearest(connection.execute(nearest_statement(lat, lng)).all(), lat, lng)
+
+
+def find_geometry(connection, lat, lng):
+    """Recherche synchrone de la géométrie la plus proche (connexion ou session SQLAlchemy)"""
+    if SOLAR_DEDUP_RADIUS_M <= 0:
+        return None
+    return pick_geometry(connection.execute(nearest_geometry_statement(lat, lng)).all(), lat, lng)
+
+
+def record(connection, lat, lng, data):
+    """Enregistre une réponse amont ; l'appelant valide la transaction"""
+    connection.execute(insert_statement(lat, lng, data))
+
+
+def remember_geometry(key, geometry):
+    geometry_cache.set(key, geometry, SOLAR_DEDUP_MAX_AGE)
+    return geometry
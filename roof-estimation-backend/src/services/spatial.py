@@ -0,0 +1,136 @@
+"""
+Requêtes spatiales sur les tables indexées par ``geo_cell`` (leads, sessions,
+analyses Solar).
+
+Une zone (boîte ou cercle) est couverte par quelques intervalles de
+cellules (src/utils/geo.py) : la base ne lit que les lignes de ces
+intervalles via l'index, puis les coordonnées exactes sont filtrées
+(boîte en SQL, distance haversine en Python pour un rayon). Une recherche
+par rayon ne lit que les candidats les plus proches, triés et limités en
+SQL, quelle que soit la densité de la zone.
+"""
+from flask import jsonify
+from sqlalchemy import and_, or_, select
+from src.models.user import db
+from src.utils.geo import bbox_around, cell_ranges, haversine_m
+from src.utils.pagination import KeysetQuery, PaginationError
+import math
+
+NEARBY_DEFAULT_RADIUS_M = 2000
+NEARBY_MAX_RADIUS_M = 50000
+SPATIAL_DEFAULT_LIMIT = 100
+SPATIAL_MAX_LIMIT = 1000
+NEARBY_CANDIDATE_FACTOR = 4  # candidats lus par élément demandé (tri SQL approché, puis haversine)
+
+
+class SpatialQueryError(ValueError):
+    """Paramètre de requête spatiale invalide (renvoyé en 400 par les routes)"""
+
+
+def area_condition(table, south, west, north, east):
+    """Condition SQL « dans la boîte » servie par l'index sur geo_cell"""
+    cell = table.c.geo_cell
+    return and_(
+        or_(*(cell.between(low, high) for low, high in cell_ranges(south, west, north, east))),
+        table.c.latitude.between(south, north),
+        table.c.longitude.between(west, east),
+    )
+
+
+def nearby_statement(table, lat, lng, radius_m, columns, limit=None):
+    """
+    Candidats d'une recherche par rayon ; chaque ligne commence par
+    (latitude, longitude). Avec ``limit`` : les plus proches seulement,
+    triés en SQL sur la distance plane (équirectangulaire) au centre
+    """
+    statement = select(table.c.latitude, table.c.longitude, *columns).where(
+        area_condition(table, *bbox_around(lat, lng, radius_m))
+    )
+    if limit is None:
+        return statement
+    d_lat = table.c.latitude - lat
+    d_lng = (table.c.longitude - lng) * math.cos(math.radians(lat))
+    return statement.order_by(d_lat * d_lat + d_lng * d_lng).limit(limit)
+
+
+def within_radius(rows, lat, lng, radius_m, limit=None):
+    """(distance, ligne) des candidats dans le rayon, du plus proche au plus lointain"""
+    matches = []
+    for row in rows:
+        distance = haversine_m(lat, lng, row[0], row[1])
+        if distance <= radius_m:
+            matches.append((distance, row))
+    matches.sort(key=lambda match: match[0])
+    return matches[:limit] if limit is not None else matches
+
+
+def _float(args, name, default=None, minimum=None, maximum=None):
+    value = args.get(name)
+    if value is None:
+        if default is None:
+            raise SpatialQueryError(f'Paramètre requis: {name}')
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        raise SpatialQueryError(f'{name} doit être un nombre')
+    if not math.isfinite(number):
+        raise SpatialQueryError(f'{name} doit être un nombre fini')
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise SpatialQueryError(f'{name} hors limites [{minimum}, {maximum}]')
+    return number
+
+
+def _limit(args):
+    return int(_float(args, 'limit', SPATIAL_DEFAULT_LIMIT, 1, SPATIAL_MAX_LIMIT))
+
+
+def _projection(model, args):
+    try:
+        return KeysetQuery(model, fields=args.get('fields'))
+    except PaginationError as e:
+        raise SpatialQueryError(str(e))
+
+
+def nearby_response(model, args):
+    """
+    ``lat``, ``lng``, ``radius_m`` (défaut 2 km), ``limit``, ``fields`` :
+    éléments dans le rayon, triés par distance (``distance_m``)
+    """
+    lat = _float(args, 'lat', minimum=-90, maximum=90)
+    lng = _float(args, 'lng', minimum=-180, maximum=180)
+    radius_m = _float(args, 'radius_m', NEARBY_DEFAULT_RADIUS_M, 0, NEARBY_MAX_RADIUS_M)
+    limit = _limit(args)
+    query = _projection(model, args)
+
+    # Candidats bornés : la distance plane ne diffère de la haversine qu'en marge, d'où la réserve
+    statement = nearby_statement(model.__table__, lat, lng, radius_m, query.projection,
+                                 limit * NEARBY_CANDIDATE_FACTOR)
+    rows = db.session.execute(statement).all()
+    items = []
+    for distance, row in within_radius(rows, lat, lng, radius_m, limit):
+        item = query.row_to_dict(row)
+        item['distance_m'] = round(distance, 1)
+        items.append(item)
+    return jsonify({'items': items, 'count': len(items)})
+
+
+def within_response(model, args):
+    """``bbox=sud,ouest,nord,est``, ``limit``, ``fields`` : éléments dans la boîte"""
+    try:
+        south, west, north, east = (float(value) for value in args.get('bbox', '').split(','))
+    except ValueError:
+        raise SpatialQueryError('bbox attendu: sud,ouest,nord,est')
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise SpatialQueryError('bbox invalide (sud ≤ nord, ouest ≤ est, antiméridien non géré)')
+    limit = _limit(args)
+    query = _projection(model, args)
+
+    table = model.__table__
+    statement = (
+        select(table.c.latitude, table.c.longitude, *query.projection)
+        .where(area_condition(table, south, west, north, east))
+        .limit(limit)
+    )
+    items = [query.row_to_dict(row) for row in db.session.execute(statement)]
+    return jsonify({'items': items, 'count': len(items)})
@@ -0,0 +1,234 @@
+"""
+Service des fichiers statiques de l'interface (build Vite dans src/static).
+
+Le dossier est parcouru une fois, au premier accès : chaque fichier entre
+dans un manifeste en mémoire (taille, type, ETag tiré du contenu) et les
+requêtes ne font plus aucun stat. Les fichiers texte (js, css, html, svg,
+json...) ont des variantes gzip et, si le paquet brotli est installé,
+brotli : celles produites au build (``flask --app src.main build-static``,
+écrites à côté des fichiers) sont utilisées telles quelles, les autres
+sont compressées à la construction du manifeste dans STATIC_CACHE_DIR (une
+fois par contenu). La variante est choisie d'après Accept-Encoding.
+
+Les fichiers à empreinte (``assets/index-CUAhzXWk.js``) sont servis avec
+``Cache-Control: immutable`` pour un an ; les autres (index.html, favicon)
+sont revalidés à chaque chargement grâce à l'ETag (réponse 304). Le corps
+est transmis par ``wsgi.file_wrapper`` : les serveurs qui le supportent
+(gunicorn...) l'envoient par sendfile, sans copie ; avec
+STATIC_X_SENDFILE=1, l'envoi est délégué au proxy (en-tête X-Sendfile).
+"""
+from flask import Response, request
+from flask.cli import with_appcontext
+from werkzeug.wsgi import wrap_file
+import click
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import brotli
+except ImportError:  # variantes brotli désactivées
+    brotli = None
+
+STATIC_CACHE_DIR = os.getenv('STATIC_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'roof-static'))
+STATIC_X_SENDFILE = os.getenv('STATIC_X_SENDFILE', '0') == '1'
+STATIC_MIN_COMPRESS_SIZE = int(os.getenv('STATIC_MIN_COMPRESS_SIZE', 1024))  # octets
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+# Nom produit par Vite : <nom>-<hash de 8 caractères ou plus>.<ext>
+FINGERPRINT_PATTERN = re.compile(r'-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+ENCODINGS = ('br', 'gzip')  # ordre de préférence
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def _compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def available_encodings():
+    return tuple(encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None)
+
+
+def is_compressible(mimetype, size):
+    return size >= STATIC_MIN_COMPRESS_SIZE and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def _write_atomic(path, data):
+    # Plusieurs workers peuvent construire la même variante : remplacement atomique
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+class StaticAsset:
+    """Entrée du manifeste : un fichier et ses variantes compressées"""
+    __slots__ = ('path', 'mimetype', 'etag', 'cache_control', 'variants')
+
+    def __init__(self, path, mimetype, etag, cache_control, variants):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.cache_control = cache_control
+        self.variants = variants  # encodage ('identity', 'gzip', 'br') -> (chemin, taille)
+
+
+def parse_accept_encoding(header):
+    """Encodages acceptés (q > 0) d'un en-tête Accept-Encoding"""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    """Manifeste en mémoire d'un dossier statique et réponses associées"""
+
+    def __init__(self, folder, cache_dir=STATIC_CACHE_DIR):
+        self.folder = folder
+        self.cache_dir = cache_dir
+        self._manifest = None
+        self._lock = threading.Lock()
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(tuple(SUFFIXES.values())):
+                    continue
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.folder).replace(os.sep, '/'), path
+
+    def _variants(self, relative, path, data, mimetype):
+        variants = {'identity': (path, len(data))}
+        if not is_compressible(mimetype, len(data)):
+            return variants
+        digest = hashlib.sha1(data).hexdigest()
+        for encoding in available_encodings():
+            built = path + SUFFIXES[encoding]
+            # Variante du build absente ou plus ancienne que l'original : recompressée dans le cache
+            if not os.path.exists(built) or os.path.getmtime(built) < os.path.getmtime(path):
+                built = os.path.join(self.cache_dir, f'{relative}.{digest[:16]}{SUFFIXES[encoding]}')
+                if not os.path.exists(built):
+                    _write_atomic(built, _compress(data, encoding))
+            size = os.path.getsize(built)
+            if size < len(data):
+                variants[encoding] = (built, size)
+        return variants
+
+    def build_manifest(self):
+        manifest = {}
+        if self.folder is None or not os.path.isdir(self.folder):
+            return manifest
+        for relative, path in self._iter_files():
+            with open(path, 'rb') as f:
+                data = f.read()
+            mimetype = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+            fingerprinted = FINGERPRINT_PATTERN.search(relative) is not None
+            manifest[relative] = StaticAsset(
+                path=path,
+                mimetype=mimetype,
+                etag=hashlib.sha1(data).hexdigest()[:20],
+                cache_control=IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+                variants=self._variants(relative, path, data, mimetype),
+            )
+        return manifest
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = self.build_manifest()
+        return self._manifest
+
+    def reload(self):
+        with self._lock:
+            self._manifest = self.build_manifest()
+
+    def lookup(self, path):
+        """Fichier demandé, ou index.html pour les routes de l'application (SPA)"""
+        manifest = self.manifest
+        return manifest.get(path) if path else None, manifest.get('index.html')
+
+    def response(self, path):
+        """Réponse pour un chemin du catch-all (même repli sur index.html qu'auparavant)"""
+        if self.folder is None:
+            return Response('Static folder not configured', 404)
+        asset, index = self.lookup(path)
+        asset = asset or index
+        if asset is None:
+            return Response('index.html not found', 404)
+        return self.send(asset)
+
+    def send(self, asset):
+        accepted = parse_accept_encoding(request.headers.get('Accept-Encoding'))
+        encoding = next((name for name in ENCODINGS if name in asset.variants and name in accepted), 'identity')
+        file_path, size = asset.variants[encoding]
+
+        headers = {'Cache-Control': asset.cache_control}
+        if len(asset.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        # ETag propre à chaque variante (octets différents)
+        etag = asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}'
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+        if STATIC_X_SENDFILE:
+            headers['X-Sendfile'] = file_path
+            response = Response(status=200, headers=headers, mimetype=asset.mimetype)
+        else:
+            stream = wrap_file(request.environ, open(file_path, 'rb'))
+            response = Response(stream, headers=headers, mimetype=asset.mimetype, direct_passthrough=True)
+        response.content_length = size
+        response.set_etag(etag)
+        return response
+
+
+@click.command('build-static')
+@with_appcontext
+def build_static_command():
+    """Écrit les variantes gzip/brotli des fichiers statiques à côté des originaux"""
+    from flask import current_app
+    folder = current_app.static_folder
+    built = 0
+    for relative, path in StaticAssets(folder)._iter_files():
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(relative)[0] or 'application/octet-stream'
+        if not is_compressible(mimetype, len(data)):
+            continue
+        for encoding in available_encodings():
+            _write_atomic(path + SUFFIXES[encoding], _compress(data, encoding))
+            built += 1
+    click.echo(f'{built} variantes compressées écrites dans {folder}'
+               + ('' if brotli is not None else ' (brotli non installé : gzip seulement)'))
+
+
+def configure_static(app):
+    """Manifeste du dossier statique de l'application et commande build-static"""
+    app.cli.add_command(build_static_command)
+    assets = app.extensions['static_assets'] = StaticAssets(app.static_folder)
+    return assets
@@ -0,0 +1,133 @@
+"""
+Normalisation des adresses saisies.
+
+``normalize_address`` (colonne indexée ``address_key`` des leads et des
+sessions, filtre ``address`` des listes) neutralise casse, accents,
+virgules et espaces multiples.
+
+``canonical_address`` va plus loin pour reconnaître une même adresse
+saisie différemment (clé du cache de géocodage, colonne
+``address_canonical``) : ponctuation retirée, abréviations des types de
+voie et des titres développées (« r. » → rue, « bd » → boulevard,
+« St » → saint), complément de logement supprimé (« apt 12 », « bât. B »,
+« 3e étage »), « France » et « CEDEX » ignorés.
+
+``address_block_key`` (code postal et numéro) regroupe les adresses
+candidates à une comparaison approchée par trigrammes de leur nom de voie
+(``street_name``, voir src/services/duplicates.py).
+"""
+import re
+import unicodedata
+
+_POSTAL_CODE = re.compile(r'(?<!\d)(\d{5})(?!\d)')
+_PUNCTUATION = re.compile(r"[.,;:'’`\"()/\\_-]+")
+# Numéro de voie, avec ou sans indice de répétition (« 12 », « 12b », « 12bis »)
+_HOUSE_NUMBER = re.compile(r'^(\d{1,4})(?:bis|ter|quater|[a-d])?$')
+_ORDINAL = re.compile(r'^\d+(?:e|er|eme|ere)$')
+
+ABBREVIATIONS = {
+    'r': 'rue',
+    'av': 'avenue', 'ave': 'avenue', 'aven': 'avenue',
+    'bd': 'boulevard', 'bld': 'boulevard', 'blvd': 'boulevard', 'boul': 'boulevard',
+    'pl': 'place',
+    'imp': 'impasse',
+    'all': 'allee',
+    'ch': 'chemin', 'che': 'chemin', 'chem': 'chemin',
+    'rte': 'route',
+    'fg': 'faubourg', 'fbg': 'faubourg',
+    'qu': 'quai', 'qua': 'quai',
+    'sq': 'square',
+    'crs': 'cours',
+    'pass': 'passage',
+    'lot': 'lotissement',
+    'res': 'residence',
+    'st': 'saint', 'ste': 'sainte',
+    'gal': 'general', 'gen': 'general',
+    'mal': 'marechal',
+    'pdt': 'president',
+    'dr': 'docteur',
+}
+# Compléments de logement : le mot et la valeur qui le suit sont ignorés
+UNIT_DESIGNATORS = frozenset({
+    'apt', 'app', 'appt', 'appart', 'appartement', 'bat', 'batiment', 'esc', 'escalier',
+    'etage', 'etg', 'porte', 'logement', 'log', 'chambre', 'boite', 'bp',
+})
+IGNORED_WORDS = frozenset({'france', 'cedex', 'n', 'no', 'numero'})
+# Articles sans poids dans la comparaison des noms de voie
+STREET_STOPWORDS = frozenset({'de', 'du', 'des', 'la', 'le', 'les', 'l', 'd', 'et', 'a', 'au', 'aux'})
+
+
+def normalize_address(address):
+    """Clé normalisée d'une adresse (None si l'adresse est absente)"""
+    if address is None:
+        return None
+    text = unicodedata.normalize('NFKD', address.strip().casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.replace(',', ' ').split())
+
+
+def department_code(address):
+    """
+    Département déduit du code postal de l'adresse (« 75 », « 2A », « 974 »),
+    chaîne vide s'il n'y a pas de code postal
+    """
+    matches = _POSTAL_CODE.findall(address or '')
+    if not matches:
+        return ''
+    postal_code = matches[-1]
+    if postal_code.startswith(('97', '98')):
+        return postal_code[:3]
+    if postal_code.startswith('20'):
+        return '2A' if postal_code < '20200' else '2B'
+    return postal_code[:2]
+
+
+def canonical_address(address):
+    """Clé canonique d'une adresse pour la détection des doublons (None si absente)"""
+    text = normalize_address(address)
+    if text is None:
+        return None
+    words = _PUNCTUATION.sub(' ', text).replace('°', ' ').split()
+    tokens = []
+    position = 0
+    while position < len(words):
+        word = words[position]
+        following = words[position + 1] if position + 1 < len(words) else None
+        # « apt 12 », « bat B », et « 3e étage » où l'ordinal précède le mot
+        if word in UNIT_DESIGNATORS or (_ORDINAL.match(word) and following in UNIT_DESIGNATORS):
+            position += 2
+            continue
+        if word not in IGNORED_WORDS:
+            tokens.append(ABBREVIATIONS.get(word, word))
+        position += 1
+    return ' '.join(tokens)
+
+
+def street_name(canonical):
+    """
+    Nom de voie d'une clé canonique, comparé à l'intérieur d'un bloc : sans
+    numéro, articles, code postal ni ville (qui suivent le code postal)
+    """
+    words = []
+    for token in canonical.split():
+        if _POSTAL_CODE.fullmatch(token):
+            break
+        if not _HOUSE_NUMBER.match(token) and token not in STREET_STOPWORDS:
+            words.append(token)
+    return ' '.join(words)
+
+
+def address_block_key(address):
+    """
+    Bloc de comparaison approchée : « code postal:numéro », None s'il
+    manque l'un des deux (le bloc serait alors une ville ou une rue entière)
+    """
+    canonical = canonical_address(address)
+    if not canonical:
+        return None
+    tokens = canonical.split()
+    postal_codes = [token for token in tokens if _POSTAL_CODE.fullmatch(token)]
+    numbers = [match.group(1) for match in map(_HOUSE_NUMBER.match, tokens) if match]
+    if not postal_codes or not numbers:
+        return None
+    return f'{postal_codes[-1]}:{numbers[0]}'
@@ -0,0 +1,90 @@
+"""
+Cellules géographiques (courbe de Morton) pour l'indexation spatiale.
+
+Latitude et longitude sont quantifiées sur CELL_BITS bits chacune puis
+entrelacées en un entier unique (``geo_cell``), indexé par un B-tree
+ordinaire. Deux points proches partagent en général un long préfixe : une
+zone de recherche est couverte par quelques cellules d'un niveau plus
+grossier, chacune correspondant à un intervalle contigu de ``geo_cell``.
+À 26 bits, une cellule fait environ 0,3 m × 0,6 m ; le code tient sur
+52 bits (INTEGER SQLite, BIGINT PostgreSQL).
+
+La couverture ne gère pas les zones qui traversent l'antiméridien.
+"""
+import math
+
+CELL_BITS = 26
+EARTH_RADIUS_M = 6371008.8
+_CELL_MAX = (1 << CELL_BITS) - 1
+
+
+def _spread(value):
+    """Insère un bit nul entre chaque bit d'un entier de 32 bits"""
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+
+def _interleave(x, y):
+    return _spread(x) | (_spread(y) << 1)
+
+
+def _quantize(lat, lng):
+    x = int((lng + 180.0) / 360.0 * (1 << CELL_BITS))
+    y = int((lat + 90.0) / 180.0 * (1 << CELL_BITS))
+    return min(max(x, 0), _CELL_MAX), min(max(y, 0), _CELL_MAX)
+
+
+def encode_cell(lat, lng):
+    """Cellule de pleine précision d'un point (None si une coordonnée manque)"""
+    if lat is None or lng is None:
+        return None
+    return _interleave(*_quantize(float(lat), float(lng)))
+
+
+def cell_ranges(south, west, north, east, max_cells=16):
+    """
+    Intervalles [début, fin] de ``geo_cell`` couvrant une boîte englobante.
+    Le niveau est le plus fin pour lequel au plus ``max_cells`` cellules
+    suffisent ; les intervalles adjacents sont fusionnés.
+    """
+    x0, y0 = _quantize(south, west)
+    x1, y1 = _quantize(north, east)
+    shift = 0
+    while ((x1 >> shift) - (x0 >> shift) + 1) * ((y1 >> shift) - (y0 >> shift) + 1) > max_cells:
+        shift += 1
+    starts = sorted(
+        _interleave(cx, cy)
+        for cx in range(x0 >> shift, (x1 >> shift) + 1)
+        for cy in range(y0 >> shift, (y1 >> shift) + 1)
+    )
+    span = 1 << (2 * shift)
+    ranges = []
+    for start in starts:
+        low, high = start * span, (start + 1) * span - 1
+        if ranges and ranges[-1][1] + 1 == low:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    return [tuple(item) for item in ranges]
+
+
+def bbox_around(lat, lng, radius_m):
+    """Boîte (sud, ouest, nord, est) contenant le cercle de rayon radius_m"""
+    delta_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    delta_lng = min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return max(lat - delta_lat, -90.0), max(lng - delta_lng, -180.0), min(lat + delta_lat, 90.0), min(lng + delta_lng, 180.0)
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Distance en mètres sur la sphère terrestre"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
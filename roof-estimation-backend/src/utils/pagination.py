@@ -0,0 +1,272 @@
+"""
+Pagination par curseur (keyset) et streaming NDJSON pour les endpoints de liste.
+
+Les lignes sont lues par projection de colonnes (pas d'hydratation ORM) et
+parcourues par tranches ordonnées sur (colonne de tri, id), par défaut
+(timestamp DESC, id DESC), ce qui garde la mémoire constante quelle que
+soit la taille de la table.
+
+Les filtres d'égalité déclarés par le modèle (``__list_filters__``) et le
+tri ne sont acceptés que si un index du modèle commence exactement par les
+colonnes filtrées suivies de (colonne de tri, id) : toute requête de liste
+est une recherche d'index, jamais un parcours complet de la table (voir
+tests/test_query_plans.py).
+"""
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select, tuple_
+from src.models.user import db
+from src.utils.serializer import json_response, public_fields, row_serializer
+from datetime import datetime
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_SORT = '-timestamp'
+# Colonnes de tri possibles (préfixe « - » : ordre décroissant)
+SORT_COLUMNS = ('timestamp', 'last_updated')
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """Paramètre de pagination invalide (renvoyé en 400 par les routes)"""
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode la position (valeur de tri, id) de la dernière ligne servie"""
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Décode un curseur produit par encode_cursor"""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.fromisoformat(timestamp) if timestamp else None), row_id
+    except (ValueError, TypeError):
+        raise PaginationError('Curseur invalide')
+
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError(f'Date ISO 8601 attendue: {value}')
+
+
+def _format_datetime(value):
+    return value.isoformat() if value else None
+
+
+# Conversions appliquées colonne par colonne pour rester identique à to_dict()
+COLUMN_FORMATTERS = {
+    'timestamp': _format_datetime,
+    'last_updated': _format_datetime,
+}
+
+
+class KeysetQuery:
+    """Requête de liste paginée par (colonne de tri, id) sur un modèle"""
+
+    def __init__(self, model, fields=None, cursor=None, filters=None, sort=DEFAULT_SORT):
+        self.model = model
+        self.table = model.__table__
+        self.descending = sort.startswith('-')
+        sort_name = sort.lstrip('-')
+        if sort_name not in SORT_COLUMNS or sort_name not in self.table.c:
+            raise PaginationError(f'Tri non supporté: {sort}')
+        self.sort_column = self.table.c[sort_name]
+        # Champs composés déclarés par le modèle : {nom: (colonnes sources, méthode de décodage[, JSON direct])}
+        self.composites = getattr(model, '__list_columns__', {})
+        self.fields = self._parse_fields(fields)
+        self.position = decode_cursor(cursor) if cursor else None
+        self.filters = list(filters or [])
+        self._readers = [self._reader(name) for name in self.fields]
+        # Plan compilé pour encoder les lignes directement en JSON (voir src/utils/serializer.py)
+        self.serializer = row_serializer(model, tuple(self.fields))
+
+    def _parse_fields(self, fields):
+        # Colonnes internes et sources des champs composés ne sont pas exposées telles quelles
+        available = list(public_fields(self.model))
+        if not fields:
+            return available
+        requested = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise PaginationError(f'Champs inconnus: {", ".join(unknown)}')
+        return requested
+
+    def _reader(self, name):
+        """(nom, colonnes lues, conversion des valeurs) pour un champ demandé"""
+        if name in self.composites:
+            columns, decoder = self.composites[name][:2]
+            return name, [self.table.c[column] for column in columns], getattr(self.model, decoder)
+        formatter = COLUMN_FORMATTERS.get(name)
+        return name, [self.table.c[name]], (lambda value: value) if formatter is None else formatter
+
+    def _statement(self, position, limit):
+        sort_col = self.sort_column
+        id_col = self.table.c.id
+        # La colonne de tri et id sont toujours lus : ils servent à construire le curseur
+        columns = [sort_col, id_col] + self.projection
+        if self.descending:
+            order = (sort_col.desc(), id_col.desc())
+        else:
+            order = (sort_col.asc(), id_col.asc())
+        statement = select(*columns).order_by(*order).limit(limit)
+        conditions = list(self.filters)
+        if position is not None:
+            # Comparaison de tuples : recherche d'index directe, là où la forme
+            # « a < x OR (a = x AND id < y) » finit en double recherche et tri temporaire
+            value, row_id = position
+            if self.descending:
+                conditions.append(tuple_(sort_col, id_col) < tuple_(value, row_id))
+            else:
+                conditions.append(tuple_(sort_col, id_col) > tuple_(value, row_id))
+        if conditions:
+            statement = statement.where(*conditions)
+        return statement
+
+    @property
+    def projection(self):
+        """Colonnes lues pour les champs demandés, dans l'ordre attendu par row_to_dict"""
+        return [column for _, sources, _ in self._readers for column in sources]
+
+    def row_to_dict(self, row, offset=2):
+        """Élément de réponse à partir d'une ligne dont la projection commence à ``offset``"""
+        item = {}
+        for name, sources, convert in self._readers:
+            item[name] = convert(*row[offset:offset + len(sources)])
+            offset += len(sources)
+        return item
+
+    def row_to_json(self, row, offset=2):
+        """Texte JSON de l'élément, sans passer par un dictionnaire"""
+        return self.serializer.encode(row, offset)
+
+    def fetch_rows(self, limit, position=None):
+        """Retourne (lignes, position de la dernière ligne ou None si fin)"""
+        position = position if position is not None else self.position
+        rows = db.session.execute(self._statement(position, limit)).all()
+        last = (rows[-1][0], rows[-1][1]) if len(rows) == limit else None
+        return rows, last
+
+    def fetch_page(self, limit, position=None):
+        """Retourne (éléments, position de la dernière ligne ou None si fin)"""
+        rows, last = self.fetch_rows(limit, position)
+        return [self.row_to_dict(row) for row in rows], last
+
+    def iter_chunks(self, chunk_size=STREAM_CHUNK_SIZE, max_rows=None):
+        """Parcourt toutes les lignes à partir du curseur, par tranches bornées"""
+        position = self.position
+        remaining = max_rows
+        while True:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            if size <= 0:
+                return
+            rows, position = self.fetch_rows(size, position)
+            if rows:
+                yield rows
+            if remaining is not None:
+                remaining -= len(rows)
+            if position is None:
+                return
+
+
+def _parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit doit être un entier')
+    if limit < 1:
+        raise PaginationError('limit doit être positif')
+    return min(limit, maximum) if maximum else limit
+
+
+def _stream_json_array(query):
+    # Une écriture par tranche de lignes, pas par élément
+    separator = '['
+    for rows in query.iter_chunks():
+        yield separator + ','.join(query.row_to_json(row) for row in rows)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+def _stream_ndjson(query, max_rows):
+    for rows in query.iter_chunks(max_rows=max_rows):
+        yield ''.join(query.row_to_json(row) + '\n' for row in rows)
+
+
+def covering_index(table, equality_columns, sort_name):
+    """Index commençant par les colonnes filtrées (dans un ordre quelconque) puis (tri, id), ou None"""
+    count = len(equality_columns)
+    for index in table.indexes:
+        names = [column.name for column in index.columns]
+        if set(names[:count]) == set(equality_columns) and names[count:count + 2] == [sort_name, 'id']:
+            return index
+    return None
+
+
+def list_filters(model, args, sort=DEFAULT_SORT):
+    """
+    Conditions SQL des paramètres de filtre : égalités déclarées par le
+    modèle (``__list_filters__``) et bornes ``since`` / ``until`` sur la
+    colonne de tri. Refuse les combinaisons qu'aucun index ne couvre.
+    """
+    table = model.__table__
+    sort_name = sort.lstrip('-')
+    if sort_name not in SORT_COLUMNS or sort_name not in table.c:
+        raise PaginationError(f'Tri non supporté: {sort}')
+    conditions, columns = [], []
+    for param, (column_name, convert) in getattr(model, '__list_filters__', {}).items():
+        if param in args:
+            try:
+                value = convert(args[param])
+            except ValueError as e:
+                raise PaginationError(str(e))
+            conditions.append(table.c[column_name] == value)
+            columns.append(column_name)
+    if 'since' in args:
+        conditions.append(table.c[sort_name] >= parse_datetime(args['since']))
+    if 'until' in args:
+        conditions.append(table.c[sort_name] < parse_datetime(args['until']))
+    if covering_index(table, columns, sort_name) is None:
+        raise PaginationError(f'Filtres non indexés pour le tri {sort_name}: {", ".join(columns) or "aucun"}')
+    return conditions
+
+
+def list_response(model, args, filters=None):
+    """
+    Construit la réponse d'un endpoint de liste à partir des paramètres :
+
+    - sans paramètre : tableau JSON complet, émis en streaming par tranches ;
+    - ``limit`` / ``cursor`` : une page ``{'items', 'next_cursor', 'limit'}`` ;
+    - ``format=ndjson`` : une ligne JSON par élément, en streaming ;
+    - ``fields=a,b,c`` : projection sur les colonnes demandées ;
+    - ``sort=[-]colonne`` : tri (``-timestamp`` par défaut, voir SORT_COLUMNS) ;
+    - filtres déclarés par le modèle, ``since`` / ``until`` sur la colonne de tri.
+    """
+    sort = args.get('sort', DEFAULT_SORT)
+    query = KeysetQuery(model, fields=args.get('fields'), cursor=args.get('cursor'),
+                        filters=list(filters or []) + list_filters(model, args, sort), sort=sort)
+    output_format = args.get('format', 'json')
+
+    if output_format == 'ndjson':
+        max_rows = _parse_limit(args['limit'], maximum=None) if 'limit' in args else None
+        return Response(stream_with_context(_stream_ndjson(query, max_rows)),
+                        mimetype='application/x-ndjson')
+    if output_format != 'json':
+        raise PaginationError(f'Format non supporté: {output_format}')
+
+    if 'limit' in args or 'cursor' in args:
+        limit = _parse_limit(args.get('limit'))
+        rows, last = query.fetch_rows(limit)
+        next_cursor = encode_cursor(*last) if last else None
+        return json_response(
+            '{"items":[' + ','.join(query.row_to_json(row) for row in rows) + '],'
+            f'"next_cursor":{current_app.json.dumps(next_cursor)},"limit":{limit}}}'
+        )
+
+    return Response(stream_with_context(_stream_json_array(query)), mimetype='application/json')
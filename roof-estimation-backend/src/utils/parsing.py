@@ -0,0 +1,15 @@
+"""
+Conversion des valeurs textuelles reçues, indépendante des routes et des
+modèles. Une valeur invalide lève ValueError : à l'appelant de la traduire
+en erreur de son domaine (voir list_filters dans src/utils/pagination.py).
+"""
+
+
+def parse_bool(value):
+    """Valeur booléenne d'un texte (1/0, true/false, yes/no, oui/non)"""
+    lowered = value.strip().lower()
+    if lowered in ('1', 'true', 'yes', 'oui'):
+        return True
+    if lowered in ('0', 'false', 'no', 'non'):
+        return False
+    raise ValueError(f'Booléen attendu: {value}')
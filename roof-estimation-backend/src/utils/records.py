@@ -0,0 +1,42 @@
+"""Lecture d'enregistrements depuis un flux d'entrée (corps de requête ou fichier)"""
+import csv
+import io
+import json
+
+# Format d'entrée selon le Content-Type (surchargeable par le paramètre ``format``)
+INPUT_FORMATS = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'text/csv': 'csv'
+}
+
+
+def iter_records(stream, input_format):
+    """
+    Enregistrements d'un flux binaire, lus au fil de l'eau pour ``csv`` et
+    ``ndjson`` (une ligne illisible produit None) ; ``json`` attend une liste
+    ou ``{'items': [...]}``, lue dès l'appel : un corps invalide lève
+    ValueError avant que la réponse ne commence.
+    """
+    if input_format == 'json':
+        payload = json.load(stream)
+        records = payload.get('items', []) if isinstance(payload, dict) else payload
+        if not isinstance(records, list):
+            raise ValueError('Le corps JSON doit être une liste ou {"items": [...]}')
+        return iter(records)
+    if input_format not in ('ndjson', 'csv'):
+        raise ValueError(f'Format non supporté: {input_format}')
+    return _iter_text(stream, input_format)
+
+
+def _iter_text(stream, input_format):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if input_format == 'ndjson':
+        for line in text:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+    else:
+        yield from csv.DictReader(text)
@@ -0,0 +1,118 @@
+"""
+Sérialisation JSON compilée des lignes de modèle.
+
+Pour un modèle et une liste de champs, un RowSerializer génère une fois
+une fonction d'encodage : pour chaque champ, le préfixe ``"nom":`` déjà
+encodé et l'encodage correspondant au type de la colonne (chaîne, nombre,
+booléen, date). Une ligne SQL est ensuite transformée directement en texte
+JSON, sans dictionnaire intermédiaire ni passage par l'encodeur générique.
+
+Les champs composés (``__list_columns__``) peuvent déclarer en troisième
+élément une méthode qui produit leur JSON directement à partir des
+colonnes brutes : conversation_data, stocké en JSON, est ainsi inséré tel
+quel, sans décodage ni réencodage.
+
+Le JSON produit est sémantiquement identique à celui de ``to_dict()`` +
+jsonify (mêmes clés et valeurs ; ordre des clés et espaces diffèrent).
+"""
+from flask import Response, json as flask_json
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
+
+SERIALIZER_CACHE_SIZE = 256  # plans compilés gardés (modèle, champs)
+
+
+# Expression d'encodage de la valeur ``v`` selon le type de colonne (code généré)
+_EXPRESSIONS = (
+    (Boolean, "('true' if {v} else 'false')"),
+    (Integer, 'repr({v})'),
+    # v - v vaut 0 sauf pour NaN et ±inf, encodés comme le fait l'encodeur JSON
+    (Float, "(repr({v}) if {v} - {v} == 0 else dumps({v}))"),
+    (DateTime, "'\"' + {v}.isoformat() + '\"'"),
+    (String, 'string({v})'),
+    (Text, 'string({v})'),
+)
+
+
+def column_expression(column, variable):
+    """Expression Python qui encode en JSON la valeur d'une colonne contenue dans ``variable``"""
+    for column_type, expression in _EXPRESSIONS:
+        if isinstance(column.type, column_type):
+            return f"('null' if {variable} is None else {expression.format(v=variable)})"
+    return f'dumps({variable})'
+
+
+class RowSerializer:
+    """
+    Plan de sérialisation d'un modèle pour une liste de champs, compilé en
+    une fonction Python générée (comme le plan de tarification) : préfixes
+    des clés en littéraux, encodeur de chaque colonne déroulé en ligne.
+    """
+
+    def __init__(self, model, fields):
+        table = model.__table__
+        composites = getattr(model, '__list_columns__', {})
+        self.fields = tuple(fields)
+        self.sources = []
+        namespace = {'string': encode_basestring_ascii, 'dumps': flask_json.dumps}
+        parts = []
+        for position, name in enumerate(self.fields):
+            key = (',' if position else '') + encode_basestring_ascii(name) + ':'
+            parts.append(repr(key))
+            first = len(self.sources)
+            if name in composites:
+                spec = composites[name]
+                columns = spec[0]
+                if len(spec) > 2:
+                    namespace[f'field_{position}'] = getattr(model, spec[2])
+                else:
+                    decode = getattr(model, spec[1])
+                    namespace[f'field_{position}'] = lambda *values, decode=decode: flask_json.dumps(decode(*values))
+                self.sources.extend(columns)
+                arguments = ', '.join(f'v{index}' for index in range(first, len(self.sources)))
+                parts.append(f'field_{position}({arguments})')
+            else:
+                self.sources.append(name)
+                parts.append(column_expression(table.c[name], f'v{first}'))
+
+        width = len(self.sources)
+        variables = ''.join(f'v{index}, ' for index in range(width))
+        lines = ['def encode(row, offset=0):']
+        if width:
+            lines.append(f'    {variables}= row[offset:offset + {width}]')
+        lines.append(f"    return ''.join(({repr('{')}, {''.join(part + ', ' for part in parts)}{repr('}')}))")
+        exec(compile('\n'.join(lines) + '\n', f'<serializer {model.__name__}>', 'exec'), namespace)
+        # encode(ligne, offset=0) : texte JSON d'une ligne dont les colonnes sources commencent à offset
+        self.encode = namespace['encode']
+
+    def encode_instance(self, instance):
+        """Texte JSON d'une instance du modèle (mêmes champs)"""
+        return self.encode([getattr(instance, name) for name in self.sources])
+
+
+@lru_cache(maxsize=SERIALIZER_CACHE_SIZE)
+def row_serializer(model, fields):
+    """Plan compilé, partagé entre les requêtes, pour (modèle, tuple de champs)"""
+    return RowSerializer(model, fields)
+
+
+def public_fields(model):
+    """Champs exposés par défaut : colonnes non internes, sources des champs composés remplacées"""
+    composites = getattr(model, '__list_columns__', {})
+    hidden = {name for spec in composites.values() for name in spec[0]} - set(composites)
+    return tuple(
+        column.name for column in model.__table__.columns
+        if column.name not in hidden and not column.info.get('internal')
+    )
+
+
+def json_response(text, status=200):
+    """Réponse HTTP d'un texte JSON déjà encodé"""
+    return Response(text + '\n', status=status, mimetype='application/json')
+
+
+def instance_response(instance, status=200):
+    """Réponse JSON d'une instance de modèle, avec les champs de to_dict()"""
+    model = type(instance)
+    return json_response(row_serializer(model, public_fields(model)).encode_instance(instance), status)
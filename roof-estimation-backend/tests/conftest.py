@@ -0,0 +1,36 @@
+"""
+Configuration commune des tests : base SQLite temporaire migrée, aucun
+thread de fond (file de tâches, maintenance) et aucun appel aux API Google.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+# Avant tout import de src : la configuration est lue dans l'environnement à l'import
+_directory = tempfile.mkdtemp(prefix='roof-tests-')
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_directory, "test.db")}'
+os.environ['GOOGLE_API_KEY'] = ''
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('MAINTENANCE_INTERVAL', '0')
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Application avec tous ses blueprints, sur le schéma migré"""
+    from src.main import create_app
+    from src.models.database import migrate
+
+    app = create_app({'LAZY_BLUEPRINTS': False, 'TESTING': True})
+    with app.app_context():
+        migrate()
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
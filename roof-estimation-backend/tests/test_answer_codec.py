@@ -0,0 +1,78 @@
+"""
+Encodage binaire des réponses (src/services/answer_codec.py) tel que le
+modèle ConversationSession l'utilise : aller-retour encodage → décodage →
+JSON, repli en JSON des réponses non encodables, indépendance vis-à-vis du
+blueprint conversation.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.models.conversation import ConversationSession
+from src.utils.pagination import PaginationError, list_filters
+
+ENCODABLE = [
+    {},
+    {'roof_type': 'ardoise'},
+    {'roof_type': 'zinc', 'roof_condition': 'usee', 'roof_elements': []},
+    {'roof_type': 'tuiles_beton', 'roof_condition': 'neuve', 'roof_elements': ['cheminee', 'antenne'],
+     'roof_access': 'difficile', 'material_preference': 'ecologique', 'insulation': 'pas_sur'},
+    {'roof_elements': ['cheminee', 'lucarne', 'fenetre_toit', 'panneaux_solaires', 'antenne', 'aucun']},
+]
+
+NOT_ENCODABLE = [
+    {'roof_type': 'chaume'},
+    {'roof_elements': ['antenne', 'cheminee']},
+    {'roof_condition': 'usee', 'roof_type': 'zinc'},
+    {'roof_type': 'zinc', 'commentaire': 'libre'},
+    {'roof_elements': 'cheminee'},
+]
+
+
+@pytest.mark.parametrize('answers', ENCODABLE)
+def test_round_trip(answers):
+    conversation_data, packed = ConversationSession.encode_conversation_data(answers)
+    assert conversation_data is None
+    assert isinstance(packed, bytes)
+    decoded = ConversationSession.decode_conversation_data(None, packed)
+    assert decoded == answers
+    assert list(decoded) == list(answers)
+    assert ConversationSession.conversation_data_json(None, packed) == json.dumps(answers)
+
+
+@pytest.mark.parametrize('answers', NOT_ENCODABLE)
+def test_unencodable_answers_are_stored_as_json(answers):
+    conversation_data, packed = ConversationSession.encode_conversation_data(answers)
+    assert packed is None
+    assert ConversationSession.decode_conversation_data(conversation_data, None) == answers
+    assert ConversationSession.conversation_data_json(conversation_data, None) == json.dumps(answers)
+
+
+def test_session_to_dict_decodes_packed_answers():
+    answers = ENCODABLE[3]
+    session = ConversationSession(id='s1', address='1 rue de Rivoli, Paris')
+    session.set_conversation_data(answers)
+    assert session.conversation_answers is not None
+    assert session.to_dict()['conversation_data'] == answers
+
+
+def test_codec_available_without_conversation_blueprint():
+    """Le décodage ne dépend pas de l'import de src.routes.conversation"""
+    script = '\n'.join([
+        'import sys',
+        'from src.models.conversation import ConversationSession',
+        'answers = {"roof_type": "ardoise", "roof_elements": ["lucarne"]}',
+        '_, packed = ConversationSession.encode_conversation_data(answers)',
+        'assert ConversationSession.decode_conversation_data(None, packed) == answers',
+        'assert "src.routes.conversation" not in sys.modules',
+    ])
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+
+def test_invalid_boolean_filter_is_a_pagination_error():
+    with pytest.raises(PaginationError, match='Booléen attendu'):
+        list_filters(ConversationSession, {'is_completed': 'peut-être'})
+    assert list_filters(ConversationSession, {'is_completed': 'oui'})
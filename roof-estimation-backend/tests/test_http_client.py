@@ -0,0 +1,233 @@
+"""
+Client HTTP amont (src/services/http_client.py) contre un serveur local
+scripté : retries sur 429/5xx, Retry-After, disjoncteur et pool keep-alive.
+"""
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.services.async_http_client import AsyncUpstreamClient
+from src.services.http_client import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError, retry_after
+
+
+class StubServer:
+    """Serveur HTTP/1.1 keep-alive qui rejoue une suite de réponses (statut, en-têtes, corps)"""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    stub.connections.add(self.client_address)
+                    status, headers, body = stub.responses.pop(0) if stub.responses else (200, {}, b'{}')
+                if body is None:
+                    # Réponse tronquée : corps annoncé mais connexion coupée
+                    self.send_response(status)
+                    self.send_header('Content-Length', '100')
+                    self.end_headers()
+                    self.wfile.write(b'{"par')
+                    self.close_connection = True
+                    return
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def reply(self, *responses):
+        """Réponses suivantes : statuts ou tuples (statut, en-têtes[, corps])"""
+        for response in responses:
+            if isinstance(response, int):
+                response = (response, {})
+            status, headers, *body = response
+            self.responses.append((status, headers, body[0] if body else b'{}'))
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def make_client(**options):
+    options.setdefault('max_retries', 2)
+    options.setdefault('backoff_base', 0.001)
+    options.setdefault('backoff_max', 0.01)
+    options.setdefault('read_timeout', 2)
+    return UpstreamClient('stub', **options)
+
+
+def test_retries_server_errors_then_returns_response(stub):
+    stub.reply(503, 500, 200)
+    client = make_client()
+    assert client.get(stub.url).status_code == 200
+    assert stub.requests == 3
+    assert client.stats.retries == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.reply(404)
+    client = make_client()
+    assert client.get(stub.url).status_code == 404
+    assert stub.requests == 1
+
+
+def test_exhausted_retries_raise(stub):
+    stub.reply(502, 502, 502)
+    client = make_client()
+    with pytest.raises(UpstreamError, match='HTTP 502'):
+        client.get(stub.url)
+    assert stub.requests == 3
+
+
+def test_truncated_response_is_retried(stub):
+    stub.reply((200, {}, None), 200)
+    client = make_client()
+    assert client.get(stub.url).status_code == 200
+    assert stub.requests == 2
+
+
+def test_jitter_stays_within_bounds():
+    client = make_client(backoff_base=0.1, backoff_max=0.3)
+    delays = [client.backoff(attempt) for attempt in range(5) for _ in range(50)]
+    assert all(0 <= delay <= 0.3 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_is_honored(stub):
+    stub.reply((429, {'Retry-After': '0.3'}), 200)
+    client = make_client(backoff_max=1.0)
+    started = time.monotonic()
+    assert client.get(stub.url).status_code == 200
+    assert time.monotonic() - started >= 0.3
+
+
+def test_retry_after_is_capped_by_max_backoff(stub):
+    stub.reply((503, {'Retry-After': '120'}), 200)
+    client = make_client(backoff_max=0.05)
+    started = time.monotonic()
+    assert client.get(stub.url).status_code == 200
+    assert time.monotonic() - started < 1
+
+
+def test_retry_after_formats():
+    assert retry_after('3') == 3.0
+    assert retry_after('-1') == 0.0
+    assert retry_after(None) is None
+    assert retry_after('bientôt') is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= retry_after(later) <= 30
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+    assert retry_after(earlier) == 0.0
+
+
+def test_breaker_opens_after_consecutive_failures(stub):
+    stub.reply(500, 500)
+    client = make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            client.get(stub.url)
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get(stub.url)
+    assert stub.requests == 2
+    assert client.stats.rejected == 1
+
+
+def test_breaker_recovers_after_successful_probe(stub):
+    stub.reply(500, 200)
+    client = make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    with pytest.raises(UpstreamError):
+        client.get(stub.url)
+    with pytest.raises(CircuitOpenError):
+        client.get(stub.url)
+    time.sleep(0.15)
+    assert client.get(stub.url).status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert client.get(stub.url).status_code == 200
+
+
+def test_failed_probe_reopens_breaker(stub):
+    stub.reply(500, (200, {}, None))
+    client = make_client(max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    with pytest.raises(UpstreamError):
+        client.get(stub.url)
+    time.sleep(0.15)
+    with pytest.raises(UpstreamError):
+        client.get(stub.url)
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get(stub.url)
+
+
+def test_unreachable_upstream_counts_as_failure():
+    server = StubServer()
+    url = server.url
+    server.server.server_close()
+    client = make_client(max_retries=1, connect_timeout=0.5,
+                         breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    with pytest.raises(UpstreamError, match='ConnectionError'):
+        client.get(url)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_connections_are_reused(stub):
+    client = make_client()
+    for _ in range(5):
+        assert client.get(stub.url).status_code == 200
+    assert stub.requests == 5
+    assert len(stub.connections) == 1
+
+
+def test_async_client_shares_retry_policy_and_breaker(stub):
+    stub.reply((429, {'Retry-After': '0.2'}), 200, 500)
+    sync_client = make_client(max_retries=1, backoff_max=1.0,
+                              breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+
+    async def scenario():
+        client = AsyncUpstreamClient(sync_client)
+        try:
+            started = time.monotonic()
+            response = await client.get(stub.url)
+            waited = time.monotonic() - started
+            stub.reply(500)
+            with pytest.raises(UpstreamError):
+                await client.get(stub.url)
+            with pytest.raises(CircuitOpenError):
+                await client.get(stub.url)
+            return response.status_code, waited
+        finally:
+            await client.aclose()
+
+    status, waited = asyncio.run(scenario())
+    assert status == 200
+    assert waited >= 0.2
+    assert sync_client.breaker.state == CircuitBreaker.OPEN
+    assert sync_client.stats.retries == 2
@@ -0,0 +1,89 @@
+"""
+Purge des sessions abandonnées (src/services/maintenance.py) : seules les
+lignes réellement supprimées sont archivées, une session reprise entre la
+sélection et la suppression est gardée.
+"""
+from datetime import datetime, timedelta
+import gzip
+import json
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from src.models.conversation import ConversationSession
+from src.models.user import db
+from src.services.maintenance import SessionMaintenance
+
+_table = ConversationSession.__table__
+NOW = datetime(2021, 1, 1)
+
+
+def insert_sessions(count, last_updated, is_completed=False):
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    with db.engine.begin() as connection:
+        connection.execute(_table.insert(), [{
+            'id': session_id, 'address': '1 rue de Rivoli, Paris', 'is_completed': is_completed,
+            'conversation_data': '{}', 'timestamp': last_updated, 'last_updated': last_updated,
+        } for session_id in ids])
+    return ids
+
+
+def existing(ids):
+    with db.engine.connect() as connection:
+        return set(connection.scalars(select(_table.c.id).where(_table.c.id.in_(ids))))
+
+
+def archived(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line)['id'] for line in archive]
+
+
+@pytest.fixture(params=[True, False], ids=['returning', 'sans-returning'])
+def maintenance(request, app_context, tmp_path, monkeypatch):
+    monkeypatch.setattr(db.engine.dialect, 'delete_returning', request.param)
+    return SessionMaintenance(ttl=0, interval=0, batch_size=2, batch_pause=0, archive_dir=str(tmp_path))
+
+
+def test_expired_sessions_are_purged_and_archived(maintenance):
+    expired = insert_sessions(3, NOW - timedelta(days=40))
+    completed = insert_sessions(1, NOW - timedelta(days=40), is_completed=True)
+    recent = insert_sessions(1, NOW + timedelta(days=1))
+    report = maintenance.run(now=NOW)
+    assert report['rows_purged'] == 3
+    assert report['batches'] == 2
+    assert existing(expired + completed + recent) == set(completed + recent)
+    assert sorted(archived(report['archive'])) == sorted(expired)
+
+
+def test_session_resumed_after_selection_is_kept_and_not_archived(maintenance, monkeypatch):
+    expired = insert_sessions(1, NOW - timedelta(days=40))
+    resumed = insert_sessions(1, NOW - timedelta(days=40))
+    select_ids = maintenance._expired_ids
+
+    def select_then_resume(cutoff):
+        ids = select_ids(cutoff)
+        # Réponse reçue entre la sélection du lot et sa suppression
+        with db.engine.begin() as connection:
+            connection.execute(_table.update().where(_table.c.id.in_(resumed)).values(last_updated=NOW))
+        return ids
+
+    monkeypatch.setattr(maintenance, '_expired_ids', select_then_resume)
+    report = maintenance.run(now=NOW)
+    assert report['rows_purged'] == 1
+    assert existing(expired + resumed) == set(resumed)
+    assert archived(report['archive']) == expired
+
+
+def test_archive_failure_rolls_back_the_delete(maintenance, monkeypatch):
+    expired = insert_sessions(2, NOW - timedelta(days=40))
+
+    def failing_archive(archive, rows):
+        raise OSError('disque plein')
+
+    monkeypatch.setattr(maintenance, '_archive', failing_archive)
+    with pytest.raises(OSError):
+        maintenance.run(now=NOW)
+    assert existing(expired) == set(expired)
+    with db.engine.begin() as connection:
+        connection.execute(_table.delete().where(_table.c.id.in_(expired)))
@@ -0,0 +1,107 @@
+"""
+Plan de tarification compilé (src/services/pricing.py) : identique à
+l'évaluation interprétée sur tout l'espace des réponses, et rechargement à
+chaud des règles hors du chemin des estimations.
+"""
+import itertools
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from src.services.questions import CONVERSATION_QUESTIONS
+from src.services.pricing import PRICING_RULES_PATH, PricingEngine, load_plan
+
+MISSING = object()
+AREAS = (1.0, 87.5, 143.25)
+
+
+def answer_space(questions):
+    """
+    Toutes les combinaisons de réponses : chaque question à choix unique prend
+    une option, est absente ou inconnue ; les éléments de toiture parcourent
+    toutes les sous-listes d'options, plus absente et non-liste
+    """
+    singles, elements = [], []
+    for question_id, question in questions.items():
+        options = [option['value'] for option in question['options']]
+        if question['type'] == 'multiple_choice':
+            subsets = [list(subset) for count in range(len(options) + 1)
+                       for subset in itertools.combinations(options, count)]
+            elements.append((question_id, subsets + [MISSING, 'cheminee']))
+        else:
+            singles.append((question_id, options + [MISSING, 'inconnue']))
+    dimensions = singles + elements
+    for values in itertools.product(*(values for _, values in dimensions)):
+        yield {question_id: value for (question_id, _), value in zip(dimensions, values) if value is not MISSING}
+
+
+def test_compiled_plan_matches_generic_evaluation():
+    plan = load_plan(PRICING_RULES_PATH)
+    checked = 0
+    mismatches = []
+    for answers in answer_space(CONVERSATION_QUESTIONS):
+        # Surfaces alternées : chaque combinaison une fois, sans tripler la durée
+        area = AREAS[checked % len(AREAS)]
+        compiled, generic = plan.evaluate(answers, area), plan.evaluate_generic(answers, area)
+        if compiled != generic and len(mismatches) < 10:
+            mismatches.append((answers, area, compiled, generic))
+        checked += 1
+    assert checked == 8 * 6 * 5 * 7 * 6 * 66
+    assert not mismatches
+
+
+def test_unhashable_answers_fall_back_to_generic_evaluation():
+    plan = load_plan(PRICING_RULES_PATH)
+    answers = {'roof_type': ['ardoise'], 'roof_condition': {'etat': 'usee'}, 'roof_elements': 'cheminee'}
+    assert plan.evaluate(answers, 120.0) == plan.evaluate_generic(answers, 120.0)
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / 'pricing_rules.json'
+    shutil.copy(PRICING_RULES_PATH, path)
+    return path
+
+
+def bump_labor_cost(path, cost_per_hour):
+    rules = json.loads(path.read_text(encoding='utf-8'))
+    rules['labor']['cost_per_hour'] = cost_per_hour
+    path.write_text(json.dumps(rules), encoding='utf-8')
+    # Date de modification distincte même sur un système de fichiers à résolution grossière
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_estimate_uses_current_plan_without_reload_check(rules_path):
+    engine = PricingEngine(str(rules_path), check_interval=0)
+    before = engine.estimate({'roof_type': 'zinc'}, 100.0)
+    bump_labor_cost(rules_path, 80)
+    assert engine.estimate({'roof_type': 'zinc'}, 100.0) == before
+    assert engine.reload_if_changed()
+    assert engine.estimate({'roof_type': 'zinc'}, 100.0) > before
+    assert not engine.reload_if_changed()
+
+
+def test_watcher_reloads_changed_rules(rules_path):
+    engine = PricingEngine(str(rules_path), check_interval=0.05)
+    plan = engine.current()
+    engine.ensure_started()
+    bump_labor_cost(rules_path, 80)
+    deadline = time.monotonic() + 5
+    while engine.current() is plan and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert engine.current() is not plan
+    assert engine.current().cost_per_hour == 80
+
+
+def test_invalid_rules_keep_previous_plan(rules_path):
+    engine = PricingEngine(str(rules_path), check_interval=0)
+    plan = engine.current()
+    rules_path.write_text('{"labor": ', encoding='utf-8')
+    stat = os.stat(rules_path)
+    os.utime(rules_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not engine.reload_if_changed()
+    assert engine.current() is plan
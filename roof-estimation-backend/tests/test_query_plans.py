@@ -0,0 +1,129 @@
+"""
+Plans d'exécution des requêtes servies par les index (EXPLAIN QUERY PLAN, SQLite).
+
+Pour chaque combinaison de filtres et de tri acceptée par list_response
+(/leads, /sessions), avec et sans curseur, ainsi que pour les requêtes de
+doublons (src/services/duplicates.py) et de la file de tâches
+(src/services/jobs.py), le plan ne doit ni parcourir une table sans index
+ni trier dans un B-tree temporaire ; une requête filtrée doit de plus être
+une recherche d'index (SEARCH).
+"""
+from datetime import datetime
+import itertools
+
+import pytest
+
+from src.models.conversation import ConversationSession
+from src.models.lead import Lead
+from src.models.user import db
+from src.services import jobs
+from src.services.duplicates import MODES, keys_statement, members_statement
+from src.utils.pagination import SORT_COLUMNS, KeysetQuery, PaginationError, list_filters
+
+SAMPLE_VALUES = {
+    'email': 'client@example.com',
+    'phone': '0600000000',
+    'address': '1 rue de Rivoli, Paris',
+    'is_completed': 'false',
+    'since': '2024-01-01T00:00:00',
+    'until': '2025-01-01T00:00:00',
+}
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        params.append(value.isoformat(' ') if isinstance(value, datetime) else value)
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), tuple(params)).all()
+    return [row[-1] for row in rows]
+
+
+def plan_errors(table_name, details, filtered):
+    errors = []
+    for detail in details:
+        if detail.startswith('SCAN') and 'INDEX' not in detail:
+            errors.append(f'parcours complet: {detail}')
+        if 'TEMP B-TREE' in detail:
+            errors.append(f'tri temporaire: {detail}')
+    if filtered and not any(detail.startswith(f'SEARCH {table_name}') for detail in details):
+        errors.append('filtre sans recherche d\'index')
+    return errors
+
+
+def combinations(model):
+    """Paramètres (filtres, bornes, tri) de toutes les combinaisons possibles"""
+    filters = list(getattr(model, '__list_filters__', {}))
+    sorts = [name for name in SORT_COLUMNS if name in model.__table__.c]
+    for sort_name, descending in itertools.product(sorts, (True, False)):
+        for count in range(len(filters) + 1):
+            for selected in itertools.combinations(filters, count):
+                for bounds in ((), ('since',), ('since', 'until')):
+                    args = {name: SAMPLE_VALUES[name] for name in selected + bounds}
+                    args['sort'] = ('-' if descending else '') + sort_name
+                    yield args
+
+
+def check(statements):
+    """Erreurs de plan de (libellé, table, requête, filtrée) ; au moins une requête vérifiée"""
+    failures = []
+    checked = 0
+    with db.engine.connect() as connection:
+        for label, table_name, statement, filtered in statements:
+            details = explain(connection, statement)
+            errors = plan_errors(table_name, details, filtered)
+            checked += 1
+            if errors:
+                failures.append('\n    '.join([f'{table_name} {label}'] + details + errors))
+    assert checked, 'aucune requête vérifiée'
+    assert not failures, '\n'.join(failures)
+
+
+@pytest.mark.parametrize('model', [Lead, ConversationSession], ids=lambda model: model.__tablename__)
+def test_list_queries_use_indexes(app_context, model):
+    def statements():
+        for args in combinations(model):
+            try:
+                filters = list_filters(model, args, args['sort'])
+            except PaginationError:
+                continue  # combinaison refusée par l'API (400)
+            query = KeysetQuery(model, filters=filters, sort=args['sort'])
+            for position in (None, (datetime(2024, 6, 1), 1)):
+                filtered = len(args) > 1 or position is not None
+                yield f'{args} curseur={position is not None}', model.__tablename__, \
+                    query._statement(position, 100), filtered
+
+    check(statements())
+
+
+@pytest.mark.parametrize('model', [Lead, ConversationSession], ids=lambda model: model.__tablename__)
+def test_duplicate_queries_use_indexes(app_context, model):
+    table = model.__table__
+    projection = KeysetQuery(model).projection
+
+    def statements():
+        for mode in MODES:
+            yield f'grappes {mode}', model.__tablename__, keys_statement(table, mode), False
+            yield f'grappes {mode} curseur', model.__tablename__, keys_statement(table, mode, after='75002:1'), True
+            yield f'doublons {mode}', model.__tablename__, members_statement(table, mode, '75002:1', projection), True
+
+    check(statements())
+
+
+def test_job_queries_use_indexes(app_context):
+    now = datetime(2024, 6, 1)
+    check([
+        ('tâches disponibles', 'job', jobs.candidates_statement(['roof_analysis', 'geocode'], now), True),
+        ('dernière tâche d\'un sujet', 'job', jobs.latest_statement('roof_analysis', 'session'), True),
+        ('baux expirés', 'job', jobs.expired_leases_statement(now), True),
+        ('purge', 'job', jobs.purge_statement(now), True),
+    ])
+
+
+def test_full_scan_is_reported(app_context):
+    """Garde-fou : une requête sans index disponible est bien signalée"""
+    table = Lead.__table__
+    statement = table.select().where(table.c.client_name == 'Dupont')
+    with pytest.raises(AssertionError, match='parcours complet|filtre sans recherche'):
+        check([('client_name', 'lead', statement, True)])
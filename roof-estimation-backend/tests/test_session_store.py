@@ -0,0 +1,107 @@
+"""
+Écriture différée des sessions (src/services/session_store.py) : un état
+refusé par la base est mis de côté sans bloquer les autres, une base
+indisponible laisse les états à réécrire.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src.models.conversation import ConversationSession
+from src.models.user import db
+from src.services.session_store import SessionStore
+
+
+@pytest.fixture
+def store(app_context):
+    return SessionStore(write_behind=True, flush_interval=60, persist_on_complete=False)
+
+
+def new_state(store, session_id=None, answers=None):
+    session = ConversationSession(id=session_id or str(uuid.uuid4()), address='1 rue de Rivoli, Paris',
+                                  current_question_id='roof_type', is_completed=False)
+    session.set_conversation_data(answers or {'roof_type': 'ardoise'})
+    return store.add(session)
+
+
+def stored_ids(ids):
+    table = ConversationSession.__table__
+    with db.engine.connect() as connection:
+        return set(connection.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+
+
+def test_pending_states_are_written_in_one_flush(store):
+    states = [new_state(store) for _ in range(3)]
+    assert stored_ids([state.id for state in states]) == set()
+    assert store.flush() == 3
+    assert stored_ids([state.id for state in states]) == {state.id for state in states}
+    assert store.counters['flushes'] == 1
+    assert store.flush() == 0
+
+
+def test_rejected_row_is_quarantined_without_blocking_the_batch(store):
+    existing = new_state(store)
+    store.flush()
+    store.backend.pop(existing.id)
+    good = [new_state(store) for _ in range(2)]
+    duplicate = new_state(store, session_id=existing.id)
+    assert store.flush() == 2
+    assert stored_ids([state.id for state in good]) == {state.id for state in good}
+    assert store.counters['quarantined'] == 1
+    assert store.counters['flush_errors'] == 1
+    assert store.backend.get(duplicate.id) is None
+    # Plus rien à réécrire : l'état refusé n'est pas retenté à chaque passage
+    assert store.flush() == 0
+    assert store.counters['flush_errors'] == 1
+
+
+def test_rejected_update_is_quarantined(store):
+    state = new_state(store)
+    other = new_state(store)
+    store.flush()
+    state.address = None  # NOT NULL
+    store.save(state)
+    other.current_question_id = 'roof_condition'
+    store.save(other)
+    assert store.flush() == 1
+    assert store.backend.get(state.id) is None
+    assert store.get(state.id).address == '1 rue de Rivoli, Paris'
+    assert store.get(other.id).current_question_id == 'roof_condition'
+
+
+def test_unserializable_answers_are_quarantined(store):
+    state = new_state(store)
+    state.set_conversation_data({'roof_type': 'ardoise', 'notes': {1, 2}})
+    good = new_state(store)
+    assert store.flush() == 1
+    assert stored_ids([state.id, good.id]) == {good.id}
+    assert store.counters['quarantined'] == 1
+
+
+def test_explicit_flush_raises_rejected_row(store):
+    existing = new_state(store)
+    store.flush()
+    store.backend.pop(existing.id)
+    duplicate = new_state(store, session_id=existing.id)
+    with pytest.raises(IntegrityError):
+        store.flush([duplicate])
+    assert not duplicate.dirty
+    assert store.backend.get(duplicate.id) is None
+
+
+def test_unavailable_database_keeps_states_dirty(store, monkeypatch):
+    states = [new_state(store) for _ in range(2)]
+
+    def unavailable(rows):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(store, '_write', unavailable)
+    with pytest.raises(OperationalError):
+        store.flush()
+    assert all(state.dirty for state in states)
+    assert store.counters['quarantined'] == 0
+    monkeypatch.undo()
+    assert store.flush() == 2
+